@@ -3,6 +3,7 @@ from routes import api_bp
 from config import HOST, PORT, DEBUG
 from flask_cors import CORS
 from stream_routes import stream_bp
+from rag.utils.tokens import get_token_counter
 
 def create_app():
     """Create and configure Flask app"""
@@ -14,6 +15,9 @@ def create_app():
     app.register_blueprint(api_bp)
     app.register_blueprint(stream_bp)
 
+    # Tokenizer của context packing load lúc khởi động thay vì ở request đầu tiên
+    get_token_counter()
+
     return app
 
 def start_app():
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Optional
+
+from qdrant_client.models import (
+    Distance, FieldCondition, Filter, FilterSelector, MatchValue, PayloadSchemaType, PointStruct,
+    Range, VectorParams,
+)
+
+from config import (
+    ANSWER_CACHE_COLLECTION, ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL,
+    ANSWER_CACHE_MIN_QUERY_CHARS, ANSWER_CACHE_REPLAY_CHUNK,
+)
+from rag.utils.embedding_cache import normalize_text
+
+# Namespace cố định: cùng (scope, query) luôn ghi đè cùng một point
+ANSWER_ID_NAMESPACE = uuid.UUID("0c6f3a1e-4b7d-4f51-8d0e-6a9b2e7c1d44")
+
+
+def answer_scope(search_type: str, metadata_filter: Optional[Dict], **params) -> str:
+    """Hash của filter + tham số retrieval: câu trả lời chỉ dùng lại trong cùng scope"""
+    payload = json.dumps({"search_type": search_type, "filter": metadata_filter or {}, **params},
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def replay_chunks(answer: str, size: int = ANSWER_CACHE_REPLAY_CHUNK) -> Iterator[str]:
+    """Cắt câu trả lời đã cache thành các chunk để phát lại như khi LLM stream"""
+    for start in range(0, len(answer), size):
+        yield answer[start:start + size]
+
+
+class SemanticAnswerCache:
+    """
+    Cache câu trả lời theo ngữ nghĩa trong một collection Qdrant riêng:
+    query được embed, câu hỏi gần giống (cosine >= threshold) trong cùng scope
+    và cùng index generation dùng lại câu trả lời + sources, không gọi LLM.
+    Khi generation tăng (ingest / delete) các entry cũ không còn match và bị dọn.
+    """
+
+    def __init__(self, client, embedding, generation,
+                 collection_name: str = ANSWER_CACHE_COLLECTION,
+                 threshold: float = ANSWER_CACHE_THRESHOLD,
+                 ttl: float = ANSWER_CACHE_TTL,
+                 min_query_chars: int = ANSWER_CACHE_MIN_QUERY_CHARS):
+        self.client = client
+        self.embedding = embedding
+        self.generation = generation
+        self.collection_name = collection_name
+        self.threshold = threshold
+        self.ttl = ttl
+        self.min_query_chars = min_query_chars
+        self._lock = threading.Lock()
+        self._ready = False
+        self._purged_generation: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+
+    def cacheable(self, query: str) -> bool:
+        """Câu hỏi quá ngắn ("tại sao?", "tiếp đi") phụ thuộc ngữ cảnh hội thoại, không cache"""
+        return len(normalize_text(query)) >= self.min_query_chars
+
+    def _ensure_collection(self, vector_size: int):
+        if self._ready:
+            return
+        with self._lock:
+            if self._ready:
+                return
+            if not self.client.collection_exists(self.collection_name):
+                self.client.create_collection(
+                    self.collection_name,
+                    vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE),
+                )
+                self.client.create_payload_index(self.collection_name, "scope", PayloadSchemaType.KEYWORD)
+                self.client.create_payload_index(self.collection_name, "generation", PayloadSchemaType.INTEGER)
+                self.client.create_payload_index(self.collection_name, "created_at", PayloadSchemaType.FLOAT)
+                print(f"✓ Created answer cache collection {self.collection_name}")
+            self._ready = True
+
+    def _purge_old_generations(self, generation: int):
+        """Xóa entry của các generation cũ (một lần cho mỗi generation mới quan sát được)"""
+        if self._purged_generation == generation:
+            return
+        self._purged_generation = generation
+        try:
+            self.client.delete(self.collection_name, points_selector=FilterSelector(filter=Filter(
+                must=[FieldCondition(key="generation", range=Range(lt=generation))])))
+        except Exception as e:
+            print(f"! Answer cache purge failed: {e}")
+
+    def _filter(self, scope: str, generation: int) -> Filter:
+        return Filter(must=[
+            FieldCondition(key="scope", match=MatchValue(value=scope)),
+            FieldCondition(key="generation", match=MatchValue(value=generation)),
+            FieldCondition(key="created_at", range=Range(gte=time.time() - self.ttl)),
+        ])
+
+    def lookup(self, query: str, scope: str, generation: Optional[int]) -> Optional[Dict[str, Any]]:
+        """
+        Trả về {"answer", "sources", "query", "score"} của câu hỏi gần nhất trong scope,
+        hoặc None. `generation` do caller đọc một lần và dùng lại cho store().
+        """
+        if generation is None or not self.cacheable(query):
+            return None
+        try:
+            vector = self.embedding.embed_query(query)
+            self._ensure_collection(len(vector))
+            self._purge_old_generations(generation)
+            response = self.client.query_points(
+                self.collection_name, query=vector, query_filter=self._filter(scope, generation),
+                limit=1, score_threshold=self.threshold, with_payload=True,
+            )
+        except Exception as e:
+            print(f"! Answer cache lookup failed: {e}")
+            return None
+
+        if not response.points:
+            self.misses += 1
+            return None
+        point = response.points[0]
+        self.hits += 1
+        payload = point.payload or {}
+        print(f"Answer cache hit (score {point.score:.3f}): {payload.get('query')!r}")
+        return {"answer": payload.get("answer", ""), "sources": payload.get("sources", []),
+                "query": payload.get("query"), "score": float(point.score)}
+
+    def store(self, query: str, scope: str, answer: str, sources: List[Any],
+              generation: Optional[int]) -> bool:
+        """
+        `generation` phải được đọc trước retrieval: nếu index đổi trong lúc sinh câu
+        trả lời, entry nằm dưới generation cũ và không bao giờ được dùng.
+        """
+        if generation is None or not answer.strip() or not self.cacheable(query):
+            return False
+        try:
+            vector = self.embedding.embed_query(query)
+            self._ensure_collection(len(vector))
+            point_id = str(uuid.uuid5(ANSWER_ID_NAMESPACE, f"{scope}\0{normalize_text(query)}"))
+            self.client.upsert(self.collection_name, points=[PointStruct(
+                id=point_id, vector=vector,
+                payload={"query": query, "answer": answer, "sources": sources, "scope": scope,
+                         "generation": generation, "created_at": time.time()},
+            )])
+            return True
+        except Exception as e:
+            print(f"! Answer cache store failed: {e}")
+            return False
+
+    def clear(self):
+        try:
+            self.client.delete_collection(self.collection_name)
+        finally:
+            self._ready = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "collection": self.collection_name,
+            "threshold": self.threshold,
+            "ttl": self.ttl,
+            "generation": self.generation.current(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
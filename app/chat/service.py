@@ -7,20 +7,24 @@ from typing import Dict, Any, Optional, List
 from langchain.schema import Document
 import mlflow
 from MLOps.train import MLflowTracker
-from rag.handler import RAGHandler
-from models import build_prompt_with_history, get_llm, get_llm_stream, get_rag_prompt, get_retriever_prompt, build_prompt_with_history_longdoc
-from vector_store import VectorStoreManager
+from models import build_prompt_with_history, get_rag_prompt, get_retriever_prompt, build_prompt_with_history_longdoc
+from services import ServiceContainer, get_services
 # import vector_store
 
+from .answer_cache import answer_scope, replay_chunks
 from .history import ChatHistory
 
 class ChatService:
-    def __init__(self):
-        self.llm = get_llm()
-        self.llm_stream = get_llm_stream()
-        self.vector_manager = VectorStoreManager()
+    def __init__(self, services: Optional[ServiceContainer] = None):
+        services = services or get_services()
+        self.llm = services.llm
+        self.llm_stream = services.llm_stream
+        self.vector_manager = services.vector_manager
         self.chat_history = ChatHistory()
-        self.rag_handler = RAGHandler()
+        self.rag_handler = services.rag_handler
+        # Semantic answer cache cho chat stream; None nếu tắt trong config
+        self.answer_cache = services.answer_cache
+        self.index_generation = services.index_generation
         self.mlflow_tracker = MLflowTracker(experiment_name="chatbot_inference")
         # self.retriever = vector_store.as_retriever(search_kwargs={"k": 1})
     def simple_chat(self, query: str) -> str:
@@ -90,7 +94,8 @@ class ChatService:
     def hybrid_chat(self, query: str, k: Optional[int] = None,
                    alpha: float = 0.5,
                    metadata_filter: Optional[Dict] = None,
-                   use_rerank: bool = True) -> Dict[str, Any]:
+                   use_rerank: bool = True,
+                   fusion: Optional[str] = None) -> Dict[str, Any]:
         """Chat using hybrid search (BM25 + Vector)"""
         print(f"Hybrid chat query: {query}")
         
@@ -100,7 +105,8 @@ class ChatService:
                 k=k,
                 alpha=alpha,
                 metadata_filter=metadata_filter,
-                use_rerank=use_rerank
+                use_rerank=use_rerank,
+                fusion=fusion
             )
             
             # Update chat history
@@ -307,36 +313,67 @@ class ChatService:
     def chat_with_history_stream(
         self, query: str, search_type: str = "hybrid",
         k: int = None, alpha: float = 0.5,
-        metadata_filter=None, use_rerank: bool = True
+        metadata_filter=None, use_rerank: bool = True,
+        fusion: Optional[str] = None
     ):
+        """
+        Stream câu trả lời: yield text chunks, cuối cùng yield một event dict
+        {"event": "sources", ...}. Câu hỏi gần giống đã trả lời trong cùng scope
+        được phát lại từ answer cache với cùng format, không gọi retrieval / LLM.
+        Answer cache chỉ dùng cho câu hỏi mở đầu hội thoại: khi đã có history, câu
+        trả lời phụ thuộc các lượt trước nên không lookup cũng không store.
+        """
+        # Generation đọc trước retrieval để entry sinh trong lúc index đổi không được dùng lại
+        use_cache = self.answer_cache is not None and not len(self.chat_history)
+        scope = answer_scope(search_type, metadata_filter, k=k, alpha=alpha,
+                             use_rerank=use_rerank, fusion=fusion)
+        generation = self.index_generation.current() if use_cache else None
+        cached = self.answer_cache.lookup(query, scope, generation) if use_cache else None
+        if cached:
+            for chunk in replay_chunks(cached["answer"]):
+                yield chunk
+            yield {"event": "sources", "sources": cached["sources"], "cached": True,
+                   "similarity": round(cached["score"], 4)}
+            self.chat_history.add_human_message(query)
+            self.chat_history.add_ai_message(cached["answer"])
+            return
+
         run_name = f"chat_stream_{int(time.time())}"
         with self.mlflow_tracker.start_run(run_name=run_name):
             params = {
                 "search_type": search_type,
                 "k": k,
                 "alpha": alpha,
-                "use_rerank": use_rerank
+                "use_rerank": use_rerank,
+                "fusion": fusion
             }
             self.mlflow_tracker.log_params(params)
 
-            # === Retrieval phase ===
+            # === Retrieval phase (không gọi LLM, chỉ lấy documents) ===
             start_time = time.time()
             if search_type == "hybrid":
-                result = self.hybrid_chat(query, k=k, alpha=alpha,
-                                        metadata_filter=metadata_filter,
-                                        use_rerank=use_rerank)
+                results = self.rag_handler.retrieve(query, k=k, alpha=alpha,
+                                                    metadata_filter=metadata_filter,
+                                                    use_rerank=use_rerank, fusion=fusion)
             elif search_type == "rag":
-                result = self.rag_chat(query)
+                # Vector-only retrieval
+                results = self.rag_handler.retrieve(query, k=k, alpha=1.0,
+                                                    metadata_filter=metadata_filter,
+                                                    use_rerank=False)
             elif search_type == "simple":
-                result = {"answer": self.simple_chat(query), "sources": []}
+                results = []
             else:
                 yield f"[ERROR] Unknown search type: {search_type}"
                 return
 
-            docs = result.get("sources", [])[:k] if k else result.get("sources", [])
+            docs = [doc for doc, _ in results]
 
+            # Prompt dùng nội dung chunk thật thay vì chuỗi nguồn
+            blocks, packed_docs = self.rag_handler.context_formatter.format_blocks(docs)
             final_prompt = build_prompt_with_history(
-                query, docs, history=self.chat_history.get_messages()
+                query,
+                blocks,
+                history=self.chat_history.get_messages()
             )
 
             # === Streaming phase ===
@@ -349,6 +386,12 @@ class ChatService:
 
             end_time = time.time()
 
+            # Sources chỉ gồm các chunk thực sự nằm trong context
+            sources = self.rag_handler.context_formatter.extract_sources(packed_docs)
+            yield {"event": "sources", "sources": sources, "cached": False}
+            if use_cache:
+                self.answer_cache.store(query, scope, full_response.strip(), sources, generation)
+
             # === Logging metrics ===
             metrics = {
                 "response_time": end_time - start_time,
@@ -0,0 +1,93 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from qdrant_client.models import (
+    CollectionParamsDiff, Disabled, Distance, HnswConfigDiff, QuantizationSearchParams,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType, SearchParams, VectorParams,
+    VectorParamsDiff,
+)
+
+from config import QDRANT_COLLECTION_PROFILE, QDRANT_COLLECTION_PROFILES
+
+
+@dataclass(frozen=True)
+class CollectionProfile:
+    """
+    Cấu hình lưu trữ / index của collection Qdrant.
+    None nghĩa là giữ mặc định của Qdrant cho tham số đó.
+    """
+    name: str = "default"
+    # Scalar int8 quantization: vector gốc có thể nằm trên disk, bản int8 nằm trong RAM
+    quantization: bool = False
+    quantile: float = 0.99
+    quantization_always_ram: bool = True
+    rescore: bool = True
+    oversampling: Optional[float] = None
+    # HNSW graph
+    hnsw_m: Optional[int] = None
+    hnsw_ef_construct: Optional[int] = None
+    hnsw_ef: Optional[int] = None      # ef lúc query
+    # Storage
+    on_disk_vectors: Optional[bool] = None
+    on_disk_payload: Optional[bool] = None
+
+    @classmethod
+    def from_config(cls, name: str = QDRANT_COLLECTION_PROFILE) -> "CollectionProfile":
+        if name not in QDRANT_COLLECTION_PROFILES:
+            raise ValueError(f"Unknown collection profile: {name}")
+        return cls(name=name, **QDRANT_COLLECTION_PROFILES[name])
+
+    def _hnsw_config(self) -> Optional[HnswConfigDiff]:
+        if self.hnsw_m is None and self.hnsw_ef_construct is None:
+            return None
+        return HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct)
+
+    def _quantization_config(self) -> Optional[ScalarQuantization]:
+        if not self.quantization:
+            return None
+        return ScalarQuantization(scalar=ScalarQuantizationConfig(
+            type=ScalarType.INT8, quantile=self.quantile, always_ram=self.quantization_always_ram,
+        ))
+
+    def create_params(self, vector_size: int) -> Dict[str, Any]:
+        """kwargs cho client.create_collection"""
+        params: Dict[str, Any] = {
+            "vectors_config": VectorParams(size=vector_size, distance=Distance.COSINE,
+                                           on_disk=self.on_disk_vectors),
+        }
+        if self._hnsw_config() is not None:
+            params["hnsw_config"] = self._hnsw_config()
+        if self._quantization_config() is not None:
+            params["quantization_config"] = self._quantization_config()
+        if self.on_disk_payload is not None:
+            params["on_disk_payload"] = self.on_disk_payload
+        return params
+
+    def update_params(self) -> Dict[str, Any]:
+        """
+        kwargs cho client.update_collection để áp profile lên collection đã có.
+        Qdrant rebuild index / quantize lại trong background bởi optimizer.
+        """
+        params: Dict[str, Any] = {
+            # Tắt quantization nếu profile không dùng, để migrate ngược được
+            "quantization_config": self._quantization_config() or Disabled.DISABLED,
+        }
+        if self.on_disk_vectors is not None:
+            params["vectors_config"] = {"": VectorParamsDiff(on_disk=self.on_disk_vectors)}
+        if self._hnsw_config() is not None:
+            params["hnsw_config"] = self._hnsw_config()
+        if self.on_disk_payload is not None:
+            params["collection_params"] = CollectionParamsDiff(on_disk_payload=self.on_disk_payload)
+        return params
+
+    def search_params(self) -> Optional[SearchParams]:
+        """Query-time params: hnsw_ef và rescoring/oversampling khi có quantization"""
+        quantization = None
+        if self.quantization:
+            quantization = QuantizationSearchParams(rescore=self.rescore, oversampling=self.oversampling)
+        if self.hnsw_ef is None and quantization is None:
+            return None
+        return SearchParams(hnsw_ef=self.hnsw_ef, quantization=quantization)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
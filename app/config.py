@@ -41,6 +41,15 @@ QDRANT_COLLECTION_NAME = "pdf_documents"
 QDRANT_HOST = "localhost"
 QDRANT_PORT = 6333
 
+# Redis configurations
+REDIS_HOST = "localhost"
+REDIS_PORT = 6379
+REDIS_DB = 0
+
+# BM25 index persistence: None = lưu segments trong Redis, hoặc đường dẫn thư mục local (mmap)
+BM25_INDEX_DIR = None
+BM25_SYNC_INTERVAL = 1.0   # Giây; khoảng tối thiểu giữa hai lần kiểm tra segment mới do worker khác ghi
+
 # Text splitter configurations
 CHUNK_SIZE = 500
 CHUNK_OVERLAP = 50
@@ -49,6 +58,116 @@ CHUNK_OVERLAP = 50
 SIMILARITY_SEARCH_K = 10
 SIMILARITY_THRESHOLD = 0.0  # Giảm threshold để dễ tìm thấy kết quả hơn
 
+# Metadata fields được index để pre-filter (BM25 bitmap index)
+METADATA_INDEX_FIELDS = ("file_name", "type", "source", "page", "chunk", "idiom")
+
+# Collection profile: quantization, HNSW và on-disk storage (xem collection_profiles.py)
+QDRANT_COLLECTION_PROFILE = "default"
+QDRANT_COLLECTION_PROFILES = {
+    "default": {},
+    # Vector float32 nằm trên disk, bản int8 trong RAM; rescore top candidates bằng vector gốc
+    "memory": {"quantization": True, "oversampling": 2.0, "on_disk_vectors": True,
+               "on_disk_payload": True, "hnsw_m": 16, "hnsw_ef_construct": 100, "hnsw_ef": 128},
+    "accuracy": {"hnsw_m": 32, "hnsw_ef_construct": 256, "hnsw_ef": 256},
+}
+QDRANT_APPLY_PROFILE_ON_START = False   # True: migrate collection đã có sang profile khi khởi động
+
+# Hybrid search backend: "local" = BM25 in-process + Qdrant dense,
+# "qdrant" = dense + sparse vector trong cùng point, fusion phía Qdrant
+HYBRID_BACKEND = "local"
+SPARSE_VECTOR_NAME = "bm25"
+# Tạo collection với sparse vector và ghi sparse vector khi ingest. Bật trước khi chuyển sang
+# backend "qdrant"; points đã có thì ghi bù bằng VectorStoreManager.backfill_sparse_vectors()
+QDRANT_SPARSE_VECTORS = HYBRID_BACKEND == "qdrant"
+SPARSE_AVGDL = 256      # avgdl cố định dùng để chuẩn hóa tf của sparse vector
+
+# Hybrid search (backend "local"): BM25 và vector leg chạy song song
+HYBRID_MAX_CONCURRENT_SEARCHES = 4  # Số search đồng thời mỗi process, mỗi search chiếm 2 thread
+HYBRID_ABANDONED_LEGS = 4           # Thread dự phòng cho leg đã quá hạn nhưng vẫn chạy (future đang chạy không cancel được)
+HYBRID_SEARCH_WORKERS = 2 * HYBRID_MAX_CONCURRENT_SEARCHES + HYBRID_ABANDONED_LEGS
+HYBRID_BM25_TIMEOUT = 2.0       # Giây; leg quá hạn bị bỏ, kết quả trả về bị đánh dấu degraded
+HYBRID_VECTOR_TIMEOUT = 5.0     # Gồm cả embed query và round trip Qdrant
+QDRANT_SEARCH_TIMEOUT = 5       # Giây (int); HTTP timeout của Qdrant client dành cho search để vector leg thật sự dừng
+# Fusion mặc định khi request không chỉ định: "rrf", "minmax", "zscore", "weighted"
+HYBRID_FUSION = "minmax"
+HYBRID_RRF_K = 60
+
+# Payload indexes tạo cho collection Qdrant (field trong metadata -> kiểu index)
+QDRANT_PAYLOAD_INDEXES = {
+    "file_name": "keyword",
+    "file_hash": "keyword",
+    "type": "keyword",
+    "source": "keyword",
+    "idiom": "keyword",
+    "page": "integer",
+    "chunk": "integer",
+}
+
+# Số points mỗi lần scroll Qdrant khi dựng lại BM25 index
+BM25_BOOTSTRAP_BATCH_SIZE = 256
+
+# Ingestion job queue
+INGEST_MAX_WORKERS = 2          # Số job ingestion chạy đồng thời
+INGEST_MAX_PENDING_JOBS = 20    # Số job tối đa chờ trong hàng đợi
+INGEST_RETRY_AFTER = 30         # Giây; header Retry-After của response 503 khi hàng đợi đầy
+INGEST_JOB_HISTORY = 200        # Số job đã xong được giữ lại để tra cứu
+
+# PDF text extraction
+PDF_EXTRACT_WORKERS = os.cpu_count() or 1   # Số process extract text song song
+PDF_PARALLEL_MIN_PAGES = 16                 # PDF nhỏ hơn thì extract tuần tự
+
+# Embedding cache dùng chung cho ingestion và query: "redis", "disk" hoặc None (tắt)
+EMBEDDING_CACHE_BACKEND = "redis"
+EMBEDDING_CACHE_DIR = os.path.join(DB_FOLDER, "embedding_cache")  # Dùng khi backend = "disk"
+EMBEDDING_CACHE_MAX_BYTES = 512 * 1024 * 1024
+EMBEDDING_CACHE_DTYPE = "float16"   # float16 giảm một nửa dung lượng, float32 giữ nguyên độ chính xác
+
+# Retrieval result cache (search + rerank) trước RAGHandler; tự hết hiệu lực khi index generation tăng
+RETRIEVAL_CACHE_ENABLED = True
+RETRIEVAL_CACHE_MAX_ENTRIES = 1024  # LRU trong process
+RETRIEVAL_CACHE_TTL = 600           # Giây, áp dụng cho cả tier local và Redis
+RETRIEVAL_CACHE_SHARED = True       # Tier Redis dùng chung giữa các worker
+RETRIEVAL_CACHE_PREFIX = "retrieval:v1"
+
+# Semantic answer cache: câu hỏi gần giống dùng lại câu trả lời đã sinh (collection Qdrant riêng)
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_COLLECTION = f"{QDRANT_COLLECTION_NAME}_answer_cache"
+ANSWER_CACHE_THRESHOLD = 0.95       # Cosine similarity tối thiểu để coi là cùng câu hỏi
+ANSWER_CACHE_TTL = 24 * 3600        # Giây
+ANSWER_CACHE_MIN_QUERY_CHARS = 12   # Câu hỏi ngắn hơn thường là câu hỏi nối tiếp, không cache
+ANSWER_CACHE_REPLAY_CHUNK = 24      # Số ký tự mỗi SSE chunk khi phát lại câu trả lời đã cache
+
+# Cross-encoder reranker
+RERANKER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_BATCH_SIZE = 32      # Số cặp (query, chunk) mỗi lần predict
+RERANK_MAX_DEPTH = 20       # Chỉ rerank tối đa N candidates đầu; phần còn lại giữ thứ tự hybrid
+RERANK_MAX_LENGTH = 512     # Token window của model; chunk dài hơn bị cắt (giảm để nhanh hơn)
+RERANK_CACHE_SIZE = 10000   # Số score (query, chunk id) giữ trong LRU
+RERANKER_BACKEND = "torch"  # "torch" = sentence-transformers, "onnx" = model int8 qua onnxruntime (CPU)
+RERANKER_ONNX_DIR = os.path.join(DB_FOLDER, "reranker_onnx")  # Output của rag/retrieval/onnx_reranker.py
+RERANKER_ONNX_THREADS = 0   # intra-op threads của onnxruntime (0 = mặc định)
+
+# Cascade: bỏ qua / thu hẹp rerank khi thứ hạng hybrid đã đủ chắc chắn (xem rag/retrieval/cascade.py)
+RERANK_CASCADE_ENABLED = True
+RERANK_CASCADE_MARGIN = 0.15     # Margin top1 / top2 (chuẩn hóa [0, 1] theo fusion, xem CascadeReranker) để coi top-1 là rõ ràng
+RERANK_CASCADE_AGREEMENT = 0.6   # Tỷ lệ trùng top-k giữa BM25 và vector leg để bỏ hẳn rerank
+RERANK_CASCADE_BAND = 10         # Số candidates sau top-1 được rerank ở path "partial"
+
+# Context packing cho prompt LLM
+CONTEXT_TOKEN_BUDGET = 2048             # Số token tối đa của phần context (None = không giới hạn)
+CONTEXT_TOKENIZER_MODEL = "Qwen/Qwen2.5-3B-Instruct"  # Repo HuggingFace có tokenizer của OLLAMA_MODEL
+# tokenizer.json của OLLAMA_MODEL (tạo bằng: python -m rag.utils.tokens). Thiếu file / None thì
+# số token chỉ là ước lượng theo số ký tự, budget context là gần đúng
+CONTEXT_TOKENIZER = os.path.join(DB_FOLDER, "tokenizer", "tokenizer.json")
+CONTEXT_CHARS_PER_TOKEN = 3.0           # Ước lượng khi không load được tokenizer
+CONTEXT_MAX_OVERLAP_CHARS = 400         # Đoạn overlap tối đa được tìm khi ghép hai chunk liền kề
+CONTEXT_MIN_OVERLAP_CHARS = 20          # Overlap ngắn hơn coi như trùng ngẫu nhiên, không cắt
+
+# Ingestion pipeline: embed + upsert theo batch
+INGEST_EMBED_BATCH_SIZE = 64        # Số chunks mỗi batch embed/upsert
+INGEST_EMBED_MAX_IN_FLIGHT = 2      # Số batch embed chạy song song (backpressure)
+INGEST_BATCH_RETRIES = 3            # Số lần thử lại mỗi batch
+
 # Flask configurations
 HOST = "0.0.0.0"
 PORT = 8080
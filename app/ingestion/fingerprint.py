@@ -0,0 +1,27 @@
+import hashlib
+import uuid
+
+from rag.utils.embedding_cache import normalize_text
+
+# Namespace cố định để point id giống nhau giữa các lần ingest / các process
+POINT_ID_NAMESPACE = uuid.UUID("5b0f1a52-8e0c-4a1e-9a55-2c1f9f0d7e31")
+
+
+def file_fingerprint(data: bytes) -> str:
+    """sha256 của bytes gốc của file upload"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def chunk_fingerprint(text: str) -> str:
+    """sha256 của nội dung chunk đã chuẩn hóa (NFC + whitespace)"""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def point_id(file_name: str, chunk_hash: str, occurrence: int = 0) -> str:
+    """
+    Qdrant point id deterministic theo (file_name, nội dung chunk, lần xuất hiện):
+    ingest lại cùng nội dung luôn ra cùng id, nên upsert là idempotent. Cùng một đoạn
+    text lặp lại trong file (header, dòng bảng) có `occurrence` 1, 2, ... nên không bị gộp.
+    """
+    key = f"{file_name}\0{chunk_hash}" if not occurrence else f"{file_name}\0{chunk_hash}\0{occurrence}"
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, key))
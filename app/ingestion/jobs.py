@@ -0,0 +1,167 @@
+import io
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from config import INGEST_MAX_WORKERS, INGEST_MAX_PENDING_JOBS, INGEST_JOB_HISTORY
+
+# Trạng thái của một ingestion job
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """Raised when too many ingestion jobs are already waiting"""
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    filename: str
+    status: str = QUEUED
+    result: Any = None
+    error: Optional[str] = None
+    events: List[Dict[str, Any]] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "filename": self.filename,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "last_event": self.events[-1] if self.events else None,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def buffer_upload(file) -> io.BytesIO:
+    """Đọc file upload vào memory để job chạy được sau khi request kết thúc"""
+    buffer = io.BytesIO(file.read())
+    buffer.filename = file.filename
+    return buffer
+
+
+def read_upload(file) -> bytes:
+    """Bytes của file upload (BytesIO đã buffer hoặc FileStorage), chỉ đọc một lần"""
+    if isinstance(file, io.BytesIO):
+        return file.getvalue()
+    file.seek(0)
+    return file.read()
+
+
+class JobManager:
+    """
+    Ingestion job queue: submit trả về job ngay, một pool worker giới hạn xử lý job
+    (giới hạn số job chạy đồng thời để ingestion không chiếm hết tài nguyên của query path).
+    """
+
+    def __init__(self, max_workers: int = INGEST_MAX_WORKERS,
+                 max_pending: int = INGEST_MAX_PENDING_JOBS,
+                 history: int = INGEST_JOB_HISTORY,
+                 executor: Optional[Executor] = None):
+        self.max_pending = max_pending
+        self.history = history
+        self._executor = executor or ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._cond = threading.Condition()
+
+    def submit(self, kind: str, filename: str,
+               func: Callable[..., Any], *args, **kwargs) -> Job:
+        """
+        Queue `func(*args, progress=callback, **kwargs)` as a job.
+        `progress(event)` nhận dict event và được phát lại qua SSE.
+        """
+        with self._cond:
+            pending = sum(1 for job in self._jobs.values() if job.status == QUEUED)
+            if pending >= self.max_pending:
+                raise QueueFullError(f"Too many pending ingestion jobs ({pending})")
+            job = Job(id=uuid.uuid4().hex, kind=kind, filename=filename)
+            self._jobs[job.id] = job
+            self._emit(job, {"event": "queued", "msg": f"Job queued: {filename}"})
+            self._prune()
+
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        return [job.to_dict() for job in reversed(self._jobs.values())]
+
+    def events(self, job_id: str, timeout: float = 15.0) -> Iterator[Dict[str, Any]]:
+        """
+        Yield job events (kể cả các event đã có) cho tới khi job kết thúc.
+        Yield {"event": "ping"} mỗi `timeout` giây để giữ kết nối SSE.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return
+        sent = 0
+        while True:
+            timed_out = False
+            with self._cond:
+                if sent >= len(job.events) and not job.done:
+                    timed_out = not self._cond.wait(timeout)
+                new_events = job.events[sent:]
+                done = job.done
+            sent += len(new_events)
+            if timed_out and not new_events:
+                yield {"event": "ping"}
+            for event in new_events:
+                yield event
+            if done and sent >= len(job.events):
+                return
+
+    def _emit(self, job: Job, event: Dict[str, Any]):
+        with self._cond:
+            job.events.append({"job_id": job.id, "ts": time.time(), **event})
+            self._cond.notify_all()
+
+    def _run(self, job: Job, func: Callable[..., Any], args, kwargs):
+        with self._cond:
+            job.status = RUNNING
+            job.started_at = time.time()
+        self._emit(job, {"event": "start", "msg": f"Processing {job.filename}"})
+        try:
+            result = func(*args, progress=lambda event: self._emit(job, event), **kwargs)
+            # Đổi status và phát event cuối trong cùng một lock để stream không bỏ sót
+            with self._cond:
+                job.result = result
+                job.status = SUCCEEDED
+                job.finished_at = time.time()
+                self._emit(job, {"event": "done", "result": result})
+        except Exception as e:
+            print(f"Ingestion job {job.id} failed: {e}")
+            with self._cond:
+                job.error = str(e)
+                job.status = FAILED
+                job.finished_at = time.time()
+                self._emit(job, {"event": "error", "msg": str(e)})
+
+    def _prune(self):
+        """Giữ lại tối đa `history` job đã xong"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,41 @@
+import io
+from concurrent.futures import Executor
+from typing import List, Optional
+
+from pypdf import PdfReader
+
+from config import PDF_PARALLEL_MIN_PAGES
+
+
+def count_pages(pdf_bytes: bytes) -> int:
+    return len(PdfReader(io.BytesIO(pdf_bytes)).pages)
+
+
+def extract_page_range(pdf_bytes: bytes, start: int, end: int) -> List[str]:
+    """Extract text of pages [start, end) - chạy trong worker process"""
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def extract_pages(pdf_bytes: bytes, executor: Optional[Executor] = None,
+                  workers: int = 1) -> List[str]:
+    """
+    Extract text của mọi page theo đúng thứ tự page.
+    pypdf extraction là CPU-bound và giữ GIL, nên với PDF lớn các khoảng page
+    được chia cho process pool rồi ghép lại theo thứ tự.
+    """
+    page_count = count_pages(pdf_bytes)
+    if executor is None or workers <= 1 or page_count < PDF_PARALLEL_MIN_PAGES:
+        return extract_page_range(pdf_bytes, 0, page_count)
+
+    # Mỗi worker nhận một khoảng page liên tiếp (ít task -> ít lần copy bytes sang process)
+    tasks = min(workers, page_count)
+    step = -(-page_count // tasks)
+    futures = [
+        executor.submit(extract_page_range, pdf_bytes, start, min(start + step, page_count))
+        for start in range(0, page_count, step)
+    ]
+    pages: List[str] = []
+    for future in futures:
+        pages.extend(future.result())
+    return pages
@@ -0,0 +1,115 @@
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain.schema import Document
+from qdrant_client.models import PointStruct
+
+from config import INGEST_EMBED_BATCH_SIZE, INGEST_EMBED_MAX_IN_FLIGHT, INGEST_BATCH_RETRIES, SPARSE_VECTOR_NAME
+
+
+def _with_retries(func: Callable[[], Any], what: str, retries: int = INGEST_BATCH_RETRIES,
+                  backoff: float = 0.5):
+    for attempt in range(1, retries + 1):
+        try:
+            return func()
+        except Exception as e:
+            if attempt == retries:
+                raise
+            print(f"! {what} failed (attempt {attempt}/{retries}): {e}")
+            time.sleep(backoff * 2 ** (attempt - 1))
+
+
+class EmbedUpsertPipeline:
+    """
+    Embed + upsert chunks vào Qdrant theo batch.
+    Tối đa `max_in_flight` batch được embed song song; batch cũ nhất được upsert
+    trong lúc `max_in_flight` batch sau vẫn đang embed. Hàng đợi có giới hạn nên không bao giờ
+    giữ quá `max_in_flight + 1` batch trong memory (backpressure).
+    """
+
+    def __init__(self, embedding, client, collection_name: str,
+                 batch_size: int = INGEST_EMBED_BATCH_SIZE,
+                 max_in_flight: int = INGEST_EMBED_MAX_IN_FLIGHT,
+                 retries: int = INGEST_BATCH_RETRIES,
+                 content_key: str = "page_content", metadata_key: str = "metadata",
+                 sparse_encoder=None):
+        self.embedding = embedding
+        self.client = client
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        self.max_in_flight = max(1, max_in_flight)
+        self.retries = retries
+        self.content_key = content_key
+        self.metadata_key = metadata_key
+        # Nếu có: ghi thêm sparse (BM25-style) vector vào cùng point
+        self.sparse_encoder = sparse_encoder
+        self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="embed")
+
+    def run(self, documents: List[Document], ids: Optional[List[str]] = None,
+            progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """
+        Embed và upsert toàn bộ `documents`. Trả về point ids (theo thứ tự documents)
+        cùng thống kê throughput.
+        """
+        ids = list(ids) if ids is not None else [uuid.uuid4().hex for _ in documents]
+        batches = [(start, documents[start:start + self.batch_size])
+                   for start in range(0, len(documents), self.batch_size)]
+        started = time.perf_counter()
+        embed_time = 0.0
+        upsert_time = 0.0
+        done = 0
+
+        pending = deque()
+        for number, (start, batch) in enumerate(batches, start=1):
+            pending.append((number, start, batch, self._executor.submit(self._embed, batch)))
+            # Backpressure: ngoài batch cũ nhất (đem upsert) đã có đủ max_in_flight batch đang embed
+            # thì upsert nó trước khi nhận thêm
+            while len(pending) > self.max_in_flight or (pending and number == len(batches)):
+                n, s, b, future = pending.popleft()
+                vectors, seconds = future.result()
+                embed_time += seconds
+                upsert_time += self._upsert(b, vectors, ids[s:s + len(b)])
+                done += len(b)
+                elapsed = time.perf_counter() - started
+                if progress:
+                    progress({"event": "progress", "stage": "embed",
+                              "msg": f"Indexed batch {n}/{len(batches)} ({done}/{len(documents)} chunks)",
+                              "chunks": done, "total": len(documents),
+                              "chunks_per_sec": round(done / elapsed, 2) if elapsed else None})
+
+        elapsed = time.perf_counter() - started
+        stats = {
+            "chunks": len(documents),
+            "batches": len(batches),
+            "seconds": round(elapsed, 3),
+            "embed_seconds": round(embed_time, 3),
+            "upsert_seconds": round(upsert_time, 3),
+            "chunks_per_sec": round(len(documents) / elapsed, 2) if elapsed else None,
+        }
+        print(f"✓ Indexed {len(documents)} chunks in {len(batches)} batches "
+              f"({stats['chunks_per_sec']} chunks/s)")
+        return {"ids": ids, "stats": stats}
+
+    def _embed(self, batch: List[Document]):
+        started = time.perf_counter()
+        texts = [doc.page_content for doc in batch]
+        vectors = _with_retries(lambda: self.embedding.embed_documents(texts), "Embedding batch",
+                                self.retries)
+        return vectors, time.perf_counter() - started
+
+    def _upsert(self, batch: List[Document], vectors: List[List[float]], ids: List[str]) -> float:
+        started = time.perf_counter()
+        encoder = self.sparse_encoder
+        points = [
+            PointStruct(id=point_id,
+                        vector={"": vector, SPARSE_VECTOR_NAME: encoder.encode_document(doc.page_content)}
+                        if encoder else vector,
+                        payload={self.content_key: doc.page_content, self.metadata_key: doc.metadata})
+            for doc, vector, point_id in zip(batch, vectors, ids)
+        ]
+        _with_retries(lambda: self.client.upsert(collection_name=self.collection_name, points=points),
+                      "Qdrant upsert", self.retries)
+        return time.perf_counter() - started
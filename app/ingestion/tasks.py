@@ -0,0 +1,31 @@
+from typing import Any, Dict
+
+from services import get_services
+
+
+def ingest_pdf(file, progress=None) -> Dict[str, Any]:
+    """Ingestion task cho /pdf: parse, chunk, embed và index một file PDF"""
+    result = get_services().vector_manager.process_pdf(file, progress=progress)
+    return {
+        "filename": file.filename,
+        "doc_len": result["docs"],
+        "chunks": result["chunks"],
+        "added": result["added"],
+        "removed": result["removed"],
+        "skipped": result["skipped"],
+    }
+
+
+def ingest_idioms(file, source_name: str = "idioms", progress=None) -> Dict[str, Any]:
+    """Ingestion task cho /idioms: tách từng dòng idiom thành một document"""
+    result = get_services().vector_manager.process_idiom(file, source_name=source_name, progress=progress)
+    return {
+        "filename": file.filename,
+        "source": source_name,
+        "docs": result["docs"],
+        "chunks": result["chunks"],
+        "final_count": result["total_points"],
+        "added": result["added"],
+        "removed": result["removed"],
+        "skipped": result["skipped"],
+    }
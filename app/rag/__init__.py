@@ -1,8 +1,9 @@
 from .handler import RAGHandler
 
 def create_hybrid_rag():
-    """Create a new RAGHandler instance"""
-    return RAGHandler()
+    """Return the shared RAGHandler instance"""
+    from services import get_services
+    return get_services().rag_handler
 
 def quick_hybrid_query(query, alpha=0.5, k=None):
     """Quick hybrid RAG query"""
@@ -1,33 +1,37 @@
-from typing import Dict, Any, Optional
-from .search.bm25 import BM25Search
-from .search.vector import VectorSearch
-from .search.hybrid import HybridSearch
-from .retrieval.reranker import CrossEncoderReranker
+from typing import Dict, Any, List, Optional, Tuple
+from .retrieval.cascade import CascadeReranker
 from .retrieval.retriever import DocumentRetriever
+from .search.bootstrap import IndexBootstrap
 from .utils.context import ContextFormatter
-from config import SIMILARITY_SEARCH_K
+from .utils.result_cache import retrieval_key
+from config import SIMILARITY_SEARCH_K, RERANK_CASCADE_ENABLED
+from services import ServiceContainer, get_services
 
 class RAGHandler:
-    def __init__(self):
-        self.vector_search = VectorSearch()
-        self.bm25_search = BM25Search()
-        self.hybrid_search = HybridSearch(self.bm25_search, self.vector_search)
-        self.reranker = CrossEncoderReranker()
-        self.retriever = DocumentRetriever()
+    def __init__(self, services: Optional[ServiceContainer] = None):
+        services = services or get_services()
+        self.vector_search = services.vector_search
+        self.bm25_search = services.bm25_search
+        self.hybrid_search = services.hybrid_search
+        self.reranker = services.reranker
+        # Bỏ qua / thu hẹp cross-encoder khi thứ hạng hybrid đã rõ ràng
+        self.cascade = CascadeReranker(self.reranker) if RERANK_CASCADE_ENABLED else None
+        # Cache kết quả retrieve(); None nếu tắt trong config
+        self.retrieval_cache = services.retrieval_cache
+        self.index_generation = services.index_generation
+        self.retriever = DocumentRetriever(services)
         self.context_formatter = ContextFormatter()
+        self.bootstrap = IndexBootstrap(self.bm25_search, self.vector_search)
         self._initialize_indexes()
 
     def _initialize_indexes(self):
-        """Initialize search indexes"""
+        """Initialize search indexes (load cache hoặc scroll Qdrant trong background)"""
         try:
-            # Get all documents from vector store
-            documents = self.vector_search.get_all_documents()
-            if documents:
-                print(f"Found {len(documents)} documents in vector store")
-                # Build BM25 index
-                self.bm25_search.build_index(documents)
-            else:
-                print("No documents found in vector store")
+            if self.hybrid_search.uses_native:
+                # Lexical search chạy trong Qdrant, không cần BM25 in-process
+                print("✓ Using qdrant hybrid backend - skipping BM25 bootstrap")
+                return
+            self.bootstrap.start()
         except Exception as e:
             print(f"Error initializing indexes: {e}")
 
@@ -37,46 +41,105 @@ class RAGHandler:
             if documents:
                 print(f"Incrementally adding {len(documents)} new docs to BM25 index...")
                 self.bm25_search.add_documents(documents)
+                self.index_generation.bump("update_indexes")
             else:
                 print("Rebuilding BM25 index with all docs...")
-                all_docs = self.vector_search.get_all_documents()
-                self.bm25_search.build_index(all_docs)
+                return self.bootstrap.start(force=True)
             return True
         except Exception as e:
             print(f"Error updating indexes: {e}")
             return False
 
+    def get_index_status(self) -> Dict[str, Any]:
+        """Trạng thái BM25 index và tiến độ bootstrap"""
+        if self.hybrid_search.uses_native:
+            return {"ready": True, "backend": "qdrant"}
+        return {
+            "ready": self.bootstrap.ready,
+            "bootstrap": self.bootstrap.get_status(),
+            "bm25": self.bm25_search.get_status(),
+        }
+
+    def retrieve(self, query: str, k: Optional[int] = None,
+                 alpha: float = 0.5,
+                 metadata_filter: Optional[Dict] = None,
+                 use_rerank: bool = True,
+                 fusion: Optional[str] = None) -> List[Tuple[Any, float]]:
+        """
+        Retrieval-only pipeline: hybrid search -> fuse -> rerank.
+        Không gọi LLM; trả về list (document, score) để caller tự sinh câu trả lời.
+        """
+        k = k or SIMILARITY_SEARCH_K
+
+        # Chỉ cache khi index đầy đủ (không cache kết quả trong lúc BM25 đang bootstrap)
+        ready = self.hybrid_search.uses_native or self.bootstrap.ready
+        cache = self.retrieval_cache if ready else None
+        if cache is not None:
+            key = retrieval_key(query, metadata_filter, k, alpha, use_rerank, fusion=fusion)
+            generation = self.index_generation.current()
+            cached = cache.get(key, generation)
+            if cached is not None:
+                print(f"Retrieval cache hit ({len(cached)} results)")
+                return cached
+            # Đọc generation trước rồi mới sync: BM25 được ghi trước khi bump, nên index local
+            # đã sync thì ít nhất mới bằng generation. Worker chưa sync được không ghi cache,
+            # tránh đưa kết quả của index cũ vào tier Redis dùng chung dưới generation mới.
+            if not (self.hybrid_search.uses_native or self.bm25_search.sync(max_age=0)):
+                print("! BM25 index not in sync with shared store - skipping retrieval cache write")
+                cache = None
+
+        results, degraded = self._retrieve(query, k, alpha, metadata_filter, use_rerank, fusion)
+        # Kết quả degraded (một leg timeout) không được cache
+        if cache is not None and results and not degraded:
+            cache.put(key, results, generation)
+        return results
+
+    def _retrieve(self, query: str, k: int, alpha: float, metadata_filter: Optional[Dict],
+                  use_rerank: bool, fusion: Optional[str]) -> Tuple[List[Tuple[Any, float]], bool]:
+        """Search + rerank, không qua cache. Trả về (results, degraded)"""
+        # Get candidate documents
+        search = self.hybrid_search.search_with_info(
+            query=query,
+            k=k * 2,
+            alpha=alpha,
+            metadata_filter=metadata_filter,
+            fusion=fusion
+        )
+        candidates = search["results"]
+
+        # Rerank if needed
+        if use_rerank and self.cascade is not None:
+            return self.cascade.rerank(query, search, top_k=k), search["degraded"]
+        if use_rerank:
+            return self.reranker.rerank_with_scores(
+                query, [doc for doc, _ in candidates], top_k=k
+            ), search["degraded"]
+        return candidates[:k], search["degraded"]
 
     def rag_query_hybrid(self, query: str, k: Optional[int] = None, 
                         alpha: float = 0.5, include_sources: bool = True,
                         metadata_filter: Optional[Dict] = None, 
-                        use_rerank: bool = True) -> Dict[str, Any]:
+                        use_rerank: bool = True,
+                        fusion: Optional[str] = None) -> Dict[str, Any]:
         """RAG pipeline with hybrid search"""
-        k = k or SIMILARITY_SEARCH_K
-
         try:
-            # Get candidate documents
-            candidates = self.hybrid_search.search(
+            results = self.retrieve(
                 query=query,
-                k=k * 2,
+                k=k,
                 alpha=alpha,
-                metadata_filter=metadata_filter
+                metadata_filter=metadata_filter,
+                use_rerank=use_rerank,
+                fusion=fusion
             )
-            documents = [doc for doc, _ in candidates]
-
-            # Rerank if needed
-            if use_rerank:
-                documents = self.reranker.rerank(query, documents, top_k=k)
-            else:
-                documents = documents[:k]
+            documents = [doc for doc, _ in results]
 
             # Format context and get response
-            context = self.context_formatter.format_documents(documents)
+            context, packed = self.context_formatter.format_context(documents)
             response = self.retriever.get_llm_response(query, context)
             
             return {
                 "answer": response,
-                "sources": self.context_formatter.extract_sources(documents)
+                "sources": self.context_formatter.extract_sources(packed) if include_sources else []
             }
 
         except Exception as e:
@@ -89,6 +152,7 @@ class RAGHandler:
         """Clear all search indexes and caches"""
         try:
             self.bm25_search.clear_index()
+            self.index_generation.bump("clear_search_indexes")
             status = self.bm25_search.get_status()
             return {
                 "status": "success", 
@@ -1,16 +1,11 @@
 from langgraph.graph import StateGraph, END
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from dataclasses import dataclass
 
-from rag.retrieval.reranker import CrossEncoderReranker
-from rag.search.bm25 import BM25Search
-from rag.search.hybrid import HybridSearch
-from rag.search.vector import VectorSearch
-
-
 from .retrieval.retriever import DocumentRetriever
 from .utils.context import ContextFormatter
 from config import SIMILARITY_SEARCH_K
+from services import ServiceContainer, get_services
 
 # State class để lưu trữ trạng thái giữa các node
 @dataclass 
@@ -19,61 +14,44 @@ class RAGState:
     chat_history: List
     documents: List = None
     reranked_docs: List = None
+    context_docs: List = None
     context: str = None
     answer: str = None
     sources: List = None
 
 class RAGGraph:
-    def __init__(self):
-        # Initialize components
-        self.vector_search = VectorSearch()
-        self.bm25_search = BM25Search()
-        self.hybrid_search = HybridSearch(self.bm25_search, self.vector_search)
-        self.reranker = CrossEncoderReranker() 
+    def __init__(self, services: Optional[ServiceContainer] = None):
+        # Resolve shared components from the service container
+        services = services or get_services()
+        self.rag_handler = services.rag_handler
         self.context_formatter = ContextFormatter()
-        self.retriever = DocumentRetriever()
+        self.retriever = DocumentRetriever(services)
         
         # Create workflow
         self.workflow = StateGraph(RAGState)
         
         # Add nodes
-        self.workflow.add_node("search", self.search_node)
-        self.workflow.add_node("rerank", self.rerank_node)
+        self.workflow.add_node("retrieve", self.retrieve_node)
         self.workflow.add_node("format_context", self.format_context_node)
         self.workflow.add_node("generate", self.generate_answer_node)
 
         # Add edges
-        self.workflow.set_entry_point("search")
-        self.workflow.add_edge("search", "rerank")
-        self.workflow.add_edge("rerank", "format_context")
+        self.workflow.set_entry_point("retrieve")
+        self.workflow.add_edge("retrieve", "format_context")
         self.workflow.add_edge("format_context", "generate") 
         self.workflow.add_edge("generate", END)
 
         self.graph = self.workflow.compile()
 
-    def search_node(self, state: RAGState):
-        """Node thực hiện hybrid search"""
+    def retrieve_node(self, state: RAGState):
+        """Node thực hiện hybrid search + rerank (dùng chung RAGHandler.retrieve)"""
         try:
-            candidates = self.hybrid_search.search(
-                query=state.query,
-                k=SIMILARITY_SEARCH_K * 2
+            results = self.rag_handler.retrieve(
+                state.query,
+                k=SIMILARITY_SEARCH_K
             )
-            state.documents = [doc for doc, _ in candidates]
-            return state
-        except Exception as e:
-            return {"error": str(e)}
-
-    def rerank_node(self, state: RAGState):
-        """Node thực hiện rerank documents"""
-        try:
-            if state.documents:
-                state.reranked_docs = self.reranker.rerank(
-                    state.query,
-                    state.documents, 
-                    top_k=SIMILARITY_SEARCH_K
-                )
-            else:
-                state.reranked_docs = state.documents[:SIMILARITY_SEARCH_K]
+            state.reranked_docs = [doc for doc, _ in results]
+            state.documents = state.reranked_docs
             return state
         except Exception as e:
             return {"error": str(e)}
@@ -81,7 +59,7 @@ class RAGGraph:
     def format_context_node(self, state: RAGState):
         """Node format context từ documents"""
         try:
-            state.context = self.context_formatter.format_documents(state.reranked_docs)
+            state.context, state.context_docs = self.context_formatter.format_context(state.reranked_docs)
             return state
         except Exception as e:
             return {"error": str(e)}
@@ -91,7 +69,7 @@ class RAGGraph:
         try:
             response = self.retriever.get_llm_response(state.query, state.context)
             state.answer = response
-            state.sources = self.context_formatter.extract_sources(state.reranked_docs)
+            state.sources = self.context_formatter.extract_sources(state.context_docs or [])
             return state
         except Exception as e:
             return {"error": str(e)}
@@ -0,0 +1,154 @@
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from config import HYBRID_RRF_K, RERANK_CASCADE_MARGIN, RERANK_CASCADE_AGREEMENT, RERANK_CASCADE_BAND
+from ..utils.embedding_cache import normalize_text
+
+Results = List[Tuple[Any, float]]
+
+PATHS = ("empty", "exact", "confident", "partial", "full")
+_QUOTES = " \"'“”‘’?!.…"
+
+
+def _normalize_phrase(text: str) -> str:
+    return normalize_text(text).strip(_QUOTES).casefold()
+
+
+class CascadeReranker:
+    """
+    Tầng quyết định giữa HybridSearch và CrossEncoderReranker:
+    - exact:     query trùng nguyên văn một idiom trong candidates -> trả luôn, không rerank
+    - confident: top-1 vượt top-2 rõ ràng và hai leg BM25 / vector đồng thuận -> giữ thứ tự hybrid
+    - partial:   top-1 rõ ràng nhưng hai leg lệch nhau -> giữ top-1, chỉ rerank band phía sau
+    - full:      còn lại -> rerank toàn bộ như trước
+    - empty:     không có candidate (đếm riêng để không làm lệch tỷ lệ confident)
+    Thang điểm theo path (score luôn giảm dần trong một kết quả):
+    - exact / confident: fused score của HybridSearch, cross-encoder không chạy
+    - partial / full: score cross-encoder như rerank_with_scores; document không được chấm
+      (ngoài band / max_depth) nhận score thấp nhất đã chấm, top-1 của partial không thấp hơn vị trí 2
+    Đếm số lần và latency của từng path để cân nhắc recall / p50.
+    """
+
+    def __init__(self, reranker, margin: float = RERANK_CASCADE_MARGIN,
+                 agreement: float = RERANK_CASCADE_AGREEMENT, band: int = RERANK_CASCADE_BAND):
+        self.reranker = reranker
+        self.margin = margin
+        self.agreement = agreement
+        self.band = max(1, band)
+        self._lock = threading.Lock()
+        self._counts = {path: 0 for path in PATHS}
+        self._seconds = {path: 0.0 for path in PATHS}
+
+    @staticmethod
+    def score_margin(candidates: Results, fusion: Optional[str] = None,
+                     weights: Optional[Sequence[float]] = None, rrf_k: int = HYBRID_RRF_K) -> float:
+        """
+        Khoảng cách top-1 / top-2 chuẩn hóa về [0, 1] theo fusion strategy đã tạo ra score:
+        - rrf:    đổi score về rank hiệu dụng r = sum(w) / score - rrf_k, margin = (r2 - r1) / r2
+        - minmax: score nằm trong [0, sum(w)], margin = (s1 - s2) / sum(w)
+        - còn lại (zscore, weighted, native): theo khoảng score của candidates, (s1 - s2) / (s1 - s_min)
+        """
+        if len(candidates) < 2:
+            return 1.0 if candidates else 0.0
+        first, second = candidates[0][1], candidates[1][1]
+        total = float(sum(weights)) if weights else 0.0
+        if fusion == "rrf" and total > 0 and first > 0:
+            if second <= 0:
+                return 1.0
+            first_rank, second_rank = total / first - rrf_k, total / second - rrf_k
+            return min(1.0, max(0.0, (second_rank - first_rank) / max(second_rank, 1e-9)))
+        if fusion == "minmax" and total > 0:
+            return min(1.0, max(0.0, (first - second) / total))
+        spread = first - candidates[-1][1]
+        return (first - second) / spread if spread > 0 else 0.0
+
+    @staticmethod
+    def leg_agreement(leg_ids: Dict[str, List[str]], depth: int) -> Optional[float]:
+        """Tỷ lệ trùng top-`depth` giữa BM25 và vector leg; None nếu không có đủ hai leg"""
+        bm25, vector = leg_ids.get("bm25"), leg_ids.get("vector")
+        if not bm25 or not vector:
+            return None
+        top_bm25, top_vector = set(bm25[:depth]), set(vector[:depth])
+        return len(top_bm25 & top_vector) / max(1, min(len(top_bm25), len(top_vector)))
+
+    @staticmethod
+    def exact_match(query: str, candidates: Results) -> Optional[int]:
+        """Vị trí candidate có metadata idiom trùng nguyên văn query"""
+        phrase = _normalize_phrase(query)
+        for position, (doc, _) in enumerate(candidates):
+            idiom = (doc.metadata or {}).get("idiom")
+            if idiom and _normalize_phrase(idiom) == phrase:
+                return position
+        return None
+
+    def rerank(self, query: str, search: Dict[str, Any], top_k: int = 10) -> Results:
+        """`search` là kết quả HybridSearch.search_with_info"""
+        started = time.perf_counter()
+        path, results = self._rerank(query, search, top_k)
+        self._record(path, time.perf_counter() - started)
+        print(f"Cascade rerank path: {path}")
+        return results
+
+    def _rerank(self, query: str, search: Dict[str, Any], top_k: int) -> Tuple[str, Results]:
+        candidates = search["results"]
+        if not candidates:
+            return "empty", []
+
+        position = self.exact_match(query, candidates)
+        if position is not None:
+            # Idiom khớp nguyên văn lên đầu
+            rest = [c for i, c in enumerate(candidates) if i != position]
+            return "exact", [candidates[position]] + rest[:top_k - 1]
+
+        depth = max(top_k, 1)
+        margin = self.score_margin(candidates, search.get("fusion"), search.get("weights"))
+        agreement = None if search.get("degraded") else self.leg_agreement(search.get("leg_ids", {}), depth)
+        if margin >= self.margin:
+            if agreement is not None and agreement >= self.agreement:
+                return "confident", candidates[:top_k]
+            return "partial", self._partial(query, candidates, top_k)
+
+        return "full", self.reranker.rerank_with_scores(query, [doc for doc, _ in candidates], top_k=top_k)
+
+    def _partial(self, query: str, candidates: Results, top_k: int) -> Results:
+        """
+        Top-1 rõ ràng: giữ nó ở đầu, chỉ rerank band ngay sau nó.
+        Top-1 được chấm cùng batch để có score cross-encoder; phần sau band
+        (khi band < top_k - 1) nối theo thứ tự hybrid với score thấp nhất đã chấm.
+        """
+        head = [doc for doc, _ in candidates[:1 + self.band]]
+        reranked = self.reranker.rerank_with_scores(query, head, top_k=len(head))
+        first = head[0]
+        rest = [(doc, score) for doc, score in reranked if doc is not first]
+        first_score = next((score for doc, score in reranked if doc is first), 0.0)
+        if rest:
+            first_score = max(first_score, rest[0][1])
+        results = [(first, first_score)] + rest
+        floor = results[-1][1]
+        results.extend((doc, floor) for doc, _ in candidates[len(head):top_k])
+        return results[:top_k]
+
+    def _record(self, path: str, seconds: float):
+        with self._lock:
+            self._counts[path] += 1
+            self._seconds[path] += seconds
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(self._counts.values())
+            return {
+                "margin": self.margin,
+                "agreement": self.agreement,
+                "band": self.band,
+                "total": total,
+                "paths": {
+                    path: {
+                        "count": self._counts[path],
+                        "share": round(self._counts[path] / total, 4) if total else None,
+                        "avg_ms": round(1000 * self._seconds[path] / self._counts[path], 2)
+                        if self._counts[path] else None,
+                    }
+                    for path in PATHS
+                },
+            }
@@ -0,0 +1,126 @@
+import os
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from config import RERANKER_MODEL, RERANKER_ONNX_DIR, RERANK_MAX_LENGTH, RERANKER_ONNX_THREADS
+
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_QUANTIZED_FILE = "model_quantized.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+
+
+class OnnxCrossEncoder:
+    """
+    Cross-encoder chạy bằng onnxruntime trên CPU (model int8 đã export bằng
+    export_onnx_reranker). Cùng interface predict() với sentence_transformers.CrossEncoder
+    nên CrossEncoderReranker dùng được cả hai backend; không cần import torch.
+    """
+
+    def __init__(self, model_dir: str = RERANKER_ONNX_DIR, max_length: int = RERANK_MAX_LENGTH,
+                 threads: int = RERANKER_ONNX_THREADS, quantized: bool = True,
+                 apply_sigmoid: bool = True):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_path = os.path.join(model_dir, ONNX_QUANTIZED_FILE if quantized else ONNX_MODEL_FILE)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"ONNX reranker not found at {model_path}; "
+                                    f"run `python -m rag.retrieval.onnx_reranker` to export it")
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        # CrossEncoder với 1 label mặc định trả sigmoid(logit); giữ nguyên để score so sánh được
+        self.apply_sigmoid = apply_sigmoid
+
+    def predict(self, pairs: Sequence[Tuple[str, str]], batch_size: int = 32,
+                show_progress_bar: bool = False) -> np.ndarray:
+        scores: List[np.ndarray] = []
+        for start in range(0, len(pairs), batch_size):
+            encodings = self.tokenizer.encode_batch([tuple(pair) for pair in pairs[start:start + batch_size]])
+            inputs = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            logits = self.session.run(None, {k: v for k, v in inputs.items() if k in self.input_names})[0]
+            scores.append(logits[:, 0])
+        if not scores:
+            return np.empty(0, dtype=np.float32)
+        logits = np.concatenate(scores)
+        return 1.0 / (1.0 + np.exp(-logits)) if self.apply_sigmoid else logits
+
+
+def export_onnx_reranker(model_name: str = RERANKER_MODEL, output_dir: str = RERANKER_ONNX_DIR,
+                         opset: int = 17) -> str:
+    """
+    Export cross-encoder HuggingFace sang ONNX rồi quantize dynamic int8 (weights).
+    Chỉ cần torch/transformers lúc export; worker inference chỉ cần onnxruntime + tokenizers.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+
+    sample = tokenizer([("query", "document")], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["logits"] = {0: "batch"}
+    model_path = os.path.join(output_dir, ONNX_MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(model, tuple(sample[name] for name in input_names), model_path,
+                          input_names=input_names, output_names=["logits"],
+                          dynamic_axes=dynamic_axes, opset_version=opset,
+                          # dynamic_axes là option của exporter TorchScript (torch mới mặc định dùng dynamo)
+                          dynamo=False)
+
+    quantized_path = os.path.join(output_dir, ONNX_QUANTIZED_FILE)
+    quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+    tokenizer.save_pretrained(output_dir)
+    print(f"✓ Exported {model_name} to {quantized_path}")
+    return quantized_path
+
+
+PARITY_PAIRS = [
+    ("thủ đô của Việt Nam là gì", "Hà Nội là thủ đô của nước Cộng hòa Xã hội Chủ nghĩa Việt Nam."),
+    ("thủ đô của Việt Nam là gì", "Thành phố Hồ Chí Minh là thành phố đông dân nhất Việt Nam."),
+    ("how do I reset my password", "To reset your password, open Settings and choose Security."),
+    ("how do I reset my password", "Our office is closed on public holidays."),
+]
+
+
+def check_parity(model_name: str = RERANKER_MODEL, model_dir: str = RERANKER_ONNX_DIR,
+                 pairs: Sequence[Tuple[str, str]] = PARITY_PAIRS, tolerance: float = 0.05) -> float:
+    """
+    So sánh score của model int8 với CrossEncoder gốc (PyTorch) trên cùng các cặp.
+    Trả về sai lệch tuyệt đối lớn nhất; raise nếu vượt tolerance hoặc thứ tự khác nhau.
+    """
+    from sentence_transformers import CrossEncoder
+
+    reference = np.asarray(CrossEncoder(model_name, max_length=RERANK_MAX_LENGTH).predict(list(pairs)))
+    quantized = OnnxCrossEncoder(model_dir).predict(list(pairs))
+    max_diff = float(np.max(np.abs(reference - quantized)))
+    print(f"Reranker parity: max |torch - onnx| = {max_diff:.4f}")
+    if max_diff > tolerance:
+        raise AssertionError(f"ONNX reranker scores differ by {max_diff:.4f} (> {tolerance})")
+    # Cùng thứ tự trong từng nhóm query
+    for query in dict.fromkeys(q for q, _ in pairs):
+        rows = [i for i, (q, _) in enumerate(pairs) if q == query]
+        if list(np.argsort(-reference[rows])) != list(np.argsort(-quantized[rows])):
+            raise AssertionError(f"ONNX reranker changes ranking for query: {query}")
+    return max_diff
+
+
+if __name__ == "__main__":
+    export_onnx_reranker()
+    check_parity()
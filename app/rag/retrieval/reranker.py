@@ -1,9 +1,95 @@
-from typing import List, Any
-from sentence_transformers import CrossEncoder
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Any, Optional, Tuple
+from config import (
+    RERANKER_MODEL, RERANK_BATCH_SIZE, RERANK_MAX_DEPTH, RERANK_MAX_LENGTH, RERANK_CACHE_SIZE,
+    RERANKER_BACKEND,
+)
+from ..utils.embedding_cache import normalize_text
+
+
+def _chunk_id(doc) -> str:
+    """Point id của chunk (content-derived nên đổi khi nội dung đổi); fallback hash nội dung"""
+    point_id = doc.metadata.get("_id") if doc.metadata else None
+    if point_id is not None:
+        return str(point_id)
+    return hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()
+
+
+class ScoreCache:
+    """LRU (query đã chuẩn hóa, chunk id) -> cross-encoder score"""
+
+    def __init__(self, max_entries: int = RERANK_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._scores: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: List[Tuple[str, str]]) -> List[Optional[float]]:
+        with self._lock:
+            scores = []
+            for key in keys:
+                score = self._scores.get(key)
+                if score is not None:
+                    self._scores.move_to_end(key)
+                scores.append(score)
+            found = sum(score is not None for score in scores)
+            self.hits += found
+            self.misses += len(keys) - found
+            return scores
+
+    def put_many(self, items: List[Tuple[Tuple[str, str], float]]):
+        with self._lock:
+            for key, score in items:
+                self._scores[key] = score
+                self._scores.move_to_end(key)
+            while len(self._scores) > self.max_entries:
+                self._scores.popitem(last=False)
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._scores), "max_entries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / lookups, 4) if lookups else None}
+
 
 class CrossEncoderReranker:
-    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"):
-        self.reranker = CrossEncoder(model_name)
+    def __init__(self, model_name: str = RERANKER_MODEL,
+                 batch_size: int = RERANK_BATCH_SIZE,
+                 max_depth: int = RERANK_MAX_DEPTH,
+                 max_length: int = RERANK_MAX_LENGTH,
+                 cache_size: int = RERANK_CACHE_SIZE,
+                 backend: str = RERANKER_BACKEND):
+        # max_length: tokenizer cắt cặp (query, chunk) về token window của model
+        self.backend = backend
+        self.fallback_reason = None
+        self.reranker = self._load_model(model_name, max_length)
+        self.batch_size = batch_size
+        self.max_depth = max(1, max_depth)
+        self.score_cache = ScoreCache(cache_size) if cache_size else None
+
+    def _load_model(self, model_name: str, max_length: int):
+        if self.backend == "onnx":
+            try:
+                from .onnx_reranker import OnnxCrossEncoder
+                model = OnnxCrossEncoder(max_length=max_length)
+                print("✓ Reranker using onnx int8 backend")
+                return model
+            except Exception as e:
+                # Fallback làm rerank chậm hơn nhiều lần và kéo torch vào worker: phải thấy rõ trong log
+                self.fallback_reason = str(e)
+                self.backend = "torch"
+                print("!" * 80)
+                print(f"! WARNING: RERANKER_BACKEND='onnx' but the onnx reranker cannot be loaded: {e}")
+                print("! Falling back to the PyTorch CrossEncoder (much slower on CPU).")
+                print("! Install the extra (`uv sync --extra onnx`) and export the model with")
+                print("! `python -m rag.retrieval.onnx_reranker`.")
+                print("!" * 80)
+        from sentence_transformers import CrossEncoder
+        return CrossEncoder(model_name, max_length=max_length)
 
     def rerank(self, query: str, docs: List[Any], top_k: int = 10) -> List[Any]:
         """
@@ -13,32 +99,71 @@ class CrossEncoderReranker:
             docs: list of documents (langchain Document objects) 
             top_k: number of documents to return after reranking
         """
+        return [doc for doc, _ in self.rerank_with_scores(query, docs, top_k=top_k)]
+
+    def rerank_with_scores(self, query: str, docs: List[Any], top_k: int = 10) -> List[Tuple[Any, float]]:
+        """
+        Rerank documents and return (doc, cross-encoder score) pairs.
+        Chỉ `max_depth` candidates đầu được chấm điểm; nếu top_k lớn hơn, phần còn lại
+        nối sau theo thứ tự cũ với score thấp nhất đã chấm.
+        """
         if not docs:
             return []
 
         try:
-            # Prepare data for CrossEncoder: [(query, doc_text), ...]
-            pairs = [(query, doc.page_content) for doc in docs]
-
-            # Calculate relevance scores
-            scores = self.reranker.predict(pairs)
+            head, tail = docs[:self.max_depth], docs[self.max_depth:]
+            scores = self.score(query, head)
 
             # Combine scores with docs
-            scored = list(zip(docs, scores))
+            scored = [(doc, score) for doc, score in zip(head, scores)]
 
             # Sort by score descending
             scored.sort(key=lambda x: x[1], reverse=True)
+            if len(scored) < top_k and tail:
+                floor = scored[-1][1]
+                scored.extend((doc, floor) for doc in tail[:top_k - len(scored)])
 
             # Return top_k docs
-            reranked_docs = [doc for doc, score in scored[:top_k]]
+            reranked = scored[:top_k]
 
-            print(f"Reranking complete: selected {len(reranked_docs)} docs")
-            return reranked_docs
+            print(f"Reranking complete: selected {len(reranked)} docs")
+            return reranked
 
         except Exception as e:
             print(f"Error in reranking: {e}")
-            return docs[:top_k]
-        
+            return [(doc, 0.0) for doc in docs[:top_k]]
+
+    def score(self, query: str, docs: List[Any]) -> List[float]:
+        """Cross-encoder score cho từng doc; chỉ các cặp chưa có trong cache được đưa vào model"""
+        if self.score_cache is None:
+            return self._predict(query, docs)
+
+        normalized = normalize_text(query)
+        keys = [(normalized, _chunk_id(doc)) for doc in docs]
+        scores = self.score_cache.get_many(keys)
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            predicted = self._predict(query, [docs[i] for i in missing])
+            for i, score in zip(missing, predicted):
+                scores[i] = score
+            self.score_cache.put_many([(keys[i], scores[i]) for i in missing])
+        print(f"Rerank scores: {len(docs) - len(missing)} cached, {len(missing)} computed")
+        return scores
+
+    def _predict(self, query: str, docs: List[Any]) -> List[float]:
+        # Prepare data for CrossEncoder: [(query, doc_text), ...]
+        pairs = [(query, doc.page_content) for doc in docs]
+        scores = self.reranker.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        return [float(score) for score in scores]
+
+    def get_stats(self):
+        return {
+            "backend": self.backend,
+            "batch_size": self.batch_size,
+            "max_depth": self.max_depth,
+            "fallback_reason": self.fallback_reason,
+            "cache": self.score_cache.get_stats() if self.score_cache else None,
+        }
 
 
 # from typing import List, Union, Tuple
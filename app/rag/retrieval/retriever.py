@@ -1,9 +1,11 @@
-from typing import Dict, Any
-from models import get_llm, get_rag_prompt
+from typing import Dict, Any, Optional
+from models import get_rag_prompt
+from services import ServiceContainer, get_services
 
 class DocumentRetriever:
-    def __init__(self):
-        self.llm = get_llm()
+    def __init__(self, services: Optional[ServiceContainer] = None):
+        services = services or get_services()
+        self.llm = services.llm
         self.rag_prompt = get_rag_prompt()
 
     def get_llm_response(self, query: str, context: str) -> Dict[str, Any]:
@@ -1,31 +1,88 @@
-from rank_bm25 import BM25Okapi
+import threading
+import time
+from .filters import matches_filter
+from .inverted_index import InvertedIndex, Segment
 from ..utils.preprocessing import preprocess_text
 from ..utils.cache import CacheManager
+from config import METADATA_INDEX_FIELDS, BM25_SYNC_INTERVAL
 from typing import List, Tuple, Dict, Any, Optional
-import os
 
 class BM25Search:
     def __init__(self, cache_manager: Optional[CacheManager] = None):
         self.cache_manager = cache_manager or CacheManager()
-        self.bm25 = None
-        self.documents = []
-        # self._initialize_index()
+        self.index = InvertedIndex(on_add=self._persist_segment,
+                                   on_merge=self._persist_merge,
+                                   on_delete=self._persist_deletions,
+                                   allocate_ids=self.cache_manager.allocate_bm25_ids,
+                                   metadata_fields=METADATA_INDEX_FIELDS)
+        # Serialize ingestion với load cache / rebuild; journal ghi lại thay đổi trong lúc rebuild
+        self._lock = threading.Lock()
+        self._rebuild_journal: Optional[Dict[str, Any]] = None
+        # Lần cuối kiểm tra version của segment store dùng chung (xem sync)
+        self._checked_at = 0.0
+        self._in_sync = False
+        # Index được load từ cache / dựng lại từ Qdrant bởi IndexBootstrap
 
-    def _initialize_index(self):
+    @property
+    def bm25(self) -> Optional[InvertedIndex]:
+        """Index handle (None khi chưa có document nào)"""
+        return self.index if len(self.index) else None
+
+    @property
+    def document_count(self) -> int:
+        return len(self.index)
+
+    def load_cache(self) -> bool:
         """Initialize BM25 index from cache or prepare for new build"""
-        try:
-            print("Initializing BM25 index...")
-            self.bm25, self.documents = self.cache_manager.load_bm25_cache()
-            
-            if self.bm25 and self.documents:
-                print(f"✓ BM25 index loaded from cache with {len(self.documents)} documents")
-            else:
+        # Giữ lock: segment ingest ghi vào cache trong lúc load không bị reset làm mất
+        with self._lock:
+            try:
+                print("Initializing BM25 index...")
+                segments = self.cache_manager.load_bm25_segments()
+                self._in_sync = segments is not None
+                self._checked_at = time.monotonic()
+
+                if segments:
+                    self.index.reset(segments)
+                    print(f"✓ BM25 index loaded from cache with {self.document_count} documents")
+                    return True
                 print("! No valid cache found - will build new index when documents are added")
-                
-        except Exception as e:
-            print(f"! Error loading BM25 cache: {str(e)}")
-            self.bm25 = None
-            self.documents = []
+
+            except Exception as e:
+                print(f"! Error loading BM25 cache: {str(e)}")
+                self.index.reset()
+        return False
+
+    def sync(self, max_age: float = BM25_SYNC_INTERVAL) -> bool:
+        """
+        Áp các thay đổi mà worker khác đã ghi vào segment store dùng chung (segment mới,
+        merge, tombstone): chỉ đọc segment chưa có trong index, segment cũ chỉ áp lại tombstones.
+        Version của store được kiểm tra tối đa mỗi `max_age` giây (0 = kiểm tra ngay).
+        Trả về True nếu index local khớp store tại lần kiểm tra gần nhất.
+        """
+        now = time.monotonic()
+        if now - self._checked_at < max_age:
+            return self._in_sync
+        self._checked_at = now
+        stale = self.cache_manager.bm25_cache_stale()
+        if stale is None:
+            self._in_sync = False
+        elif not stale:
+            self._in_sync = True
+        else:
+            with self._lock:
+                if self._rebuild_journal is not None:
+                    # Đang dựng lại từ Qdrant: index chưa đầy đủ, không load đè
+                    self._in_sync = False
+                    return False
+                cached = {segment.segment_id: segment for segment in self.index.snapshot.segments}
+                segments = self.cache_manager.load_bm25_segments(cached)
+                self._in_sync = segments is not None
+                if segments is not None:
+                    self.index.reset(segments)
+                    print(f"✓ BM25 index synced from shared store "
+                          f"(version {self.cache_manager.bm25_cache_version}, {self.document_count} documents)")
+        return self._in_sync
 
     def build_index(self, documents: List[Any]):
         """Build BM25 index from documents"""
@@ -35,56 +92,41 @@ class BM25Search:
                 return
 
             print(f"Building BM25 index with {len(documents)} documents...")
-            self.documents = documents
-            
-            # Tokenize and build index
+            self.index.reset()
+            self.cache_manager.clear_cache()
+
+            # Tokenize and build index (một segment duy nhất, được cache qua on_add)
             tokenized_docs = [preprocess_text(doc.page_content) for doc in documents]
-            self.bm25 = BM25Okapi(tokenized_docs)
-            
-            # Try to cache
-            cache_success = self.cache_manager.save_bm25_cache(self.bm25, self.documents)
-            if cache_success:
-                print("✓ BM25 index built and cached successfully")
-            else:
-                print("! Warning: Index built but caching failed")
+            self.index.add_documents(documents, tokenized_docs)
+            print("✓ BM25 index built")
 
         except Exception as e:
             print(f"! Error building BM25 index: {str(e)}")
-            self.bm25 = None
-            self.documents = []
+            self.index.reset()
             raise e
 
-    def search(self, query: str, k: int = 10, 
+    def search(self, query: str, k: int = 10,
               metadata_filter: Optional[Dict] = None) -> List[Tuple[Any, float]]:
         """BM25 search with detailed logging"""
         try:
+            # Lấy segment / tombstone mà worker khác vừa ghi
+            self.sync()
             # print(f"\nBM25 Search:")
             print(f"Query: {query}")
             print(f"Index status: {'Available' if self.bm25 else 'Not initialized'}")
-            print(f"Documents: {len(self.documents)}")
+            print(f"Documents: {self.document_count}")
 
-            if not self.bm25 or not self.documents:
+            if not self.bm25:
                 print("! Error: BM25 index not initialized")
                 return []
 
             # Tokenize and search
             tokenized_query = preprocess_text(query)
             print(f"Tokenized query: {tokenized_query}")
-            
-            scores = self.bm25.get_scores(tokenized_query)
-            print(f"Got scores for {len(scores)} documents")
-            
-            # Apply scoring and filtering
-            scored_docs = []
-            for i, score in enumerate(scores):
-                if i < len(self.documents):
-                    doc = self.documents[i]
-                    if self._matches_filter(doc, metadata_filter):
-                        scored_docs.append((doc, float(score)))
-            
-            scored_docs.sort(key=lambda x: x[1], reverse=True)
-            results = scored_docs[:k]
-            
+
+            # Filter được resolve thành candidate mask trước khi chấm điểm
+            results = self.index.search(tokenized_query, k=k, metadata_filter=metadata_filter)
+
             print(f"✓ Returning {len(results)} results")
             return results
 
@@ -94,50 +136,88 @@ class BM25Search:
 
     def _matches_filter(self, doc: Any, metadata_filter: Optional[Dict]) -> bool:
         """Check if document matches metadata filter"""
-        if not metadata_filter:
-            return True
-        return all(doc.metadata.get(k) == v for k, v in metadata_filter.items())
-
-    # def clear_index(self):
-    #     """Clear BM25 index and cache"""
-    #     try:
-    #         print("Clearing BM25 index...")
-    #         self.bm25 = None
-    #         self.documents = []
-            
-    #         if self.cache_manager:
-    #             cache_cleared = self.cache_manager.clear_cache()
-    #             if cache_cleared:
-    #                 print("✓ BM25 index and cache cleared successfully")
-    #             else:
-    #                 print("! Warning: Failed to clear cache files")
-            
-    #     except Exception as e:
-    #         print(f"! Error clearing index: {str(e)}")
-    def clear_cache(self) -> bool:
+        return matches_filter(doc.metadata, metadata_filter)
+
+    def clear_index(self):
+        """Clear BM25 index and cache"""
         try:
-            self.client.delete("bm25_model")
-            self.client.delete("bm25_docs")
-            print("Redis cache cleared successfully")
-            return True
-        except Exception as e:
-            print(f"Error clearing Redis cache: {e}")
-            return False
+            print("Clearing BM25 index...")
+            self.index.reset()
+
+            if self.cache_manager:
+                cache_cleared = self.cache_manager.clear_cache()
+                if cache_cleared:
+                    print("✓ BM25 index and cache cleared successfully")
+                else:
+                    print("! Warning: Failed to clear cache")
 
+        except Exception as e:
+            print(f"! Error clearing index: {str(e)}")
 
     def get_status(self) -> Dict[str, Any]:
         """Get current status of BM25 index"""
+        snapshot = self.index.snapshot
         return {
             "initialized": self.bm25 is not None,
-            "document_count": len(self.documents),
-            "cache_files_exist": (
-                os.path.exists(self.cache_manager.bm25_cache_path),
-                os.path.exists(self.cache_manager.docs_cache_path)
-            )
+            "document_count": snapshot.doc_count,
+            "segment_count": len(snapshot.segments),
+            "deleted_count": sum(len(segment) - segment.live_count for segment in snapshot.segments),
+            "generation": snapshot.generation,
+            "store_version": self.cache_manager.bm25_cache_version,
+            "in_sync": self._in_sync,
         }
+
     def add_documents(self, documents):
-        self.documents.extend(documents)
-        tokenized = [doc.page_content.split() for doc in self.documents]
-        self.bm25 = BM25Okapi(tokenized)
-        # Lưu lại cache để lần sau load không bị mất
-        self.cache_manager.save_bm25_cache(self.bm25, self.documents)
\ No newline at end of file
+        """Thêm documents vào index: chỉ tokenize + ghi segment mới, không rebuild corpus"""
+        tokenized = [preprocess_text(doc.page_content) for doc in documents]
+        with self._lock:
+            if self._rebuild_journal is not None:
+                self._rebuild_journal["added"].update(doc.metadata.get("_id") for doc in documents)
+            self.index.add_documents(documents, tokenized)
+
+    def delete_documents(self, metadata_filter: Dict) -> int:
+        """Đánh dấu xóa (tombstone) các document khớp filter, ví dụ {"file_name": "a.pdf"}"""
+        with self._lock:
+            if self._rebuild_journal is not None:
+                self._rebuild_journal["deleted"].append(metadata_filter)
+            removed = self.index.delete(metadata_filter)
+        if removed:
+            print(f"✓ Tombstoned {removed} documents in BM25 index")
+        return removed
+
+    # Rebuild từ Qdrant chạy song song với ingestion (IndexBootstrap)
+    def begin_rebuild(self):
+        """Xóa index để dựng lại; từ đây ghi lại các _id được thêm và filter bị xóa"""
+        with self._lock:
+            self.clear_index()
+            self._rebuild_journal = {"added": set(), "deleted": []}
+
+    def add_rebuilt_documents(self, documents) -> int:
+        """
+        Thêm một batch scroll từ Qdrant, bỏ document mà ingestion đã thêm (trùng _id)
+        hoặc đã xóa kể từ begin_rebuild. Trả về số documents thực sự được thêm.
+        """
+        tokenized = [preprocess_text(doc.page_content) for doc in documents]
+        with self._lock:
+            journal = self._rebuild_journal or {"added": set(), "deleted": []}
+            keep = [i for i, doc in enumerate(documents)
+                    if doc.metadata.get("_id") not in journal["added"]
+                    and not any(matches_filter(doc.metadata, deleted) for deleted in journal["deleted"])]
+            if keep:
+                self.index.add_documents([documents[i] for i in keep], [tokenized[i] for i in keep])
+        return len(keep)
+
+    def end_rebuild(self):
+        with self._lock:
+            self._rebuild_journal = None
+
+    def _persist_segment(self, segment: Segment):
+        """Chỉ lưu segment mới vào cache"""
+        self.cache_manager.append_bm25_segment(segment)
+    def _persist_merge(self, merged_from: List[Segment], merged: Segment):
+        """Persist a background merge: ghi segment mới, xoá các segment cũ"""
+        self.cache_manager.replace_bm25_segments(merged_from, merged)
+
+    def _persist_deletions(self, segments: List[Segment]):
+        """Chỉ ghi lại tombstone bitmap, không ghi lại segment"""
+        self.cache_manager.update_bm25_deletions(segments)
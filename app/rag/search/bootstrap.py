@@ -0,0 +1,98 @@
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from .bm25 import BM25Search
+from .vector import VectorSearch
+
+
+class IndexBootstrap:
+    """
+    Dựng BM25 index từ Qdrant trong background thread.
+    Documents được scroll theo batch và đưa thẳng vào index (mỗi batch một segment),
+    nên memory bị giới hạn theo batch size và worker phục vụ request ngay từ đầu.
+    Ingestion chạy song song vẫn ghi vào index: batch scroll bỏ các document
+    ingestion đã thêm hoặc đã xóa trong lúc rebuild (xem BM25Search.begin_rebuild).
+    """
+
+    def __init__(self, bm25_search: BM25Search, vector_search: VectorSearch):
+        self.bm25_search = bm25_search
+        self.vector_search = vector_search
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._state: Dict[str, Any] = {"status": "idle", "loaded": 0, "total": 0,
+                                       "started_at": None, "finished_at": None, "error": None}
+
+    @property
+    def ready(self) -> bool:
+        return self._state["status"] == "ready"
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def get_status(self) -> Dict[str, Any]:
+        status = dict(self._state)
+        if status["total"]:
+            status["progress"] = round(min(status["loaded"] / status["total"], 1.0), 4)
+        return status
+
+    def start(self, force: bool = False) -> bool:
+        """
+        Start the bootstrap in the background.
+        Nếu cache BM25 khớp số points trong Qdrant thì dùng cache, không cần scroll.
+        """
+        with self._lock:
+            if self.running:
+                return False
+            self._state.update(status="loading", loaded=0, total=0, error=None,
+                               started_at=time.time(), finished_at=None)
+            self._thread = threading.Thread(target=self._run, args=(force,),
+                                            name="bm25-bootstrap", daemon=True)
+            self._thread.start()
+            return True
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        return self.ready
+
+    def _run(self, force: bool):
+        try:
+            collection_info = self.vector_search.vector_manager.get_collection_info()
+            if collection_info is None:
+                raise RuntimeError("Cannot get collection info")
+            total = collection_info.get("points_count") or 0
+            self._state["total"] = total
+
+            if not force:
+                self.bm25_search.load_cache()
+                if total and self.bm25_search.document_count == total:
+                    self._state["loaded"] = total
+                    self._finish("ready")
+                    print(f"✓ BM25 index ready from cache ({total} documents)")
+                    return
+
+            if not total:
+                print("No documents found in vector store")
+            else:
+                print(f"Bootstrapping BM25 index from {total} points in Qdrant...")
+            # Vẫn scroll khi collection rỗng: points ingest sau lúc đếm không bị clear mất
+            self.bm25_search.begin_rebuild()
+            try:
+                for batch in self.vector_search.iter_documents():
+                    self.bm25_search.add_rebuilt_documents(batch)
+                    self._state["loaded"] += len(batch)
+                    print(f"BM25 bootstrap progress: {self._state['loaded']}/{total}")
+            finally:
+                self.bm25_search.end_rebuild()
+            self._finish("ready")
+            print(f"✓ BM25 index bootstrapped with {self._state['loaded']} documents")
+        except Exception as e:
+            print(f"! Error bootstrapping BM25 index: {e}")
+            self._state["error"] = str(e)
+            self._finish("failed")
+
+    def _finish(self, status: str):
+        self._state.update(status=status, finished_at=time.time())
@@ -0,0 +1,97 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from qdrant_client.models import (
+    FieldCondition, Filter, HasIdCondition, IsEmptyCondition, MatchAny, MatchValue, PayloadField, Range,
+)
+
+# Các toán tử range hỗ trợ trong metadata_filter, ví dụ {"page": {"gte": 2, "lte": 5}}
+RANGE_OPERATORS = ("gt", "gte", "lt", "lte")
+
+
+def is_range(condition: Any) -> bool:
+    return isinstance(condition, dict) and bool(condition) and all(op in RANGE_OPERATORS for op in condition)
+
+
+def is_any_of(condition: Any) -> bool:
+    return isinstance(condition, (list, tuple, set))
+
+
+def has_null(condition: Any) -> bool:
+    """Điều kiện None (hoặc `in` list chứa None): khớp field thiếu / null / list rỗng"""
+    return condition is None or (is_any_of(condition) and None in condition)
+
+
+def matches_condition(value: Any, condition: Any) -> bool:
+    """Evaluate a single field condition (equality, `in` list, range or None)"""
+    if condition is None:
+        # Giống IsEmptyCondition của Qdrant
+        return value is None or value == []
+    if is_range(condition):
+        if value is None or isinstance(value, bool) or not isinstance(value, (int, float)):
+            return False
+        return (("gt" not in condition or value > condition["gt"])
+                and ("gte" not in condition or value >= condition["gte"])
+                and ("lt" not in condition or value < condition["lt"])
+                and ("lte" not in condition or value <= condition["lte"]))
+    if is_any_of(condition):
+        # List rỗng không khớp document nào
+        return any(matches_condition(value, option) for option in condition)
+    return value == condition
+
+
+def matches_filter(metadata: Dict[str, Any], metadata_filter: Optional[Dict]) -> bool:
+    """Check if a metadata dict matches every condition of the filter"""
+    if not metadata_filter:
+        return True
+    return all(matches_condition(metadata.get(field), condition)
+               for field, condition in metadata_filter.items())
+
+
+def split_filter(metadata_filter: Optional[Dict],
+                 indexed_fields: Iterable[str]) -> Tuple[Dict, Dict]:
+    """
+    Split a filter into (conditions resolvable by the metadata index, residual conditions).
+    Điều kiện None luôn vào residual: metadata index không lưu giá trị null.
+    """
+    indexed, residual = {}, {}
+    indexed_fields = set(indexed_fields)
+    for field, condition in (metadata_filter or {}).items():
+        if field in indexed_fields and not has_null(condition):
+            indexed[field] = condition
+        else:
+            residual[field] = condition
+    return indexed, residual
+
+
+def _qdrant_condition(key: str, condition: Any) -> Optional[Any]:
+    """Translate one field condition into a Qdrant condition"""
+    if condition is None:
+        return IsEmptyCondition(is_empty=PayloadField(key=key))
+    if is_range(condition):
+        return FieldCondition(key=key, range=Range(**condition))
+    if is_any_of(condition):
+        values = list(condition)
+        if not values:
+            # Filter(should=[]) của Qdrant khớp mọi point; has_id rỗng thì không khớp point nào
+            return HasIdCondition(has_id=[])
+        if (all(isinstance(v, str) for v in values)
+                or all(isinstance(v, int) and not isinstance(v, bool) for v in values)):
+            return FieldCondition(key=key, match=MatchAny(any=values))
+        # Danh sách trộn kiểu: OR của từng giá trị
+        return Filter(should=[_qdrant_condition(key, value) for value in values])
+    if isinstance(condition, float):
+        # MatchValue không hỗ trợ float -> range một điểm
+        return FieldCondition(key=key, range=Range(gte=condition, lte=condition))
+    return FieldCondition(key=key, match=MatchValue(value=condition))
+
+
+def to_qdrant_filter(metadata_filter: Optional[Dict], key_prefix: str = "metadata.") -> Optional[Filter]:
+    """
+    Translate our metadata_filter dict (equality, `in` lists, ranges) into a Qdrant Filter.
+    Mọi điều kiện đều phải khớp (must), giống matches_filter.
+    """
+    if not metadata_filter:
+        return None
+    must: List[Any] = [_qdrant_condition(f"{key_prefix}{field}", condition)
+                       for field, condition in metadata_filter.items()]
+    return Filter(must=must)
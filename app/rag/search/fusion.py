@@ -0,0 +1,125 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import HYBRID_FUSION, HYBRID_RRF_K
+
+Results = List[Tuple[Any, float]]
+
+
+def doc_key(doc) -> Any:
+    """
+    Khóa dedup của candidate: Qdrant point id (metadata["_id"]), có ở cả BM25 lẫn vector leg.
+    Fallback về page_content cho document không có id (không hash cả metadata dict).
+    """
+    point_id = doc.metadata.get("_id") if doc.metadata else None
+    return str(point_id) if point_id is not None else doc.page_content
+
+
+def _align(legs: Sequence[Results]) -> Tuple[List[Any], np.ndarray, np.ndarray]:
+    """
+    Gộp các leg theo id. Trả về (docs, scores, ranks) với scores/ranks shape (n_legs, n_docs);
+    candidate không có trong một leg có score NaN và rank inf.
+    """
+    index: Dict[Any, int] = {}
+    docs: List[Any] = []
+    positions = []
+    for results in legs:
+        leg_positions = np.empty(len(results), dtype=np.int64)
+        for i, (doc, _) in enumerate(results):
+            key = doc_key(doc)
+            position = index.get(key)
+            if position is None:
+                position = index[key] = len(docs)
+                docs.append(doc)
+            leg_positions[i] = position
+        positions.append(leg_positions)
+
+    scores = np.full((len(legs), len(docs)), np.nan)
+    ranks = np.full((len(legs), len(docs)), np.inf)
+    for leg, (results, leg_positions) in enumerate(zip(legs, positions)):
+        if not len(results):
+            continue
+        leg_scores = np.fromiter((score for _, score in results), dtype=np.float64, count=len(results))
+        # Rank 1-based theo score giảm dần (stable, không giả định leg đã sort)
+        order = np.argsort(-leg_scores, kind="stable")
+        leg_ranks = np.empty(len(results))
+        leg_ranks[order] = np.arange(1, len(results) + 1)
+        # Cùng id xuất hiện nhiều lần trong một leg: giữ lần tốt nhất
+        # (ghi theo thứ tự rank giảm dần để lần ghi cuối là rank tốt nhất)
+        reverse = order[::-1]
+        scores[leg, leg_positions[reverse]] = leg_scores[reverse]
+        ranks[leg, leg_positions[reverse]] = leg_ranks[reverse]
+    return docs, scores, ranks
+
+
+def _fill_missing(normalized: np.ndarray, present: np.ndarray) -> np.ndarray:
+    """Candidate thiếu trong một leg nhận giá trị thấp nhất của leg đó (không bao giờ hơn candidate có mặt)"""
+    floor = np.where(present.any(axis=1), np.min(np.where(present, normalized, np.inf), axis=1), 0.0)
+    return np.where(present, normalized, floor[:, None])
+
+
+def rrf(scores: np.ndarray, ranks: np.ndarray, weights: np.ndarray, rrf_k: int = HYBRID_RRF_K) -> np.ndarray:
+    """Reciprocal Rank Fusion: sum_w w / (rrf_k + rank); chỉ dùng rank nên không phụ thuộc thang điểm"""
+    return (weights[:, None] / (rrf_k + ranks)).sum(axis=0)
+
+
+def min_max(scores: np.ndarray, ranks: np.ndarray, weights: np.ndarray, **_) -> np.ndarray:
+    """Min-max mỗi leg về [0, 1] rồi cộng có trọng số; leg toàn điểm bằng nhau -> 1.0"""
+    present = ~np.isnan(scores)
+    low = np.min(np.where(present, scores, np.inf), axis=1, keepdims=True)
+    high = np.max(np.where(present, scores, -np.inf), axis=1, keepdims=True)
+    span = high - low
+    with np.errstate(invalid="ignore", divide="ignore"):
+        normalized = np.where(span > 0, (scores - low) / np.where(span > 0, span, 1.0), 1.0)
+    normalized = np.where(present, normalized, 0.0)
+    return (weights[:, None] * normalized).sum(axis=0)
+
+
+def z_score(scores: np.ndarray, ranks: np.ndarray, weights: np.ndarray, **_) -> np.ndarray:
+    """Chuẩn hóa z-score mỗi leg (ổn định hơn min-max khi có outlier) rồi cộng có trọng số"""
+    present = ~np.isnan(scores)
+    counts = np.maximum(present.sum(axis=1, keepdims=True), 1)
+    filled = np.where(present, scores, 0.0)
+    mean = filled.sum(axis=1, keepdims=True) / counts
+    std = np.sqrt((np.where(present, scores - mean, 0.0) ** 2).sum(axis=1, keepdims=True) / counts)
+    normalized = np.where(std > 0, (filled - mean) / np.where(std > 0, std, 1.0), 0.0)
+    return (weights[:, None] * _fill_missing(normalized, present)).sum(axis=0)
+
+
+def weighted_sum(scores: np.ndarray, ranks: np.ndarray, weights: np.ndarray, **_) -> np.ndarray:
+    """Cộng điểm gốc có trọng số (các leg phải cùng thang điểm); thiếu = 0"""
+    return (weights[:, None] * np.nan_to_num(scores, nan=0.0)).sum(axis=0)
+
+
+FUSION_STRATEGIES: Dict[str, Callable[..., np.ndarray]] = {
+    "rrf": rrf,
+    "minmax": min_max,
+    "zscore": z_score,
+    "weighted": weighted_sum,
+}
+
+
+def fuse(legs: Sequence[Results], weights: Sequence[float], strategy: Optional[str] = None,
+         k: Optional[int] = None, rrf_k: int = HYBRID_RRF_K) -> Results:
+    """
+    Gộp kết quả của nhiều leg (list (doc, score)) thành một list (doc, fused_score)
+    sắp xếp giảm dần, dedup theo point id.
+    """
+    strategy = strategy or HYBRID_FUSION
+    if strategy not in FUSION_STRATEGIES:
+        raise ValueError(f"Unknown fusion strategy: {strategy}")
+    if len(weights) != len(legs):
+        raise ValueError("weights must have one entry per leg")
+
+    docs, scores, ranks = _align(legs)
+    if not docs or (k is not None and k <= 0):
+        return []
+    fused = FUSION_STRATEGIES[strategy](scores, ranks, np.asarray(weights, dtype=np.float64), rrf_k=rrf_k)
+
+    if k is not None and k < len(docs):
+        top = np.argpartition(-fused, k - 1)[:k]
+        top = top[np.argsort(-fused[top], kind="stable")]
+    else:
+        top = np.argsort(-fused, kind="stable")
+    return [(docs[i], float(fused[i])) for i in top]
@@ -1,11 +1,38 @@
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor, TimeoutError as FutureTimeout
 from typing import List, Tuple, Dict, Any, Optional
+from config import (
+    HYBRID_BACKEND, HYBRID_BM25_TIMEOUT, HYBRID_VECTOR_TIMEOUT, HYBRID_SEARCH_WORKERS, HYBRID_FUSION,
+    HYBRID_ABANDONED_LEGS,
+)
 from .bm25 import BM25Search
+from .fusion import FUSION_STRATEGIES, doc_key, fuse
 from .vector import VectorSearch
 
 class HybridSearch:
-    def __init__(self, bm25_search: BM25Search, vector_search: VectorSearch):
+    def __init__(self, bm25_search: BM25Search, vector_search: VectorSearch,
+                 native=None, backend: str = HYBRID_BACKEND,
+                 executor: Optional[Executor] = None,
+                 bm25_timeout: float = HYBRID_BM25_TIMEOUT,
+                 vector_timeout: float = HYBRID_VECTOR_TIMEOUT):
         self.bm25_search = bm25_search
         self.vector_search = vector_search
+        # Backend "qdrant": QdrantHybridSearch (sparse + dense, fusion phía server)
+        self.native = native
+        self.backend = backend
+        # BM25 (CPU) và vector (embed + Qdrant round trip) chạy song song trên pool dùng chung
+        self.executor = executor or ThreadPoolExecutor(max_workers=HYBRID_SEARCH_WORKERS,
+                                                       thread_name_prefix="search")
+        self.bm25_timeout = bm25_timeout
+        self.vector_timeout = vector_timeout
+        # Số leg đã quá hạn nhưng thread vẫn đang chạy
+        self._abandoned = 0
+        self._abandoned_lock = threading.Lock()
+
+    @property
+    def uses_native(self) -> bool:
+        return self.backend == "qdrant" and self.native is not None and self.native.available
 
     def search(self,
               query: str,
@@ -13,7 +40,8 @@ class HybridSearch:
               alpha: float = 0.5,
               metadata_filter: Optional[Dict] = None,
               bm25_k: Optional[int] = None,
-              vector_k: Optional[int] = None) -> List[Tuple[Any, float]]:
+              vector_k: Optional[int] = None,
+              fusion: Optional[str] = None) -> List[Tuple[Any, float]]:
         """
         Hybrid search combining BM25 and vector search
         Args:
@@ -23,76 +51,124 @@ class HybridSearch:
             metadata_filter: Optional metadata filter
             bm25_k: Number of results from BM25 (default: k*2)
             vector_k: Number of results from vector search (default: k*2)
+            fusion: "rrf" | "minmax" | "zscore" | "weighted" (default: HYBRID_FUSION)
+        """
+        return self.search_with_info(query, k=k, alpha=alpha, metadata_filter=metadata_filter,
+                                     bm25_k=bm25_k, vector_k=vector_k, fusion=fusion)["results"]
+
+    def search_with_info(self,
+                         query: str,
+                         k: int = 10,
+                         alpha: float = 0.5,
+                         metadata_filter: Optional[Dict] = None,
+                         bm25_k: Optional[int] = None,
+                         vector_k: Optional[int] = None,
+                         fusion: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Như search(), kèm trạng thái từng leg:
+        {"results": [...], "degraded": bool, "legs": {"bm25": {...}, "vector": {...}},
+         "leg_ids": {"bm25": [id, ...], "vector": [id, ...]}, "fusion": str, "weights": (w_bm25, w_vector)}.
+        degraded = True khi một leg timeout / lỗi và kết quả chỉ đến từ leg còn lại.
+        Backend "qdrant" luôn fusion RRF phía server nên bỏ qua `fusion`: fusion = "native",
+        legs / leg_ids rỗng và weights chỉ đánh dấu leg nào được dùng (RRF không có trọng số).
         """
+        if fusion is not None and fusion not in FUSION_STRATEGIES:
+            raise ValueError(f"Unknown fusion strategy: {fusion}")
+        if self.uses_native:
+            info = {"legs": {}, "leg_ids": {}, "fusion": "native",
+                    "weights": (float(alpha < 1.0), float(alpha > 0.0))}
+            try:
+                results = self.native.search(query, k=k, alpha=alpha, metadata_filter=metadata_filter,
+                                             bm25_k=bm25_k, vector_k=vector_k)
+                return {"results": results, "degraded": False, **info}
+            except Exception as e:
+                print(f"Error in qdrant hybrid search: {e}")
+                return {"results": [], "degraded": True, **info}
+
         # Default values
         if bm25_k is None:
             bm25_k = max(k * 2, 20)
         if vector_k is None:
             vector_k = max(k * 2, 20)
 
+        fusion = fusion or HYBRID_FUSION
+        weights = (1 - alpha, alpha)
         try:
-            # Get results from both methods
-            bm25_results = self.bm25_search.search(query, bm25_k, metadata_filter)
-            vector_results = self.vector_search.search(query, vector_k, metadata_filter)
+            # Cả hai leg bắt đầu cùng lúc: latency = max của hai leg, không phải tổng
+            started = time.perf_counter()
+            futures = {
+                "bm25": (self.executor.submit(self._timed, self.bm25_search.search,
+                                              query, bm25_k, metadata_filter), self.bm25_timeout),
+                # Vector leg tự dừng theo budget (embed + timeout của Qdrant client)
+                "vector": (self.executor.submit(self._timed, self.vector_search.search_within,
+                                                query, vector_k, metadata_filter, self.vector_timeout),
+                           self.vector_timeout),
+            }
+            legs = {name: self._collect(name, future, timeout, started)
+                    for name, (future, timeout) in futures.items()}
+            bm25_results = legs["bm25"].pop("results")
+            vector_results = legs["vector"].pop("results")
+            degraded = any(leg["status"] != "ok" for leg in legs.values())
 
             print(f"BM25 found {len(bm25_results)} results")
             print(f"Vector found {len(vector_results)} results")
 
-            # Normalize scores
-            combined_scores = self._combine_scores(bm25_results, vector_results, alpha)
-
-            # Sort by hybrid score
-            final_results = [(info['doc'], info['hybrid_score']) 
-                           for info in combined_scores.values()]
-            final_results.sort(key=lambda x: x[1], reverse=True)
+            # Gộp theo point id; alpha là trọng số của vector leg
+            final_results = fuse([bm25_results, vector_results], weights=weights,
+                                 strategy=fusion, k=k)
 
-            print(f"Hybrid search returning top {min(k, len(final_results))} results")
-            return final_results[:k]
+            print(f"Hybrid search returning top {len(final_results)} results"
+                  + (" (degraded)" if degraded else ""))
+            # Thứ tự id của từng leg: cascade reranker đo mức đồng thuận giữa hai leg
+            leg_ids = {"bm25": [doc_key(doc) for doc, _ in bm25_results],
+                       "vector": [doc_key(doc) for doc, _ in vector_results]}
+            return {"results": final_results, "degraded": degraded, "legs": legs, "leg_ids": leg_ids,
+                    "fusion": fusion, "weights": weights}
 
         except Exception as e:
             print(f"Error in hybrid search: {e}")
-            return []
+            return {"results": [], "degraded": True, "legs": {}, "leg_ids": {},
+                    "fusion": fusion, "weights": weights}
 
-    def _combine_scores(self, bm25_results, vector_results, alpha):
-        """Combine and normalize BM25 and vector scores"""
-        combined_scores = {}
+    @staticmethod
+    def _timed(func, *args):
+        leg_started = time.perf_counter()
+        results = func(*args)
+        return results, time.perf_counter() - leg_started
 
-        # Normalize BM25 scores
-        bm25_scores = [score for _, score in bm25_results]
-        if bm25_scores:
-            max_bm25 = max(bm25_scores)
-            min_bm25 = min(bm25_scores)
-            if max_bm25 > min_bm25:
-                normalized_bm25 = [(doc, (score - min_bm25) / (max_bm25 - min_bm25))
-                                 for doc, score in bm25_results]
-            else:
-                normalized_bm25 = bm25_results
-        else:
-            normalized_bm25 = []
-
-        # Add normalized scores to combined dict
-        for doc, score in normalized_bm25:
-            doc_key = (doc.page_content, str(doc.metadata))
-            combined_scores[doc_key] = {
-                'doc': doc,
-                'bm25_score': score,
-                'vector_score': 0.0
-            }
+    def _collect(self, name: str, future, timeout: float, started: float) -> Dict[str, Any]:
+        """Chờ một leg trong phần còn lại của timeout (tính từ lúc submit)"""
+        remaining = max(0.0, timeout - (time.perf_counter() - started))
+        try:
+            results, seconds = future.result(timeout=remaining)
+            return {"results": results, "status": "ok", "seconds": round(seconds, 4)}
+        except FutureTimeout:
+            print(f"! {name} search timed out after {timeout}s, returning partial results")
+            self._abandon(future)
+            return {"results": [], "status": "timeout", "seconds": timeout}
+        except Exception as e:
+            print(f"! {name} search failed: {e}")
+            return {"results": [], "status": "error", "error": str(e)}
 
-        # Add vector scores
-        for doc, score in vector_results:
-            doc_key = (doc.page_content, str(doc.metadata))
-            if doc_key in combined_scores:
-                combined_scores[doc_key]['vector_score'] = score
-            else:
-                combined_scores[doc_key] = {
-                    'doc': doc,
-                    'bm25_score': 0.0,
-                    'vector_score': score
-                }
+    def _abandon(self, future):
+        """
+        future.cancel() không dừng được leg đang chạy: thread vẫn bị chiếm tới khi leg xong.
+        Đếm các leg này để biết khi nào pool (HYBRID_ABANDONED_LEGS thread dự phòng) bị dùng hết.
+        """
+        if future.cancel():
+            return
+        with self._abandoned_lock:
+            self._abandoned += 1
+            abandoned = self._abandoned
+        future.add_done_callback(self._release_abandoned)
+        if abandoned > HYBRID_ABANDONED_LEGS:
+            print(f"! {abandoned} timed-out search legs still running; new searches may queue")
 
-        # Calculate hybrid scores
-        for info in combined_scores.values():
-            info['hybrid_score'] = (1 - alpha) * info['bm25_score'] + alpha * info['vector_score']
+    def _release_abandoned(self, future):
+        with self._abandoned_lock:
+            self._abandoned -= 1
 
-        return combined_scores
\ No newline at end of file
+    @property
+    def abandoned_legs(self) -> int:
+        with self._abandoned_lock:
+            return self._abandoned
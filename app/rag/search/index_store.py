@@ -0,0 +1,486 @@
+import base64
+import fcntl
+import json
+import mmap
+import os
+import struct
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+from langchain.schema import Document
+from redis.exceptions import WatchError
+
+from .inverted_index import Segment
+
+# Binary segment format:
+#   MAGIC | version (u16) | header length (u32) | header JSON | padding | array blobs
+# Header mô tả vị trí (offset, dtype, shape) của từng array, mọi blob được align 8 byte
+# để np.frombuffer có thể đọc trực tiếp từ mmap mà không copy.
+MAGIC = b"BM25SEG\0"
+FORMAT_VERSION = 1
+_PREFIX = struct.Struct("<8sHI")
+_ALIGN = 8
+
+
+class DocumentColumn(Sequence):
+    """Lazy list of Documents decoded from a segment buffer (chỉ decode khi được truy cập)"""
+
+    def __init__(self, content: np.ndarray, content_offsets: np.ndarray,
+                 metadata: np.ndarray, metadata_offsets: np.ndarray):
+        self._content = content
+        self._content_offsets = content_offsets
+        self._metadata = metadata
+        self._metadata_offsets = metadata_offsets
+
+    def __len__(self) -> int:
+        return len(self._content_offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        start, end = self._content_offsets[index], self._content_offsets[index + 1]
+        page_content = self._content[start:end].tobytes().decode("utf-8")
+        start, end = self._metadata_offsets[index], self._metadata_offsets[index + 1]
+        metadata = json.loads(self._metadata[start:end].tobytes().decode("utf-8"))
+        return Document(page_content=page_content, metadata=metadata)
+
+    def __iter__(self) -> Iterator[Document]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+def _encode_strings(values: Sequence[str]):
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def encode_deleted(segment: Segment) -> Optional[str]:
+    """Tombstones của segment dạng bitmap (packbits + base64), lưu trong manifest"""
+    if segment.deleted is None:
+        return None
+    return base64.b64encode(np.packbits(segment.deleted).tobytes()).decode("ascii")
+
+
+def apply_deleted(segment: Segment, encoded: Optional[str]) -> Segment:
+    if not encoded:
+        return segment
+    bits = np.frombuffer(base64.b64decode(encoded), dtype=np.uint8)
+    return segment.with_deletions(np.unpackbits(bits, count=len(segment)).astype(bool))
+
+
+def encode_segment(segment: Segment) -> bytes:
+    """Serialize a segment to the versioned binary format"""
+    arrays: Dict[str, np.ndarray] = {
+        "doc_ids": segment.doc_ids.astype(np.int64, copy=False),
+        "doc_lens": segment.doc_lens.astype(np.float32, copy=False),
+        "tf.indptr": segment.tf.indptr,
+        "tf.indices": segment.tf.indices,
+        "tf.data": segment.tf.data.astype(np.float32, copy=False),
+    }
+    arrays["terms"], arrays["terms.offsets"] = _encode_strings(segment.terms)
+    arrays["content"], arrays["content.offsets"] = _encode_strings(
+        [doc.page_content for doc in segment.documents])
+    arrays["metadata"], arrays["metadata.offsets"] = _encode_strings(
+        [json.dumps(doc.metadata, ensure_ascii=False, default=str) for doc in segment.documents])
+
+    keyword_values: Dict[str, List[Any]] = {}
+    for field, postings in segment.keywords.items():
+        values = list(postings)
+        keyword_values[field] = values
+        ids = [postings[value] for value in values]
+        offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum([len(part) for part in ids], out=offsets[1:])
+        arrays[f"kw.{field}.ids"] = np.concatenate(ids).astype(np.int32, copy=False)
+        arrays[f"kw.{field}.offsets"] = offsets
+    for field, column in segment.columns.items():
+        arrays[f"col.{field}"] = column.astype(np.float64, copy=False)
+
+    layout, blobs, offset = {}, [], 0
+    for name, array in arrays.items():
+        data = np.ascontiguousarray(array).tobytes()
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape),
+                        "offset": offset, "nbytes": len(data)}
+        padding = (-len(data)) % _ALIGN
+        blobs.append(data + b"\0" * padding)
+        offset += len(data) + padding
+
+    header = json.dumps({
+        "segment_id": segment.segment_id,
+        "doc_count": len(segment),
+        "tf_shape": list(segment.tf.shape),
+        "keyword_values": keyword_values,
+        "arrays": layout,
+    }, ensure_ascii=False).encode("utf-8")
+    header += b" " * ((-(_PREFIX.size + len(header))) % _ALIGN)
+    return _PREFIX.pack(MAGIC, FORMAT_VERSION, len(header)) + header + b"".join(blobs)
+
+
+def decode_segment(buffer) -> Segment:
+    """Load a segment from bytes or an mmap; arrays are zero-copy views of the buffer"""
+    magic, version, header_len = _PREFIX.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a BM25 segment")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported BM25 segment format version {version}")
+    header = json.loads(bytes(buffer[_PREFIX.size:_PREFIX.size + header_len]).decode("utf-8"))
+    base = _PREFIX.size + header_len
+
+    def array(name: str) -> np.ndarray:
+        spec = header["arrays"][name]
+        dtype = np.dtype(spec["dtype"])
+        count = spec["nbytes"] // dtype.itemsize
+        return np.frombuffer(buffer, dtype=dtype, count=count,
+                             offset=base + spec["offset"]).reshape(spec["shape"])
+
+    def strings(name: str) -> List[str]:
+        data, offsets = array(name), array(f"{name}.offsets")
+        raw = data.tobytes()
+        return [raw[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+    tf = sparse.csr_matrix(
+        (array("tf.data"), array("tf.indices"), array("tf.indptr")),
+        shape=tuple(header["tf_shape"]),
+    )
+    documents = DocumentColumn(array("content"), array("content.offsets"),
+                               array("metadata"), array("metadata.offsets"))
+
+    keywords = {}
+    for field, values in header["keyword_values"].items():
+        ids, offsets = array(f"kw.{field}.ids"), array(f"kw.{field}.offsets")
+        keywords[field] = {value: ids[offsets[i]:offsets[i + 1]] for i, value in enumerate(values)}
+    columns = {name[len("col."):]: array(name) for name in header["arrays"] if name.startswith("col.")}
+
+    return Segment(header["segment_id"], array("doc_ids"), documents, array("doc_lens"),
+                   strings("terms"), tf, keywords, columns)
+
+
+class VersionedStore:
+    """
+    Version tăng sau mỗi lần ghi của bất kỳ process nào. `local_version` là version mà
+    index trong process này đang phản ánh: ghi của chính process giữ nó đồng bộ, còn ghi
+    của process khác làm store "stale" và index cần load lại (BM25Search.sync).
+    """
+
+    local_version: Optional[int] = None
+
+    def current_version(self) -> int:
+        raise NotImplementedError
+
+    def is_stale(self) -> bool:
+        return self.local_version is None or self.current_version() != self.local_version
+
+    def _written(self, version) -> None:
+        """Sau một lần ghi: còn đồng bộ chỉ khi không có process nào ghi xen giữa"""
+        version = int(version)
+        if self.local_version is not None and version == self.local_version + 1:
+            self.local_version = version
+
+
+def _reuse(cached: Optional[Dict[int, Segment]], segment_id) -> Optional[Segment]:
+    """Segment đã có trong index local (segment bất biến, chỉ tombstone thay đổi)"""
+    return cached.get(int(segment_id)) if cached else None
+
+
+class RedisSegmentStore(VersionedStore):
+    """
+    Segments lưu trong Redis, mỗi segment chia thành nhiều key <= chunk_size bytes.
+    Manifest là một hash: segment_id -> {chunks, first_doc_id, deleted}; ingest chỉ ghi segment mới,
+    xóa document chỉ ghi lại tombstone bitmap trong manifest.
+    Nhiều worker có thể ghi chung: segment id / doc id được cấp bằng INCR, các thay đổi
+    manifest dựa trên trạng thái hiện tại chạy trong WATCH / MULTI, và mọi lần ghi tăng
+    `{prefix}:version` để các worker khác biết cần load lại.
+    """
+
+    def __init__(self, client, prefix: str = "bm25:v1", chunk_size: int = 4 * 1024 * 1024):
+        self.client = client
+        self.prefix = prefix
+        self.chunk_size = chunk_size
+        self.manifest_key = f"{prefix}:manifest"
+        # Counter không bị xóa khi clear(): id đã cấp không bao giờ được dùng lại
+        self.segment_counter_key = f"{prefix}:next_segment_id"
+        self.doc_counter_key = f"{prefix}:next_doc_id"
+        self.version_key = f"{prefix}:version"
+
+    def current_version(self) -> int:
+        return int(self.client.get(self.version_key) or 0)
+
+    def allocate_ids(self, doc_count: int, min_segment_id: int = 0, min_doc_id: int = 0) -> Tuple[int, int]:
+        """
+        Cấp một segment id và dải `doc_count` doc id liên tiếp, duy nhất giữa mọi process.
+        Counter được nâng lên ít nhất bằng id mà index local đã thấy (manifest cũ, load từ cache).
+        """
+        while True:
+            pipe = self.client.pipeline()
+            pipe.incr(self.segment_counter_key)
+            pipe.incrby(self.doc_counter_key, doc_count)
+            segment_end, doc_end = pipe.execute()
+            segment_id, first_doc_id = int(segment_end) - 1, int(doc_end) - doc_count
+            if segment_id >= min_segment_id and first_doc_id >= min_doc_id:
+                return segment_id, first_doc_id
+            self._raise_counters(min_segment_id, min_doc_id)
+
+    def _raise_counters(self, min_segment_id: int, min_doc_id: int):
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(self.segment_counter_key, self.doc_counter_key)
+                    next_segment, next_doc = pipe.mget(self.segment_counter_key, self.doc_counter_key)
+                    pipe.multi()
+                    if int(next_segment or 0) < min_segment_id:
+                        pipe.set(self.segment_counter_key, min_segment_id)
+                    if int(next_doc or 0) < min_doc_id:
+                        pipe.set(self.doc_counter_key, min_doc_id)
+                    pipe.execute()
+                    return
+                except WatchError:
+                    continue
+
+    def _transaction(self, apply):
+        """
+        Chạy apply(pipe, manifest) trong WATCH manifest: nếu process khác đổi manifest
+        giữa lúc đọc và ghi thì đọc lại và thử lại, không ghi đè thay đổi của nhau.
+        """
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(self.manifest_key)
+                    manifest = pipe.hgetall(self.manifest_key)
+                    pipe.multi()
+                    apply(pipe, manifest)
+                    pipe.incr(self.version_key)
+                    self._written(pipe.execute()[-1])
+                    return
+                except WatchError:
+                    continue
+
+    def _chunk_key(self, segment_id, n: int) -> str:
+        return f"{self.prefix}:seg:{segment_id}:{n}"
+
+    def _write(self, pipe, segment: Segment):
+        data = encode_segment(segment)
+        chunks = max(1, -(-len(data) // self.chunk_size))
+        for n in range(chunks):
+            pipe.set(self._chunk_key(segment.segment_id, n),
+                     data[n * self.chunk_size:(n + 1) * self.chunk_size])
+        entry = {"chunks": chunks, "first_doc_id": int(segment.doc_ids[0]) if len(segment) else 0,
+                 "deleted": encode_deleted(segment)}
+        return str(segment.segment_id), json.dumps(entry)
+
+    def _delete(self, pipe, manifest: Dict[bytes, bytes], segment_ids):
+        for segment_id in segment_ids:
+            entry = manifest.get(str(segment_id).encode())
+            if entry is None:
+                continue
+            for n in range(json.loads(entry)["chunks"]):
+                pipe.delete(self._chunk_key(segment_id, n))
+            pipe.hdel(self.manifest_key, str(segment_id))
+
+    def append(self, segment: Segment):
+        # Ghi chunk trước, manifest sau: reader không bao giờ thấy segment ghi dở
+        pipe = self.client.pipeline()
+        field, entry = self._write(pipe, segment)
+        pipe.hset(self.manifest_key, field, entry)
+        pipe.incr(self.version_key)
+        self._written(pipe.execute()[-1])
+
+    def replace(self, old_segments: Sequence[Segment], new_segment: Segment):
+        """
+        Swap merged segments for the merged one. Nếu một segment cũ đã không còn trong
+        manifest (worker khác đã merge / xóa nó) thì bỏ qua, tránh lưu hai bản của cùng documents.
+        """
+        old_ids = [segment.segment_id for segment in old_segments]
+
+        def swap(pipe, manifest):
+            if any(str(segment_id).encode() not in manifest for segment_id in old_ids):
+                print(f"! BM25 segments {old_ids} changed in store, not persisting merge")
+                return
+            field, entry = self._write(pipe, new_segment)
+            pipe.hset(self.manifest_key, field, entry)
+            self._delete(pipe, manifest, old_ids)
+
+        self._transaction(swap)
+
+    def update_deletions(self, segments: Sequence[Segment]):
+        """Ghi lại tombstones của các segment (segment đã bị merge mất thì bỏ qua)"""
+        def update(pipe, manifest):
+            for segment in segments:
+                entry = manifest.get(str(segment.segment_id).encode())
+                if entry is None:
+                    continue
+                entry = json.loads(entry)
+                entry["deleted"] = encode_deleted(segment)
+                pipe.hset(self.manifest_key, str(segment.segment_id), json.dumps(entry))
+
+        self._transaction(update)
+
+    def save_all(self, segments: Sequence[Segment]):
+        def save(pipe, manifest):
+            self._delete(pipe, manifest, [key.decode() for key in manifest])
+            for segment in segments:
+                field, entry = self._write(pipe, segment)
+                pipe.hset(self.manifest_key, field, entry)
+
+        self._transaction(save)
+
+    def load(self, cached: Optional[Dict[int, Segment]] = None) -> List[Segment]:
+        """
+        Load mọi segment trong manifest. Segment có trong `cached` (segment_id -> Segment
+        của index hiện tại) chỉ được áp lại tombstones, không đọc / decode lại.
+        """
+        for _ in range(3):
+            # Đọc version trước manifest: ghi xen giữa chỉ làm lần sync sau load lại thêm một lần
+            version = self.current_version()
+            manifest = self.client.hgetall(self.manifest_key)
+            entries = sorted(((key.decode(), json.loads(value)) for key, value in manifest.items()),
+                             key=lambda item: item[1]["first_doc_id"])
+            segments = []
+            for segment_id, entry in entries:
+                segment = _reuse(cached, segment_id)
+                if segment is None:
+                    parts = self.client.mget([self._chunk_key(segment_id, n) for n in range(entry["chunks"])])
+                    if any(part is None for part in parts):
+                        break  # Segment vừa bị merge/xoá - đọc lại manifest
+                    segment = decode_segment(b"".join(parts))
+                segments.append(apply_deleted(segment, entry.get("deleted")))
+            else:
+                self.local_version = version
+                return segments
+        raise RuntimeError("BM25 manifest changed during load")
+
+    def clear(self):
+        def clear(pipe, manifest):
+            self._delete(pipe, manifest, [key.decode() for key in manifest])
+            pipe.delete(self.manifest_key)
+
+        self._transaction(clear)
+
+
+class DiskSegmentStore(VersionedStore):
+    """
+    Segments lưu thành file trên local disk, load bằng mmap (không copy, khởi động tức thì).
+    Chỉ một process được ghi (flock trên writer.lock, lấy ở lần ghi đầu tiên): manifest là
+    read-modify-write và segment id cấp trong process. Process khác vẫn load / search được,
+    còn thao tác ghi của chúng raise và chúng load lại khi `revision` trong manifest tăng.
+    Nhiều worker cùng ghi thì dùng RedisSegmentStore.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self._lock = threading.Lock()
+        self._writer_lock = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _ensure_writer(self):
+        if self._writer_lock is not None:
+            return
+        handle = open(os.path.join(self.directory, "writer.lock"), "a")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            raise RuntimeError(f"BM25 index dir {self.directory} is owned by another writer process")
+        self._writer_lock = handle
+
+    def _segment_path(self, segment_id) -> str:
+        return os.path.join(self.directory, f"segment-{segment_id}.bm25")
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        if not os.path.exists(self.manifest_path):
+            return {"version": FORMAT_VERSION, "revision": 0, "segments": {}}
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest: Dict[str, Any]):
+        # revision tăng mỗi lần ghi: reader ở process khác biết cần load lại
+        manifest["revision"] = manifest.get("revision", 0) + 1
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+        self._written(manifest["revision"])
+
+    def current_version(self) -> int:
+        return int(self._read_manifest().get("revision", 0))
+
+    def _write(self, segment: Segment) -> Dict[str, Any]:
+        path = self._segment_path(segment.segment_id)
+        with open(path + ".tmp", "wb") as f:
+            f.write(encode_segment(segment))
+        os.replace(path + ".tmp", path)
+        return {"first_doc_id": int(segment.doc_ids[0]) if len(segment) else 0,
+                "deleted": encode_deleted(segment)}
+
+    def _remove(self, segment_ids):
+        for segment_id in segment_ids:
+            try:
+                os.remove(self._segment_path(segment_id))
+            except FileNotFoundError:
+                pass
+
+    def append(self, segment: Segment):
+        with self._lock:
+            self._ensure_writer()
+            manifest = self._read_manifest()
+            manifest["segments"][str(segment.segment_id)] = self._write(segment)
+            self._write_manifest(manifest)
+
+    def replace(self, old_segments: Sequence[Segment], new_segment: Segment):
+        with self._lock:
+            self._ensure_writer()
+            manifest = self._read_manifest()
+            manifest["segments"][str(new_segment.segment_id)] = self._write(new_segment)
+            old_ids = [str(segment.segment_id) for segment in old_segments]
+            for segment_id in old_ids:
+                manifest["segments"].pop(segment_id, None)
+            self._write_manifest(manifest)
+            # File cũ vẫn mở được qua mmap của reader hiện tại (POSIX), xoá sau khi đổi manifest
+            self._remove(old_ids)
+
+    def update_deletions(self, segments: Sequence[Segment]):
+        with self._lock:
+            self._ensure_writer()
+            manifest = self._read_manifest()
+            for segment in segments:
+                entry = manifest["segments"].get(str(segment.segment_id))
+                if entry is not None:
+                    entry["deleted"] = encode_deleted(segment)
+            self._write_manifest(manifest)
+
+    def save_all(self, segments: Sequence[Segment]):
+        with self._lock:
+            self._ensure_writer()
+            old = self._read_manifest()
+            old_ids = list(old["segments"])
+            manifest = {"version": FORMAT_VERSION, "revision": old.get("revision", 0),
+                        "segments": {str(segment.segment_id): self._write(segment) for segment in segments}}
+            self._write_manifest(manifest)
+            self._remove([segment_id for segment_id in old_ids if segment_id not in manifest["segments"]])
+
+    def load(self, cached: Optional[Dict[int, Segment]] = None) -> List[Segment]:
+        manifest = self._read_manifest()
+        segments = []
+        for segment_id, entry in sorted(manifest["segments"].items(), key=lambda item: item[1]["first_doc_id"]):
+            segment = _reuse(cached, segment_id)
+            if segment is None:
+                with open(self._segment_path(segment_id), "rb") as f:
+                    buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                segment = decode_segment(buffer)
+            segments.append(apply_deleted(segment, entry.get("deleted")))
+        self.local_version = int(manifest.get("revision", 0))
+        return segments
+
+    def clear(self):
+        with self._lock:
+            self._ensure_writer()
+            manifest = self._read_manifest()
+            self._remove(list(manifest["segments"]))
+            # Giữ manifest rỗng (không xóa file) để revision tiếp tục tăng
+            manifest["segments"] = {}
+            self._write_manifest(manifest)
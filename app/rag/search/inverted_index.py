@@ -0,0 +1,579 @@
+import copy
+import math
+import threading
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from .filters import is_any_of, is_range, matches_filter, split_filter
+
+# Sai lệch avgdl tối đa trước khi tính lại ma trận trọng số của segment
+WEIGHT_REFRESH_TOLERANCE = 0.01
+
+# Segment có tỉ lệ document đã xóa (tombstone) từ mức này sẽ được compact lại
+COMPACT_DELETED_RATIO = 0.3
+
+
+class Segment:
+    """
+    Immutable block of BM25 postings for a batch of documents.
+    Postings lưu dạng CSR term x document (mỗi row = posting list của một term),
+    doc ids là global id. Document bị xóa chỉ được đánh dấu trong `deleted`
+    (tombstone) và bị loại bỏ thật sự khi segment được merge/compact.
+    """
+
+    def __init__(self, segment_id: int, doc_ids: np.ndarray, documents: List[Any],
+                 doc_lens: np.ndarray, terms: List[str], tf: sparse.csr_matrix,
+                 keywords: Dict[str, Dict[Any, np.ndarray]], columns: Dict[str, np.ndarray],
+                 deleted: Optional[np.ndarray] = None):
+        self.segment_id = segment_id
+        self.doc_ids = doc_ids
+        self.documents = documents
+        self.doc_lens = doc_lens
+        self.terms = terms
+        self.term_index = {term: row for row, term in enumerate(terms)}
+        self.tf = tf
+        # Metadata index: (field, value) -> sorted local positions, field -> numeric column
+        self.keywords = keywords
+        self.columns = columns
+        self.deleted = deleted if deleted is not None and deleted.any() else None
+        # Thống kê BM25 (N, avgdl) chỉ tính trên các document còn sống
+        if self.deleted is None:
+            self.live_count = len(doc_lens)
+            self.total_len = float(doc_lens.sum())
+        else:
+            self.live_count = len(doc_lens) - int(self.deleted.sum())
+            self.total_len = float(doc_lens[~self.deleted].sum())
+        # Cache của ma trận trọng số BM25, tính lại khi avgdl thay đổi đáng kể
+        self._weights: Optional[sparse.csr_matrix] = None
+        self._weights_key: Optional[Tuple[float, float, float]] = None
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    @property
+    def deleted_ratio(self) -> float:
+        return 1.0 - self.live_count / len(self) if len(self) else 0.0
+
+    def live_positions(self) -> np.ndarray:
+        if self.deleted is None:
+            return np.arange(len(self))
+        return np.flatnonzero(~self.deleted)
+
+    def with_deletions(self, mask: np.ndarray) -> "Segment":
+        """Copy-on-write: segment mới chia sẻ postings, thêm tombstones theo `mask`"""
+        segment = copy.copy(self)
+        deleted = mask if self.deleted is None else (self.deleted | mask)
+        segment.deleted = deleted if deleted.any() else None
+        segment.live_count = len(self) - int(deleted.sum())
+        segment.total_len = float(self.doc_lens[~deleted].sum())
+        return segment
+
+    def doc_freq(self, term: str) -> int:
+        row = self.term_index.get(term)
+        if row is None:
+            return 0
+        start, end = self.tf.indptr[row], self.tf.indptr[row + 1]
+        if self.deleted is None:
+            return int(end - start)
+        # Không đếm document đã bị tombstone để idf khớp với index sau khi compact
+        return int(end - start) - int(self.deleted[self.tf.indices[start:end]].sum())
+
+    def weights(self, k1: float, b: float, avgdl: float) -> sparse.csr_matrix:
+        """
+        Precomputed term-document weight matrix: tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl)).
+        Được cache lại và chỉ tính lại (vectorized, O(nnz)) khi avgdl lệch quá WEIGHT_REFRESH_TOLERANCE.
+        """
+        key = self._weights_key
+        if (self._weights is None or key[0] != k1 or key[1] != b
+                or abs(key[2] - avgdl) > WEIGHT_REFRESH_TOLERANCE * avgdl):
+            norms = k1 * (1.0 - b + b * self.doc_lens / avgdl)
+            tf = self.tf.data
+            data = tf * (k1 + 1.0) / (tf + norms[self.tf.indices])
+            self._weights = sparse.csr_matrix(
+                (data.astype(np.float32, copy=False), self.tf.indices, self.tf.indptr),
+                shape=self.tf.shape,
+            )
+            self._weights_key = (k1, b, avgdl)
+        return self._weights
+
+    def filter_mask(self, conditions: Dict[str, Any]) -> np.ndarray:
+        """Resolve indexed metadata conditions to a boolean candidate mask"""
+        mask = np.ones(len(self), dtype=bool)
+        for field, condition in conditions.items():
+            if is_range(condition):
+                column = self.columns.get(field)
+                if column is None:
+                    return np.zeros(len(self), dtype=bool)
+                # NaN (thiếu giá trị) luôn cho kết quả False
+                with np.errstate(invalid="ignore"):
+                    if "gt" in condition:
+                        mask &= column > condition["gt"]
+                    if "gte" in condition:
+                        mask &= column >= condition["gte"]
+                    if "lt" in condition:
+                        mask &= column < condition["lt"]
+                    if "lte" in condition:
+                        mask &= column <= condition["lte"]
+            else:
+                values = condition if is_any_of(condition) else [condition]
+                postings = self.keywords.get(field, {})
+                field_mask = np.zeros(len(self), dtype=bool)
+                for value in values:
+                    try:
+                        ids = postings.get(value)
+                    except TypeError:
+                        ids = None
+                    if ids is not None:
+                        field_mask[ids] = True
+                mask &= field_mask
+            if not mask.any():
+                break
+        return mask
+
+    @classmethod
+    def build(cls, segment_id: int, first_doc_id: int, documents: List[Any],
+              tokenized: List[List[str]], metadata_fields: Iterable[str] = ()) -> "Segment":
+        """Build a segment from tokenized documents - O(tokens)"""
+        term_index: Dict[str, int] = {}
+        rows, cols, data = [], [], []
+        for local_id, tokens in enumerate(tokenized):
+            for term, tf in Counter(tokens).items():
+                rows.append(term_index.setdefault(term, len(term_index)))
+                cols.append(local_id)
+                data.append(tf)
+
+        tf = sparse.csr_matrix(
+            (np.asarray(data, dtype=np.float32), (np.asarray(rows, dtype=np.int32), np.asarray(cols, dtype=np.int32))),
+            shape=(len(term_index), len(documents)),
+        )
+        doc_ids = np.arange(first_doc_id, first_doc_id + len(documents), dtype=np.int64)
+        doc_lens = np.asarray([len(tokens) for tokens in tokenized], dtype=np.float32)
+        keywords, columns = build_metadata_index(documents, metadata_fields)
+        return cls(segment_id, doc_ids, list(documents), doc_lens, list(term_index), tf,
+                   keywords, columns)
+
+    @classmethod
+    def merge(cls, segment_id: int, segments: Sequence["Segment"]) -> "Segment":
+        """Merge consecutive segments into one, keeping global doc ids and dropping tombstoned docs"""
+        term_index: Dict[str, int] = {}
+        rows, cols, data = [], [], []
+        keeps = [segment.live_positions() for segment in segments]
+        offset = 0
+        for segment, keep in zip(segments, keeps):
+            # Map local term rows của segment sang row của segment mới
+            row_map = np.asarray([term_index.setdefault(term, len(term_index)) for term in segment.terms],
+                                 dtype=np.int32)
+            tf = segment.tf if segment.deleted is None else segment.tf[:, keep]
+            coo = tf.tocoo()
+            rows.append(row_map[coo.row])
+            cols.append(coo.col + offset)
+            data.append(coo.data)
+            offset += len(keep)
+
+        tf = sparse.csr_matrix(
+            (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(len(term_index), offset),
+        )
+        terms = list(term_index)
+        # Bỏ các term chỉ còn xuất hiện trong document đã xóa
+        postings = np.diff(tf.indptr)
+        if (postings == 0).any():
+            used = np.flatnonzero(postings)
+            tf = tf[used]
+            terms = [terms[row] for row in used.tolist()]
+
+        documents = [segment.documents[i] for segment, keep in zip(segments, keeps) for i in keep.tolist()]
+        doc_ids = np.concatenate([segment.doc_ids[keep] for segment, keep in zip(segments, keeps)])
+        doc_lens = np.concatenate([segment.doc_lens[keep] for segment, keep in zip(segments, keeps)])
+        keywords, columns = merge_metadata_index(segments, keeps)
+        return cls(segment_id, doc_ids, documents, doc_lens, terms, tf,
+                   keywords, columns)
+
+
+def build_metadata_index(documents: List[Any], fields: Iterable[str]):
+    """Build keyword postings and numeric columns for the indexed metadata fields"""
+    keywords: Dict[str, Dict[Any, np.ndarray]] = {}
+    columns: Dict[str, np.ndarray] = {}
+    for field in fields:
+        groups = defaultdict(list)
+        column = np.full(len(documents), np.nan)
+        numeric = False
+        for local_id, doc in enumerate(documents):
+            value = doc.metadata.get(field)
+            if value is None or isinstance(value, (dict, list, set)):
+                continue
+            groups[value].append(local_id)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                column[local_id] = value
+                numeric = True
+        if groups:
+            keywords[field] = {value: np.asarray(ids, dtype=np.int32) for value, ids in groups.items()}
+        if numeric:
+            columns[field] = column
+    return keywords, columns
+
+
+def merge_metadata_index(segments: Sequence[Segment], keeps: Optional[Sequence[np.ndarray]] = None):
+    """Concatenate metadata indexes of consecutive segments (chỉ giữ các vị trí trong `keeps`)"""
+    keeps = keeps if keeps is not None else [segment.live_positions() for segment in segments]
+    keyword_groups = defaultdict(lambda: defaultdict(list))
+    column_fields = {field for segment in segments for field in segment.columns}
+    offset = 0
+    for segment, keep in zip(segments, keeps):
+        # Vị trí local cũ -> vị trí mới (-1 nếu document đã bị xóa)
+        remap = None
+        if len(keep) < len(segment):
+            remap = np.full(len(segment), -1, dtype=np.int32)
+            remap[keep] = np.arange(len(keep), dtype=np.int32)
+        for field, postings in segment.keywords.items():
+            for value, ids in postings.items():
+                if remap is not None:
+                    ids = remap[ids]
+                    ids = ids[ids >= 0]
+                    if not len(ids):
+                        continue
+                keyword_groups[field][value].append(ids + offset)
+        offset += len(keep)
+
+    keywords = {
+        field: {value: np.concatenate(parts).astype(np.int32, copy=False) for value, parts in groups.items()}
+        for field, groups in keyword_groups.items()
+    }
+    columns = {
+        field: np.concatenate([segment.columns.get(field, np.full(len(segment), np.nan))[keep]
+                               for segment, keep in zip(segments, keeps)])
+        for field in column_fields
+    }
+    return keywords, columns
+
+
+@dataclass(frozen=True)
+class IndexSnapshot:
+    """Consistent, read-only view of the index used by a single search"""
+    segments: Tuple[Segment, ...] = ()
+    doc_count: int = 0
+    total_len: float = 0.0
+    next_doc_id: int = 0
+    generation: int = 0
+
+    @property
+    def avgdl(self) -> float:
+        return self.total_len / self.doc_count if self.doc_count else 0.0
+
+    def doc_freq(self, term: str) -> int:
+        return sum(segment.doc_freq(term) for segment in self.segments)
+
+    def with_segments(self, segments: Tuple[Segment, ...], **changes) -> "IndexSnapshot":
+        fields = {
+            "segments": segments,
+            "doc_count": sum(segment.live_count for segment in segments),
+            "total_len": sum(segment.total_len for segment in segments),
+            "next_doc_id": self.next_doc_id,
+            "generation": self.generation + 1,
+        }
+        fields.update(changes)
+        return IndexSnapshot(**fields)
+
+
+class InvertedIndex:
+    """
+    Incremental BM25 engine dạng inverted index (per-term postings).
+    - add_documents chỉ tokenize + build segment cho docs mới (O(N) token)
+    - Segment nhỏ được merge dần trong background thread
+    - Search luôn chạy trên một snapshot bất biến, không bị merge làm ảnh hưởng
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, merge_factor: int = 8,
+                 background_merge: bool = True,
+                 on_merge: Optional[Callable[[List[Segment], Segment], None]] = None,
+                 metadata_fields: Iterable[str] = (),
+                 on_add: Optional[Callable[[Segment], None]] = None,
+                 on_delete: Optional[Callable[[List[Segment]], None]] = None,
+                 allocate_ids: Optional[Callable[[int, int, int], Tuple[int, int]]] = None):
+        self.k1 = k1
+        self.b = b
+        self.metadata_fields = tuple(metadata_fields)
+        self.merge_factor = merge_factor
+        self.background_merge = background_merge
+        self.on_merge = on_merge
+        self.on_add = on_add
+        self.on_delete = on_delete
+        # allocate_ids(doc_count, min_segment_id, min_doc_id) -> (segment_id, first_doc_id):
+        # cấp id từ store dùng chung để nhiều process ghi cùng store không trùng key
+        self.allocate_ids = allocate_ids
+        self._snapshot = IndexSnapshot()
+        self._next_segment_id = 0
+        self._write_lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+
+    @property
+    def snapshot(self) -> IndexSnapshot:
+        return self._snapshot
+
+    def __len__(self) -> int:
+        return self._snapshot.doc_count
+
+    def reset(self, segments: Sequence[Segment] = ()):
+        """Replace the whole index (e.g. after loading segments from cache)"""
+        with self._write_lock:
+            segments = tuple(segments)
+            next_doc_id = max((int(s.doc_ids[-1]) + 1 for s in segments if len(s)), default=0)
+            self._next_segment_id = max(self._next_segment_id,
+                                        max((s.segment_id + 1 for s in segments), default=0))
+            self._snapshot = self._snapshot.with_segments(segments, next_doc_id=next_doc_id)
+
+    def add_documents(self, documents: List[Any], tokenized: List[List[str]]) -> Optional[Segment]:
+        """Append a new segment for the given documents and publish a new snapshot"""
+        if not documents:
+            return None
+        with self._write_lock:
+            snapshot = self._snapshot
+            segment_id, first_doc_id = self._allocate(len(documents))
+            segment = Segment.build(segment_id, first_doc_id,
+                                    documents, tokenized, self.metadata_fields)
+            self._snapshot = snapshot.with_segments(
+                snapshot.segments + (segment,),
+                next_doc_id=first_doc_id + len(documents),
+            )
+            # Persist trong write lock: store nhận thay đổi đúng thứ tự snapshot,
+            # segment mới được ghi trước khi merge có thể thay thế nó
+            self._persist(self.on_add, "new segment", segment)
+        self._maybe_merge()
+        return segment
+
+    def delete(self, metadata_filter: Dict) -> int:
+        """
+        Tombstone every live document matching `metadata_filter` (không rebuild index).
+        Field có trong metadata index được resolve bằng bitmap, các field khác được
+        kiểm tra trên document của các candidate. Trả về số document bị xóa.
+        """
+        if not metadata_filter:
+            raise ValueError("delete requires a non-empty metadata filter")
+        conditions, residual = split_filter(metadata_filter, self.metadata_fields)
+        changed: List[Segment] = []
+        with self._write_lock:
+            snapshot = self._snapshot
+            segments = []
+            for segment in snapshot.segments:
+                mask = segment.filter_mask(conditions)
+                if segment.deleted is not None:
+                    mask &= ~segment.deleted
+                if residual:
+                    for position in np.flatnonzero(mask).tolist():
+                        if not matches_filter(segment.documents[position].metadata, residual):
+                            mask[position] = False
+                if mask.any():
+                    segment = segment.with_deletions(mask)
+                    changed.append(segment)
+                segments.append(segment)
+            if not changed:
+                return 0
+            removed = snapshot.doc_count - sum(segment.live_count for segment in segments)
+            self._snapshot = snapshot.with_segments(tuple(segments))
+            self._persist(self.on_delete, "tombstones", changed)
+
+        # Segment có quá nhiều tombstone sẽ được compact trong background
+        self._maybe_merge()
+        return removed
+
+    @staticmethod
+    def _persist(callback: Optional[Callable], what: str, *args):
+        """Gọi callback persist (chỉ gọi khi đang giữ _write_lock); lỗi persist không làm hỏng index"""
+        if callback is None:
+            return
+        try:
+            callback(*args)
+        except Exception as e:
+            print(f"! Error persisting {what}: {e}")
+
+    def _allocate(self, doc_count: int) -> Tuple[int, int]:
+        """Segment id + doc id đầu tiên cho segment mới (gọi khi đang giữ _write_lock)"""
+        segment_id, first_doc_id = self._next_segment_id, self._snapshot.next_doc_id
+        if self.allocate_ids is not None:
+            try:
+                segment_id, first_doc_id = self.allocate_ids(doc_count, segment_id, first_doc_id)
+            except Exception as e:
+                print(f"! Cannot allocate shared BM25 ids, using local ids: {e}")
+        self._next_segment_id = segment_id + 1
+        return segment_id, first_doc_id
+
+    def idf(self, doc_freq: int, doc_count: int) -> float:
+        """BM25 idf (biến thể luôn dương, không cần average idf của cả corpus)"""
+        return math.log(1.0 + (doc_count - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    def score(self, query_tokens: List[str], snapshot: Optional[IndexSnapshot] = None,
+              conditions: Optional[Dict[str, Any]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Compute BM25 scores as (positions, scores) over the snapshot's documents.
+        Mỗi segment được chấm điểm bằng sparse dot product q (idf) x W (CSR);
+        nếu có `conditions` thì chỉ các document khớp metadata index mới được chấm.
+        Segment không chứa query term nào (điểm = 0) bị bỏ qua.
+        """
+        snapshot = snapshot or self._snapshot
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+        if not snapshot.doc_count:
+            return empty
+
+        terms = Counter(query_tokens)
+        idfs = {term: self.idf(snapshot.doc_freq(term), snapshot.doc_count) for term in terms}
+        avgdl = snapshot.avgdl or 1.0
+
+        position_parts, score_parts = [], []
+        offset = 0
+        for segment in snapshot.segments:
+            size = len(segment)
+            rows, coeffs = [], []
+            for term, query_tf in terms.items():
+                row = segment.term_index.get(term)
+                if row is not None:
+                    rows.append(row)
+                    coeffs.append(query_tf * idfs[term])
+
+            candidates = None
+            if rows and (conditions or segment.deleted is not None):
+                mask = segment.filter_mask(conditions) if conditions else np.ones(size, dtype=bool)
+                if segment.deleted is not None:
+                    mask &= ~segment.deleted
+                candidates = np.flatnonzero(mask)
+            if not rows or (candidates is not None and not len(candidates)):
+                offset += size
+                continue
+
+            # Chỉ lấy posting rows của query terms, rồi (nếu có filter) chỉ các cột candidate
+            weights = segment.weights(self.k1, self.b, avgdl)[rows]
+            if candidates is not None and len(candidates) < size:
+                weights = weights[:, candidates]
+                local = candidates
+            else:
+                local = np.arange(size)
+            position_parts.append(local + offset)
+            score_parts.append(weights.T @ np.asarray(coeffs, dtype=np.float32))
+            offset += size
+
+        if not position_parts:
+            return empty
+        return np.concatenate(position_parts), np.concatenate(score_parts)
+
+    def top_k(self, scores: np.ndarray, k: int) -> np.ndarray:
+        """Indices of the k highest positive scores, best first (argpartition)"""
+        positive = np.flatnonzero(scores > 0)
+        if len(positive) > k:
+            # argpartition O(n) rồi chỉ sort k phần tử thắng
+            positive = positive[np.argpartition(-scores[positive], k - 1)[:k]]
+        return positive[np.argsort(-scores[positive], kind="stable")]
+
+    def documents_at(self, positions: np.ndarray,
+                     snapshot: Optional[IndexSnapshot] = None) -> List[Any]:
+        """Materialize Document objects only for the given snapshot positions"""
+        snapshot = snapshot or self._snapshot
+        offsets = np.cumsum([0] + [len(segment) for segment in snapshot.segments])
+        segment_idx = np.searchsorted(offsets, positions, side="right") - 1
+        return [snapshot.segments[s].documents[p - offsets[s]]
+                for s, p in zip(segment_idx.tolist(), positions.tolist())]
+
+    def search(self, query_tokens: List[str], k: int = 10,
+               metadata_filter: Optional[Dict] = None) -> List[Tuple[Any, float]]:
+        """Return top-k (document, score) pairs with score > 0"""
+        if k <= 0:
+            return []
+        snapshot = self._snapshot
+        conditions, residual = split_filter(metadata_filter, self.metadata_fields)
+        positions, scores = self.score(query_tokens, snapshot, conditions)
+        if not len(scores):
+            return []
+
+        if not residual:
+            winners = self.top_k(scores, k)
+            documents = self.documents_at(positions[winners], snapshot)
+            return [(doc, float(scores[i])) for doc, i in zip(documents, winners)]
+
+        # Field không có trong metadata index: lọc sau khi chấm điểm, mở rộng dần số candidate
+        depth = k
+        while True:
+            winners = self.top_k(scores, depth)
+            documents = self.documents_at(positions[winners], snapshot)
+            results = [(doc, float(scores[i])) for doc, i in zip(documents, winners)
+                       if matches_filter(doc.metadata, residual)]
+            if len(results) >= k or len(winners) < depth:
+                return results[:k]
+            depth *= 4
+
+    # Segment merging
+    def _tier(self, size: int) -> int:
+        return int(math.log(max(size, 1), self.merge_factor))
+
+    def _pick_merge_run(self, segments: Tuple[Segment, ...]) -> Optional[Tuple[int, int]]:
+        """
+        Tiered merge policy: merge `merge_factor` consecutive segments cùng tier
+        (cùng bậc kích thước), ưu tiên các segment mới nhất. Mỗi document chỉ bị
+        merge O(log N) lần nên chi phí ingest vẫn tuyến tính theo số docs mới.
+        Segment có nhiều tombstone được compact riêng (merge một segment).
+        """
+        for i, segment in enumerate(segments):
+            if segment.deleted_ratio >= COMPACT_DELETED_RATIO:
+                return i, i + 1
+        if len(segments) < self.merge_factor:
+            return None
+        tiers = [self._tier(len(segment)) for segment in segments]
+        for end in range(len(segments), self.merge_factor - 1, -1):
+            start = end - self.merge_factor
+            if len(set(tiers[start:end])) == 1:
+                return start, end
+        return None
+
+    def _maybe_merge(self):
+        if self._pick_merge_run(self._snapshot.segments) is None:
+            return
+        if self.background_merge:
+            threading.Thread(target=self.merge_segments, name="bm25-merge", daemon=True).start()
+        else:
+            self.merge_segments()
+
+    def merge_segments(self) -> bool:
+        """Merge small segments; searches keep using the old snapshot until swap"""
+        if not self._merge_lock.acquire(blocking=False):
+            return False
+        try:
+            merged_any = False
+            while True:
+                with self._write_lock:
+                    snapshot = self._snapshot
+                    run = self._pick_merge_run(snapshot.segments)
+                    if run is None:
+                        return merged_any
+                    segment_id, _ = self._allocate(0)
+                inputs = list(snapshot.segments[run[0]:run[1]])
+
+                # Build merged segment ngoài lock - search vẫn chạy bình thường
+                merged = Segment.merge(segment_id, inputs)
+
+                with self._write_lock:
+                    current = self._snapshot.segments
+                    input_ids = [s.segment_id for s in inputs]
+                    current_ids = [s.segment_id for s in current]
+                    start = current_ids.index(input_ids[0]) if input_ids[0] in current_ids else None
+                    if start is None or current_ids[start:start + len(inputs)] != input_ids:
+                        # Index đã bị reset trong lúc merge - bỏ kết quả merge
+                        return merged_any
+                    # Áp lại các tombstone được thêm trong lúc merge
+                    newly_deleted = [
+                        now.doc_ids[now.deleted if before.deleted is None else now.deleted & ~before.deleted]
+                        for before, now in zip(inputs, current[start:start + len(inputs)])
+                        if now.deleted is not None
+                    ]
+                    if newly_deleted:
+                        mask = np.isin(merged.doc_ids, np.concatenate(newly_deleted))
+                        if mask.any():
+                            merged = merged.with_deletions(mask)
+                    segments = current[:start] + (merged,) + current[start + len(inputs):]
+                    self._snapshot = self._snapshot.with_segments(segments)
+                    self._persist(self.on_merge, "merged segment", inputs, merged)
+                print(f"Merged {len(inputs)} BM25 segments into segment {segment_id} "
+                      f"({len(merged)} docs)")
+                merged_any = True
+        finally:
+            self._merge_lock.release()
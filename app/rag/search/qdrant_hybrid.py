@@ -0,0 +1,77 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain.schema import Document
+from qdrant_client.models import Fusion, FusionQuery, Prefetch
+
+from config import SPARSE_VECTOR_NAME
+from .filters import to_qdrant_filter
+from .sparse import SparseEncoder
+
+
+class QdrantHybridSearch:
+    """
+    Hybrid search chạy hoàn toàn trong Qdrant: dense vector và sparse (BM25-style)
+    vector nằm trong cùng một point, một lần gọi Query API với hai prefetch và
+    RRF fusion phía server. Lexical search scale theo Qdrant, không theo RAM của worker.
+    """
+
+    def __init__(self, vector_manager, encoder: Optional[SparseEncoder] = None):
+        self.vector_manager = vector_manager
+        self.client = vector_manager.client
+        self.collection_name = vector_manager.collection_name
+        self.embedding = vector_manager.embedding
+        self.encoder = encoder or SparseEncoder()
+
+    @property
+    def available(self) -> bool:
+        """Collection có sparse vector để search lexical phía Qdrant"""
+        return self.vector_manager.sparse_enabled
+
+    def search(self, query: str, k: int = 10, alpha: float = 0.5,
+               metadata_filter: Optional[Dict] = None,
+               bm25_k: Optional[int] = None,
+               vector_k: Optional[int] = None) -> List[Tuple[Any, float]]:
+        """
+        Cùng interface với HybridSearch.search. RRF không có trọng số nên alpha chỉ
+        chọn leg: 1.0 = chỉ dense, 0.0 = chỉ sparse, còn lại = fusion cả hai.
+        """
+        bm25_k = bm25_k or max(k * 2, 20)
+        vector_k = vector_k or max(k * 2, 20)
+        query_filter = to_qdrant_filter(metadata_filter)
+        search_params = self.vector_manager.search_params
+
+        sparse = self.encoder.encode_query(query)
+        use_dense = alpha > 0.0 or SparseEncoder.is_empty(sparse)
+        use_sparse = alpha < 1.0 and not SparseEncoder.is_empty(sparse)
+
+        prefetch = []
+        if use_dense:
+            prefetch.append(Prefetch(query=self.embedding.embed_query(query), limit=vector_k,
+                                     filter=query_filter, params=search_params))
+        if use_sparse:
+            prefetch.append(Prefetch(query=sparse, using=SPARSE_VECTOR_NAME, limit=bm25_k,
+                                     filter=query_filter))
+
+        if len(prefetch) == 1:
+            # Một leg: query trực tiếp, không cần fusion
+            leg = prefetch[0]
+            response = self.client.query_points(
+                self.collection_name, query=leg.query, using=leg.using, query_filter=query_filter,
+                search_params=leg.params, limit=k, with_payload=True,
+            )
+        else:
+            response = self.client.query_points(
+                self.collection_name, prefetch=prefetch, query=FusionQuery(fusion=Fusion.RRF),
+                limit=k, with_payload=True,
+            )
+
+        results = [(self._to_document(point), float(point.score)) for point in response.points]
+        print(f"Qdrant hybrid search returning {len(results)} results")
+        return results
+
+    def _to_document(self, point) -> Document:
+        payload = point.payload or {}
+        metadata = dict(payload.get("metadata") or {})
+        metadata["_id"] = str(point.id)
+        metadata["_collection_name"] = self.collection_name
+        return Document(page_content=payload.get("page_content", ""), metadata=metadata)
@@ -0,0 +1,54 @@
+import hashlib
+from collections import Counter
+from typing import List
+
+from qdrant_client.models import SparseVector
+
+from config import SPARSE_AVGDL
+from ..utils.preprocessing import preprocess_text
+
+
+def term_index(term: str) -> int:
+    """Stable 32-bit index của một term trong sparse vector (không cần vocabulary)"""
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=4).digest(), "little")
+
+
+class SparseEncoder:
+    """
+    BM25-style sparse vectors cho Qdrant, dùng cùng tokenizer với BM25Search.
+    Document lưu phần tf đã chuẩn hóa theo độ dài: tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl));
+    idf do Qdrant tính phía server (sparse vector với Modifier.IDF), nên query chỉ cần
+    trọng số 1 cho mỗi term.
+    avgdl là hằng số cấu hình vì corpus thay đổi liên tục và point không được tính lại.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, avgdl: float = SPARSE_AVGDL):
+        self.k1 = k1
+        self.b = b
+        self.avgdl = avgdl
+
+    def _vector(self, weights: Counter) -> SparseVector:
+        # Hash collision: cộng dồn trọng số của các term trùng index
+        merged = Counter()
+        for term, weight in weights.items():
+            merged[term_index(term)] += weight
+        indices = sorted(merged)
+        return SparseVector(indices=indices, values=[float(merged[i]) for i in indices])
+
+    def encode_document(self, text: str) -> SparseVector:
+        tokens = preprocess_text(text)
+        norm = self.k1 * (1.0 - self.b + self.b * len(tokens) / self.avgdl)
+        weights = Counter({term: tf * (self.k1 + 1.0) / (tf + norm)
+                           for term, tf in Counter(tokens).items()})
+        return self._vector(weights)
+
+    def encode_documents(self, texts: List[str]) -> List[SparseVector]:
+        return [self.encode_document(text) for text in texts]
+
+    def encode_query(self, text: str) -> SparseVector:
+        return self._vector(Counter(preprocess_text(text)))
+
+    @staticmethod
+    def is_empty(vector: SparseVector) -> bool:
+        return not vector.indices
+
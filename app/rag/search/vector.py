@@ -1,9 +1,18 @@
-from typing import List, Tuple, Dict, Any, Optional
-from vector_store import VectorStoreManager
+import math
+import time
+from typing import Iterator, List, Tuple, Dict, Any, Optional
+from langchain.schema import Document
+from langchain_qdrant import QdrantVectorStore
+from config import BM25_BOOTSTRAP_BATCH_SIZE
+from .filters import to_qdrant_filter
+from services import ServiceContainer, get_services
 
 class VectorSearch:
-    def __init__(self):
-        self.vector_manager = VectorStoreManager()
+    def __init__(self, services: Optional[ServiceContainer] = None):
+        services = services or get_services()
+        self.vector_manager = services.vector_manager
+        # Search đi qua client có HTTP timeout riêng (QDRANT_SEARCH_TIMEOUT)
+        self.client = services.search_qdrant_client
         self.vector_store = None
         self._initialize_store()
         self.documents = [] 
@@ -18,32 +27,90 @@ class VectorSearch:
     def search(self, query: str, k: int = 10, 
               metadata_filter: Optional[Dict] = None) -> List[Tuple[Any, float]]:
         """Vector semantic search"""
-        if not self.vector_store:
-            return []
-            
         try:
-            if metadata_filter:
-                results = self.vector_store.similarity_search_with_score(
-                    query, k=k, filter=metadata_filter
-                )
-            else:
-                results = self.vector_store.similarity_search_with_score(query, k=k)
-            
-            return [(doc, float(score)) for doc, score in results]
-            
+            return self.search_within(query, k, metadata_filter)
         except Exception as e:
             print(f"Error in vector search: {e}")
             return []
 
-    def get_all_documents(self) -> List[Any]:
-        """Get all documents from vector store"""
+    def search_within(self, query: str, k: int = 10, metadata_filter: Optional[Dict] = None,
+                      timeout: Optional[float] = None) -> List[Tuple[Any, float]]:
+        """
+        Như search() nhưng raise khi lỗi / quá hạn (HybridSearch đánh dấu leg degraded).
+        `timeout` là budget cho cả embed query và round trip Qdrant: phần còn lại sau khi
+        embed được gửi làm timeout của request, HTTP timeout của client chặn phía client.
+        """
         if not self.vector_store:
             return []
-            
+
+        started = time.perf_counter()
+        vector = self.vector_store.embeddings.embed_query(query)
+        request_timeout = None
+        if timeout is not None:
+            remaining = timeout - (time.perf_counter() - started)
+            if remaining <= 0:
+                raise TimeoutError(f"query embedding exceeded the {timeout}s vector search budget")
+            request_timeout = max(1, math.ceil(remaining))
+
+        collection_name = self.vector_manager.collection_name
+        response = self.client.query_points(
+            collection_name=collection_name,
+            query=vector,
+            using=self.vector_store.vector_name,
+            # Filter dict -> Qdrant Filter để dùng payload index trong filtered HNSW search
+            query_filter=to_qdrant_filter(metadata_filter) if metadata_filter else None,
+            # hnsw_ef / quantization rescoring theo collection profile
+            search_params=self.vector_manager.search_params,
+            limit=k,
+            with_payload=True,
+            with_vectors=False,
+            timeout=request_timeout,
+        )
+        return [
+            (QdrantVectorStore._document_from_point(point, collection_name,
+                                                    self.vector_store.content_payload_key,
+                                                    self.vector_store.metadata_payload_key),
+             float(point.score))
+            for point in response.points
+        ]
+
+    def iter_documents(self, batch_size: int = BM25_BOOTSTRAP_BATCH_SIZE) -> Iterator[List[Any]]:
+        """
+        Stream every document in the collection as batches using Qdrant scroll
+        (chỉ đọc payload, không embed query và không trả vector).
+        """
+        if not self.vector_store:
+            return
+
+        client = self.vector_manager.client
+        content_key = self.vector_store.content_payload_key
+        metadata_key = self.vector_store.metadata_payload_key
+        offset = None
+        while True:
+            points, offset = client.scroll(
+                collection_name=self.vector_manager.collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False,
+            )
+            batch = []
+            for point in points:
+                payload = point.payload or {}
+                metadata = dict(payload.get(metadata_key) or {})
+                # Cùng kiểu str với _id do ingestion ghi (rebuild journal so khớp theo _id)
+                metadata["_id"] = str(point.id)
+                metadata["_collection_name"] = self.vector_manager.collection_name
+                batch.append(Document(page_content=payload.get(content_key, ""), metadata=metadata))
+            if batch:
+                yield batch
+            if offset is None:
+                break
+
+    def get_all_documents(self) -> List[Any]:
+        """Get all documents from vector store"""
         try:
-            collection_info = self.vector_manager.get_collection_info()
-            if collection_info and collection_info.get('points_count', 0) > 0:
-                return self.vector_store.similarity_search("", k=collection_info['points_count'])
+            return [doc for batch in self.iter_documents() for doc in batch]
         except Exception as e:
             print(f"Error getting documents: {e}")
-        return []
\ No newline at end of file
+        return []
@@ -46,41 +46,96 @@
         
 
 
-import pickle
 import redis
-from typing import Any, Optional
+from typing import Any, Dict, List, Optional
+
+from config import BM25_INDEX_DIR
+from ..search.index_store import DiskSegmentStore, RedisSegmentStore
+
+# Key của format pickle cũ - chỉ còn dùng để dọn dẹp
+LEGACY_BM25_KEYS = ("bm25_model", "bm25_docs")
 
 class CacheManager:
-    def __init__(self, host="localhost", port=6379, db=0):
-        self.client = redis.Redis(host=host, port=port, db=db)
+    def __init__(self, host="localhost", port=6379, db=0, client: Optional[redis.Redis] = None,
+                 index_dir: Optional[str] = BM25_INDEX_DIR):
+        # Dùng chung Redis client của ServiceContainer nếu được truyền vào
+        self.client = client or redis.Redis(host=host, port=port, db=db)
+        # BM25 segments: local disk (mmap) nếu có index_dir, ngược lại lưu trong Redis
+        self.segment_store = DiskSegmentStore(index_dir) if index_dir else RedisSegmentStore(self.client)
+
+    # BM25 index được lưu theo segment (binary format có version, xem index_store)
+    def save_bm25_segments(self, segments) -> bool:
+        """Replace toàn bộ index đã cache bằng danh sách segments"""
+        try:
+            self.segment_store.save_all(segments)
+            return True
+        except Exception as e:
+            print(f"Error saving BM25 cache: {e}")
+            return False
+
+    def append_bm25_segment(self, segment) -> bool:
+        """Chỉ ghi segment mới (ingest không phải ghi lại cả corpus)"""
+        try:
+            self.segment_store.append(segment)
+            return True
+        except Exception as e:
+            print(f"Error appending BM25 segment: {e}")
+            return False
 
-    def save_bm25_cache(self, bm25_model, documents) -> bool:
+    def replace_bm25_segments(self, old_segments, new_segment) -> bool:
+        """Swap merged segments for the new merged one"""
         try:
-            self.client.set("bm25_model", pickle.dumps(bm25_model))
-            self.client.set("bm25_docs", pickle.dumps(documents))
+            self.segment_store.replace(old_segments, new_segment)
             return True
         except Exception as e:
-            print(f"Error saving BM25 cache to Redis: {e}")
+            print(f"Error replacing BM25 segments: {e}")
             return False
 
-    def load_bm25_cache(self) -> tuple[Optional[Any], Optional[list]]:
+    def allocate_bm25_ids(self, doc_count: int, min_segment_id: int, min_doc_id: int):
+        """
+        Segment id + doc id đầu tiên cho segment mới. Store Redis cấp bằng INCR (nhiều worker
+        ghi chung không trùng key); disk store chỉ có một writer nên dùng id local.
+        """
+        allocate = getattr(self.segment_store, "allocate_ids", None)
+        if allocate is None:
+            return min_segment_id, min_doc_id
+        return allocate(doc_count, min_segment_id, min_doc_id)
+
+    def update_bm25_deletions(self, segments) -> bool:
+        """Persist tombstones của các segment vừa có document bị xóa"""
         try:
-            bm25_data = self.client.get("bm25_model")
-            docs_data = self.client.get("bm25_docs")
-            if bm25_data and docs_data:
-                bm25 = pickle.loads(bm25_data)
-                documents = pickle.loads(docs_data)
-                return bm25, documents
+            self.segment_store.update_deletions(segments)
+            return True
         except Exception as e:
-            print(f"Error loading BM25 cache from Redis: {e}")
-        return None, None
+            print(f"Error saving BM25 tombstones: {e}")
+            return False
+
+    def load_bm25_segments(self, cached: Optional[Dict[int, Any]] = None) -> Optional[List[Any]]:
+        """Segments đã lưu (dùng lại các segment có trong `cached`); None nếu không đọc được store"""
+        try:
+            return self.segment_store.load(cached)
+        except Exception as e:
+            print(f"Error loading BM25 cache: {e}")
+        return None
+
+    def bm25_cache_stale(self) -> Optional[bool]:
+        """True nếu process khác đã ghi vào store kể từ lần load / ghi cuối; None nếu lỗi"""
+        try:
+            return self.segment_store.is_stale()
+        except Exception as e:
+            print(f"Error checking BM25 cache version: {e}")
+            return None
+
+    @property
+    def bm25_cache_version(self) -> Optional[int]:
+        return self.segment_store.local_version
 
     def clear_cache(self) -> bool:
         try:
-            self.client.delete("bm25_model")
-            self.client.delete("bm25_docs")
-            print("Redis cache cleared successfully")
+            self.segment_store.clear()
+            self.client.delete(*LEGACY_BM25_KEYS)
+            print("BM25 cache cleared successfully")
             return True
         except Exception as e:
-            print(f"Error clearing Redis cache: {e}")
+            print(f"Error clearing BM25 cache: {e}")
             return False
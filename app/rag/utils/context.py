@@ -1,20 +1,150 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+from config import CONTEXT_TOKEN_BUDGET, CONTEXT_MAX_OVERLAP_CHARS, CONTEXT_MIN_OVERLAP_CHARS
+from .embedding_cache import normalize_text
+from .tokens import TokenCounter, get_token_counter
+
+
+def overlap_length(left: str, right: str, max_chars: int = CONTEXT_MAX_OVERLAP_CHARS,
+                   min_chars: int = CONTEXT_MIN_OVERLAP_CHARS) -> int:
+    """Độ dài đoạn cuối của `left` trùng với đoạn đầu của `right` (chunk_overlap của text splitter)"""
+    for size in range(min(len(left), len(right), max_chars), min_chars - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _position(doc) -> Optional[Tuple[str, Any, int]]:
+    """(file_name, page, chunk) nếu chunk có vị trí trong file, dùng để tìm chunk liền kề"""
+    chunk = doc.metadata.get("chunk")
+    if not isinstance(chunk, int):
+        return None
+    return doc.metadata.get("file_name"), doc.metadata.get("page"), chunk
+
 
 class ContextFormatter:
+    """
+    Đóng gói chunks thành context cho LLM trong giới hạn token:
+    chunk được chọn theo thứ tự rank cho tới khi hết budget, chunk trùng nội dung bị bỏ,
+    các chunk liền kề cùng file/page được ghép thành một block và bỏ phần overlap lặp lại.
+    """
+
+    def __init__(self, token_budget: Optional[int] = CONTEXT_TOKEN_BUDGET,
+                 counter: Optional[TokenCounter] = None):
+        self.token_budget = token_budget
+        # Tokenizer load ngay khi tạo formatter, không phải trong request đầu tiên
+        self.counter = counter or get_token_counter()
+
     def format_documents(self, documents: List[Any]) -> str:
         """Format documents thành context cho LLM"""
-        if not documents:
-            return "Không tìm thấy thông tin liên quan."
-        
-        context_parts = []
-        for i, doc in enumerate(documents, 1):
-            file_name = doc.metadata.get("file_name", "unknown")
-            page = doc.metadata.get("page", 0)
-            context_parts.append(
-                f"[Nguồn {i}: {file_name}, trang {page}]\n{doc.page_content}"
-            )
-        
-        return "\n\n".join(context_parts)
+        return self.format_context(documents)[0]
+
+    def format_context(self, documents: List[Any]) -> Tuple[str, List[Any]]:
+        """Context cho LLM và các documents thực sự nằm trong context (để build sources)"""
+        blocks, packed = self.format_blocks(documents)
+        if not blocks:
+            return "Không tìm thấy thông tin liên quan.", []
+        return "\n\n".join(blocks), packed
+
+    def format_blocks(self, documents: List[Any]) -> Tuple[List[str], List[Any]]:
+        """
+        Format từng block context (kèm nguồn + nội dung đã ghép) trong token budget.
+        Trả về (blocks, documents đã được đóng gói) - chunk bị loại vì hết budget không có trong sources.
+        """
+        packed = self.pack(documents)
+        blocks = [
+            f"[Nguồn {i}: {block['file_name']}, trang {block['page']}]\n{block['text']}"
+            for i, block in enumerate(packed, 1)
+        ]
+        return blocks, [doc for block in packed for doc in block["documents"]]
+
+    def pack(self, documents: List[Any]) -> List[Dict[str, Any]]:
+        """
+        Chọn và ghép documents (đã sắp theo rank). Trả về các block
+        {"file_name", "page", "text", "documents"} theo rank tốt nhất của block.
+        """
+        selected: List[Tuple[int, Any]] = []
+        positions: Dict[Tuple[str, Any, int], Any] = {}
+        seen = set()
+        used = 0
+        for rank, doc in enumerate(documents):
+            text = doc.page_content.strip()
+            key = normalize_text(text)
+            if not key or key in seen:
+                continue
+            # Chunk nằm trọn trong một chunk đã chọn (vd. dòng bảng) không thêm thông tin
+            if any(key in normalize_text(other.page_content) for _, other in selected):
+                continue
+
+            unique, joined = self._unique_text(doc, text, positions)
+            cost = self.counter.count(unique)
+            if not joined:
+                cost += self._header_cost(doc)
+            if self.token_budget is not None and used + cost > self.token_budget:
+                continue
+
+            used += cost
+            seen.add(key)
+            selected.append((rank, doc))
+            position = _position(doc)
+            if position is not None:
+                positions[position] = doc
+
+        blocks = self._blocks(selected)
+        if documents:
+            print(f"Context packed {len(selected)}/{len(documents)} chunks into {len(blocks)} blocks "
+                  f"({used} tokens{'' if self.counter.exact else ' estimated'}, budget {self.token_budget})")
+        return blocks
+
+    def _header_cost(self, doc) -> int:
+        file_name = doc.metadata.get("file_name", "unknown")
+        page = doc.metadata.get("page", 0)
+        return self.counter.count(f"[Nguồn 00: {file_name}, trang {page}]\n\n\n")
+
+    @staticmethod
+    def _unique_text(doc, text: str, positions) -> Tuple[str, bool]:
+        """Phần text chưa có trong các chunk liền kề đã chọn; joined = ghép vào block có sẵn"""
+        position = _position(doc)
+        if position is None:
+            return text, False
+        file_name, page, chunk = position
+        previous = positions.get((file_name, page, chunk - 1))
+        following = positions.get((file_name, page, chunk + 1))
+        start, end = 0, len(text)
+        if previous is not None:
+            start = overlap_length(previous.page_content.strip(), text)
+        if following is not None:
+            end = max(start, len(text) - overlap_length(text, following.page_content.strip()))
+        return text[start:end], previous is not None or following is not None
+
+    def _blocks(self, selected: List[Tuple[int, Any]]) -> List[Dict[str, Any]]:
+        """Gộp các chunk liên tiếp (cùng file/page, chunk số liền nhau) thành một block"""
+        runs: List[List[Tuple[int, Any]]] = []
+        positioned = sorted((item for item in selected if _position(item[1]) is not None),
+                            key=lambda item: (str(_position(item[1])[:2]), _position(item[1])[2]))
+        for item in positioned:
+            previous = runs[-1][-1][1] if runs else None
+            if previous is not None and _position(previous)[:2] == _position(item[1])[:2] \
+                    and _position(previous)[2] + 1 == _position(item[1])[2]:
+                runs[-1].append(item)
+            else:
+                runs.append([item])
+        runs.extend([item] for item in selected if _position(item[1]) is None)
+
+        blocks = []
+        for run in sorted(runs, key=lambda run: min(rank for rank, _ in run)):
+            docs = [doc for _, doc in run]
+            text = docs[0].page_content.strip()
+            for doc in docs[1:]:
+                following = doc.page_content.strip()
+                size = overlap_length(text, following)
+                text = text + following[size:] if size else f"{text}\n{following}"
+            blocks.append({
+                "file_name": docs[0].metadata.get("file_name", "unknown"),
+                "page": docs[0].metadata.get("page", 0),
+                "text": text,
+                "documents": docs,
+            })
+        return blocks
 
     # def extract_sources(self, documents: List[Any]) -> List[Dict]:
     #     """Extract thông tin nguồn từ documents"""
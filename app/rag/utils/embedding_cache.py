@@ -0,0 +1,248 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from config import EMBEDDING_CACHE_MAX_BYTES, EMBEDDING_CACHE_DTYPE
+
+
+def normalize_text(text: str) -> str:
+    """Chuẩn hóa text trước khi hash: NFC + gộp whitespace"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def text_key(model: str, text: str) -> str:
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model}:{digest}"
+
+
+def _evict_batch(total: int, target: int, count: int) -> int:
+    """Ước lượng số entries cần xóa để về dưới target (tối đa 256 mỗi lượt)"""
+    if not count:
+        return 1
+    return max(1, min(256, -(-(total - target) * count // total)))
+
+
+class RedisEmbeddingStore:
+    """
+    Embedding blobs trong Redis. Một sorted set theo thời gian truy cập cùng một
+    counter tổng bytes dùng để evict các key cũ nhất khi vượt `max_bytes`.
+    """
+
+    def __init__(self, client, prefix: str = "emb:v1", max_bytes: int = EMBEDDING_CACHE_MAX_BYTES):
+        self.client = client
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self._lru_key = f"{prefix}:lru"
+        self._bytes_key = f"{prefix}:bytes"
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        if not keys:
+            return []
+        blobs = self.client.mget([self._key(k) for k in keys])
+        hits = {k: time.time() for k, blob in zip(keys, blobs) if blob is not None}
+        if hits:
+            self.client.zadd(self._lru_key, hits)
+        return blobs
+
+    def put_many(self, items: Dict[str, bytes]):
+        if not items:
+            return
+        now = time.time()
+        pipe = self.client.pipeline()
+        for key, blob in items.items():
+            # NX: key đã có (worker khác vừa ghi cùng text) không bị tính bytes lần nữa
+            pipe.set(self._key(key), blob, nx=True)
+        pipe.zadd(self._lru_key, {key: now for key in items})
+        created = pipe.execute()[:len(items)]
+        added = sum(len(blob) for blob, ok in zip(items.values(), created) if ok)
+        if not added:
+            return
+        total = self.client.incrby(self._bytes_key, added)
+        if total > self.max_bytes:
+            self._evict(total)
+
+    def _evict(self, total: int):
+        """Xóa các embedding ít được dùng nhất cho tới khi về dưới 90% max_bytes"""
+        target = int(self.max_bytes * 0.9)
+        while total > target:
+            count = _evict_batch(total, target, self.client.zcard(self._lru_key))
+            oldest = self.client.zpopmin(self._lru_key, count)
+            if not oldest:
+                break
+            keys = [self._key(k.decode() if isinstance(k, bytes) else k) for k, _ in oldest]
+            pipe = self.client.pipeline()
+            for key in keys:
+                pipe.strlen(key)
+            freed = sum(pipe.execute())
+            self.client.delete(*keys)
+            total = self.client.decrby(self._bytes_key, freed)
+
+    def size_bytes(self) -> int:
+        return int(self.client.get(self._bytes_key) or 0)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=f"{self.prefix}:*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+class DiskEmbeddingStore:
+    """Embedding blobs trong một file SQLite local, evict theo thời gian truy cập"""
+
+    def __init__(self, directory: str, max_bytes: int = EMBEDDING_CACHE_MAX_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, "embeddings.sqlite3"),
+                                     check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, atime REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_atime ON embeddings(atime)")
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        if not keys:
+            return []
+        found: Dict[str, bytes] = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                part = list(keys[start:start + 500])
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                with self._conn:
+                    self._conn.executemany("UPDATE embeddings SET atime = ? WHERE key = ?",
+                                           [(now, key) for key in found])
+        return [found.get(key) for key in keys]
+
+    def put_many(self, items: Dict[str, bytes]):
+        if not items:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, size, atime) VALUES (?, ?, ?, ?)",
+                [(key, blob, len(blob), now) for key, blob in items.items()],
+            )
+            total = self._size_bytes()
+            if total > self.max_bytes:
+                self._evict(total)
+
+    def _evict(self, total: int):
+        target = int(self.max_bytes * 0.9)
+        while total > target:
+            count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            rows = self._conn.execute("SELECT key, size FROM embeddings ORDER BY atime LIMIT ?",
+                                      (_evict_batch(total, target, count),)).fetchall()
+            if not rows:
+                break
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", [(key,) for key, _ in rows])
+            total -= sum(size for _, size in rows)
+
+    def _size_bytes(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            return self._size_bytes()
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM embeddings")
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Bọc embedding model bằng cache content-addressed theo (model, hash của text đã chuẩn hóa).
+    Ingestion (embed_documents) và query (embed_query) dùng chung một cache,
+    chỉ các text chưa có trong cache mới được gửi tới model. Model nhận đúng text đã
+    chuẩn hóa dùng làm key, nên vector trong cache không phụ thuộc text nào ghi nó trước.
+    """
+
+    def __init__(self, embeddings: Embeddings, store, model: str,
+                 dtype: str = EMBEDDING_CACHE_DTYPE):
+        self.embeddings = embeddings
+        self.store = store
+        self.model = model
+        self.dtype = np.dtype(dtype)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        texts = [normalize_text(text) for text in texts]
+        keys = [text_key(self.model, text) for text in texts]
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        try:
+            for i, blob in enumerate(self.store.get_many(keys)):
+                if blob is not None:
+                    vectors[i] = np.frombuffer(blob, dtype=self.dtype).astype(np.float32).tolist()
+        except Exception as e:
+            self._count(errors=1)
+            print(f"! Embedding cache read failed: {e}")
+
+        # Text trùng nhau trong cùng batch chỉ embed một lần
+        missing: Dict[str, List[int]] = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(keys[i], []).append(i)
+        self._count(hits=len(texts) - sum(len(v) for v in missing.values()), misses=len(missing))
+        if not missing:
+            return vectors
+
+        fresh = self.embeddings.embed_documents([texts[idx[0]] for idx in missing.values()])
+        new_items = {}
+        for (key, indices), vector in zip(missing.items(), fresh):
+            for i in indices:
+                vectors[i] = vector
+            new_items[key] = np.asarray(vector, dtype=self.dtype).tobytes()
+        try:
+            self.store.put_many(new_items)
+        except Exception as e:
+            self._count(errors=1)
+            print(f"! Embedding cache write failed: {e}")
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def _count(self, hits: int = 0, misses: int = 0, errors: int = 0):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            self.errors += errors
+
+    def get_stats(self) -> Dict[str, object]:
+        total = self.hits + self.misses
+        try:
+            size = self.store.size_bytes()
+        except Exception:
+            size = None
+        return {
+            "model": self.model,
+            "backend": type(self.store).__name__,
+            "dtype": self.dtype.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+            "size_bytes": size,
+            "max_bytes": self.store.max_bytes,
+        }
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain.schema import Document
+
+from config import (
+    RETRIEVAL_CACHE_MAX_ENTRIES, RETRIEVAL_CACHE_TTL, RETRIEVAL_CACHE_PREFIX,
+)
+from .embedding_cache import normalize_text
+
+Results = List[Tuple[Any, float]]
+
+
+class IndexGeneration:
+    """
+    Counter trong Redis, tăng mỗi khi nội dung index thay đổi (ingest, delete, rebuild).
+    Generation nằm trong cache key nên mọi entry cũ tự hết hiệu lực ở mọi worker.
+    """
+
+    def __init__(self, client, key: str = f"{RETRIEVAL_CACHE_PREFIX}:generation"):
+        self.client = client
+        self.key = key
+
+    def current(self) -> Optional[int]:
+        """None nếu không đọc được Redis (caller bỏ qua cache thay vì trả kết quả cũ)"""
+        try:
+            return int(self.client.get(self.key) or 0)
+        except Exception as e:
+            print(f"! Cannot read index generation: {e}")
+            return None
+
+    def bump(self, reason: str = "") -> Optional[int]:
+        try:
+            generation = int(self.client.incr(self.key))
+            print(f"✓ Index generation -> {generation}" + (f" ({reason})" if reason else ""))
+            return generation
+        except Exception as e:
+            print(f"! Cannot bump index generation: {e}")
+            return None
+
+
+def retrieval_key(query: str, metadata_filter: Optional[Dict], k: Optional[int], alpha: float,
+                  use_rerank: bool, **extra) -> str:
+    """Hash của query đã chuẩn hóa cùng mọi tham số ảnh hưởng tới kết quả retrieval"""
+    payload = json.dumps({
+        "query": normalize_text(query),
+        "filter": metadata_filter or {},
+        "k": k,
+        "alpha": round(float(alpha), 6),
+        "rerank": bool(use_rerank),
+        **extra,
+    }, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _dump_results(results: Results) -> bytes:
+    return json.dumps([{"page_content": doc.page_content, "metadata": doc.metadata, "score": score}
+                       for doc, score in results], ensure_ascii=False, default=str).encode("utf-8")
+
+
+def _load_results(blob: bytes) -> Results:
+    return [(Document(page_content=item["page_content"], metadata=item["metadata"]), item["score"])
+            for item in json.loads(blob)]
+
+
+class RetrievalCache:
+    """
+    Cache kết quả retrieval (sau search + rerank) theo (generation, retrieval_key).
+    Tier 1: LRU trong process, giới hạn số entries và TTL.
+    Tier 2 (tùy chọn): Redis dùng chung giữa các worker, TTL do Redis quản lý.
+    """
+
+    def __init__(self, generation: IndexGeneration, client=None,
+                 max_entries: int = RETRIEVAL_CACHE_MAX_ENTRIES,
+                 ttl: float = RETRIEVAL_CACHE_TTL,
+                 prefix: str = RETRIEVAL_CACHE_PREFIX):
+        self.generation = generation
+        self.client = client
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.prefix = prefix
+        self._entries: "OrderedDict[str, Tuple[float, Results]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def _full_key(self, key: str, generation: int) -> str:
+        return f"{self.prefix}:{generation}:{key}"
+
+    def get(self, key: str, generation: Optional[int]) -> Optional[Results]:
+        """
+        `generation` phải được đọc (generation.current()) trước khi search, và truyền
+        lại cho put(): kết quả tính trong lúc index đổi sẽ nằm dưới generation cũ.
+        """
+        if generation is None:
+            return None
+        full_key = self._full_key(key, generation)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(full_key)
+            if entry is not None:
+                expires, results = entry
+                if expires > now:
+                    self._entries.move_to_end(full_key)
+                    self.hits += 1
+                    return list(results)
+                del self._entries[full_key]
+
+        if self.client is not None:
+            try:
+                blob = self.client.get(full_key)
+            except Exception as e:
+                print(f"! Retrieval cache read failed: {e}")
+                blob = None
+            if blob is not None:
+                results = _load_results(blob)
+                self._remember(full_key, results, now)
+                with self._lock:
+                    self.redis_hits += 1
+                return list(results)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, results: Results, generation: Optional[int]) -> None:
+        if generation is None:
+            return
+        full_key = self._full_key(key, generation)
+        self._remember(full_key, list(results), time.monotonic())
+        if self.client is not None:
+            try:
+                self.client.set(full_key, _dump_results(results), ex=max(1, int(self.ttl)))
+            except Exception as e:
+                print(f"! Retrieval cache write failed: {e}")
+
+    def _remember(self, full_key: str, results: Results, now: float) -> None:
+        with self._lock:
+            self._entries[full_key] = (now + self.ttl, results)
+            self._entries.move_to_end(full_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Chỉ xóa tier local; tier Redis hết hiệu lực qua generation / TTL"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        generation = self.generation.current()
+        with self._lock:
+            lookups = self.hits + self.redis_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "shared": self.client is not None,
+                "generation": generation,
+                "hits": self.hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.redis_hits) / lookups, 4) if lookups else None,
+            }
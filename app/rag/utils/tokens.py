@@ -0,0 +1,66 @@
+import functools
+import os
+from typing import Optional
+
+from config import CONTEXT_TOKENIZER, CONTEXT_TOKENIZER_MODEL, CONTEXT_CHARS_PER_TOKEN
+
+
+class TokenCounter:
+    """
+    Đếm token bằng tokenizer của model sinh câu trả lời (file tokenizer.json local,
+    không tải từ HuggingFace lúc chạy, xem export_tokenizer).
+    Không có file / thiếu package thì ước lượng theo số ký tự: khi đó token budget
+    của context chỉ là gần đúng (exact = False).
+    """
+
+    def __init__(self, path: Optional[str] = CONTEXT_TOKENIZER,
+                 chars_per_token: float = CONTEXT_CHARS_PER_TOKEN):
+        self.path = path
+        self.chars_per_token = chars_per_token
+        self.tokenizer = None
+        if not path:
+            self._warn_estimate("no tokenizer configured")
+            return
+        try:
+            from tokenizers import Tokenizer
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"{path} not found - run `python -m rag.utils.tokens` to export it")
+            self.tokenizer = Tokenizer.from_file(path)
+            print(f"✓ Token counter using tokenizer {path}")
+        except Exception as e:
+            self._warn_estimate(f"cannot load tokenizer: {e}")
+
+    def _warn_estimate(self, reason: str):
+        print(f"! Context token budget is approximate ({reason}); "
+              f"estimating {self.chars_per_token} chars per token")
+
+    @property
+    def exact(self) -> bool:
+        return self.tokenizer is not None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.tokenizer is not None:
+            return len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+        return int(len(text) / self.chars_per_token) + 1
+
+
+@functools.lru_cache(maxsize=None)
+def get_token_counter(path: Optional[str] = CONTEXT_TOKENIZER) -> TokenCounter:
+    """Một TokenCounter cho mỗi tokenizer trong process"""
+    return TokenCounter(path)
+
+
+def export_tokenizer(model_name: str = CONTEXT_TOKENIZER_MODEL, path: str = CONTEXT_TOKENIZER) -> str:
+    """Tải tokenizer của model từ HuggingFace một lần và lưu thành tokenizer.json cho TokenCounter"""
+    from tokenizers import Tokenizer
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    Tokenizer.from_pretrained(model_name).save(path)
+    print(f"✓ Tokenizer of {model_name} saved to {path}")
+    return path
+
+
+if __name__ == "__main__":
+    export_tokenizer()
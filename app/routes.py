@@ -1,16 +1,16 @@
 from flask import Blueprint, jsonify, request
-from chat.service import ChatService
-from vector_store import VectorStoreManager
-from config import PDF_FOLDER
+from config import PDF_FOLDER, INGEST_RETRY_AFTER
+from services import get_services
+from ingestion.jobs import QueueFullError, buffer_upload
+from ingestion.tasks import ingest_idioms, ingest_pdf
 import os
 
 
 # Create blueprint
 api_bp = Blueprint('api', __name__)
 
-# Initialize services
-chat_service = ChatService()
-vector_manager = VectorStoreManager()
+# Shared services (lazily initialized on first access)
+services = get_services()
 
 @api_bp.route("/ai", methods=["POST"])
 def ai_post():
@@ -19,7 +19,7 @@ def ai_post():
     json_content = request.json
     query = json_content.get("query", "")
     
-    response = chat_service.simple_chat(query)
+    response = services.chat_service.simple_chat(query)
     return {"answer": response}
 
 # @api_bp.route("/ask_pdf", methods=["POST"])
@@ -31,6 +31,23 @@ def ai_post():
     
 #     result = chat_service.rag_chat(query)
 #     return result
+def _is_sync(req) -> bool:
+    """Client gửi sync=true để chạy ingestion ngay trong request (hành vi cũ)"""
+    return str(req.form.get("sync", req.args.get("sync", ""))).lower() in ("1", "true", "yes")
+
+def _job_accepted(job):
+    return {
+        "status": job.status,
+        "job_id": job.id,
+        "filename": job.filename,
+        "status_url": f"/jobs/{job.id}",
+        "stream_url": f"/jobs/{job.id}/stream",
+    }, 202
+
+def _queue_full(error):
+    """Hàng đợi ingestion đầy: server quá tải tạm thời, client thử lại sau"""
+    return {"error": str(error)}, 503, {"Retry-After": str(INGEST_RETRY_AFTER)}
+
 @api_bp.route("/idioms", methods=["POST"])
 def idioms_post():
     """Upload and process idioms PDF file"""
@@ -38,23 +55,20 @@ def idioms_post():
     if not file:
         return {"error": "No file part in the request. Make sure to send 'file' as form-data."}, 400
 
+    source_name = request.form.get("source_name", "idioms")
     try:
-        # Process idioms directly from file object (MinIO handling is done inside process_idiom)
-        source_name = request.form.get("source_name", "idioms")
-        docs_len, chunks_len, final_count = vector_manager.process_idiom(
-            file,  # Pass file object directly instead of save_file
-            source_name=source_name
-        )
+        if _is_sync(request):
+            result = ingest_idioms(file, source_name=source_name)
+            return {"status": "Successfully Uploaded", **result}
 
-        return {
-            "status": "Successfully Uploaded",
-            "filename": file.filename,
-            "source": source_name,
-            "docs": docs_len,
-            "chunks": chunks_len,
-            "final_count": final_count,
-        }
+        # Đưa vào job queue, trả job id ngay
+        job = services.job_manager.submit(
+            "idioms", file.filename, ingest_idioms, buffer_upload(file), source_name=source_name
+        )
+        return _job_accepted(job)
 
+    except QueueFullError as e:
+        return _queue_full(e)
     except Exception as e:
         return {"error": f"Failed to process idioms: {str(e)}"}, 500
 
@@ -66,22 +80,68 @@ def pdf_post():
         return {"error": "No file part in the request"}, 400
 
     try:
-        # Process PDF directly from file object
-        doc_len, chunks_len = vector_manager.process_pdf(file)
-        
-        return {
-            "status": "Successfully Uploaded",
-            "filename": file.filename,
-            "doc_len": doc_len,
-            "chunks": chunks_len,
-        }
+        if _is_sync(request):
+            result = ingest_pdf(file)
+            return {"status": "Successfully Uploaded", **result}
+
+        job = services.job_manager.submit("pdf", file.filename, ingest_pdf, buffer_upload(file))
+        return _job_accepted(job)
+
+    except QueueFullError as e:
+        return _queue_full(e)
     except Exception as e:
         return {"error": f"Failed to process PDF: {str(e)}"}, 500
 
+@api_bp.route("/documents/<path:file_name>", methods=["PUT"])
+def replace_document(file_name):
+    """Replace a document: chỉ chunk thay đổi được embed lại, chunk không còn bị xóa"""
+    file = request.files.get("file")
+    if not file:
+        return {"error": "No file part in the request"}, 400
+
+    upload = buffer_upload(file)
+    upload.filename = file_name
+    if request.form.get("type") == "idioms":
+        kind, task, kwargs = "idioms", ingest_idioms, {"source_name": request.form.get("source_name", "idioms")}
+    else:
+        kind, task, kwargs = "pdf", ingest_pdf, {}
+    try:
+        if _is_sync(request):
+            return {"status": "Successfully Replaced", **task(upload, **kwargs)}
+
+        job = services.job_manager.submit(kind, file_name, task, upload, **kwargs)
+        return _job_accepted(job)
+
+    except QueueFullError as e:
+        return _queue_full(e)
+    except Exception as e:
+        return {"error": f"Failed to replace document: {str(e)}"}, 500
+
+@api_bp.route("/documents/<path:file_name>", methods=["DELETE"])
+def delete_document(file_name):
+    """Delete a document from Qdrant, BM25 and storage"""
+    try:
+        return {"status": "success", **services.vector_manager.delete_file(file_name)}
+    except Exception as e:
+        return {"status": "error", "error": str(e)}, 500
+
+@api_bp.route("/jobs", methods=["GET"])
+def list_jobs():
+    """List recent ingestion jobs"""
+    return {"jobs": services.job_manager.list_jobs()}
+
+@api_bp.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """Ingestion job status"""
+    job = services.job_manager.get(job_id)
+    if job is None:
+        return {"error": "Job not found"}, 404
+    return job.to_dict()
+
 @api_bp.route("/clear_history", methods=["POST"])
 def clear_history():
     """Clear chat history"""
-    chat_service.clear_history()
+    services.chat_service.clear_history()
     return {"status": "Chat history cleared"}
 
 @api_bp.route("/health", methods=["GET"])
@@ -94,13 +154,13 @@ def debug_vectorstore():
     """Debug vector store information"""
     try:
         # Lấy thông tin collection
-        collection_info = vector_manager.get_collection_info()
+        collection_info = services.vector_manager.get_collection_info()
         if not collection_info:
             return {"status": "error", "error": "Cannot get collection info"}, 500
 
         # Lấy sample metadata từ Qdrant
-        points, _ = vector_manager.client.scroll(
-            collection_name=vector_manager.collection_name,
+        points, _ = services.vector_manager.client.scroll(
+            collection_name=services.vector_manager.collection_name,
             limit=5
         )
         sample_payloads = [p.payload for p in points]
@@ -117,6 +177,46 @@ def debug_vectorstore():
 
 
 
+@api_bp.route("/debug/index_status", methods=["GET"])
+def index_status():
+    """BM25 index readiness and bootstrap progress"""
+    return services.rag_handler.get_index_status()
+
+
+@api_bp.route("/debug/embedding_cache", methods=["GET"])
+def embedding_cache_stats():
+    """Hit/miss counters của embedding cache"""
+    embeddings = services.embeddings
+    if not hasattr(embeddings, "get_stats"):
+        return {"enabled": False}
+    return {"enabled": True, **embeddings.get_stats()}
+
+
+@api_bp.route("/debug/retrieval_cache", methods=["GET"])
+def retrieval_cache_stats():
+    """Hit/miss counters và index generation của retrieval cache"""
+    cache = services.retrieval_cache
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.get_stats()}
+
+
+@api_bp.route("/debug/reranker", methods=["GET"])
+def reranker_stats():
+    """Batch size, depth, hit/miss của rerank score cache và tần suất từng path của cascade"""
+    cascade = services.rag_handler.cascade
+    return {**services.reranker.get_stats(), "cascade": cascade.get_stats() if cascade else None}
+
+
+@api_bp.route("/debug/answer_cache", methods=["GET"])
+def answer_cache_stats():
+    """Hit/miss counters của semantic answer cache"""
+    cache = services.answer_cache
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.get_stats()}
+
+
 @api_bp.route("/debug/search", methods=["POST"])
 def debug_search():
     """Debug search functionality"""
@@ -124,8 +224,8 @@ def debug_search():
     query = json_content.get("query", "test")
     
     try:
-        vector_store = vector_manager.load_vector_store()
-        retriever = vector_manager.get_retriever(vector_store)
+        vector_store = services.vector_manager.load_vector_store()
+        retriever = services.vector_manager.get_retriever(vector_store)
         
         results = retriever.get_relevant_documents(query)
         
@@ -145,11 +245,34 @@ def debug_search():
     except Exception as e:
         return {"status": "error", "error": str(e)}, 500
 
+@api_bp.route("/debug/apply_profile", methods=["POST"])
+def apply_profile():
+    """Migrate the collection to a collection profile (quantization / HNSW / on_disk)"""
+    data = request.get_json(silent=True) or {}
+    try:
+        from collection_profiles import CollectionProfile
+        profile = CollectionProfile.from_config(data.get("profile", services.vector_manager.profile.name))
+        services.vector_manager.apply_profile(profile)
+        return {"status": "success", "profile": profile.to_dict()}
+    except ValueError as e:
+        return {"status": "error", "error": str(e)}, 400
+    except Exception as e:
+        return {"status": "error", "error": str(e)}, 500
+
+@api_bp.route("/debug/backfill_sparse", methods=["POST"])
+def backfill_sparse():
+    """Ghi sparse vector cho các points cũ (hybrid backend "qdrant")"""
+    try:
+        updated = services.vector_manager.backfill_sparse_vectors()
+        return {"status": "success", "updated": updated}
+    except Exception as e:
+        return {"status": "error", "error": str(e)}, 500
+
 @api_bp.route("/debug/reset", methods=["POST"])
 def reset_collection():
     """Reset collection (xóa và tạo lại)"""
     try:
-        vector_manager.delete_collection()
+        services.vector_manager.delete_collection()
         return {"status": "success", "message": "Collection reset successfully"}
     except Exception as e:
         return {"status": "error", "error": str(e)}, 500
@@ -183,13 +306,14 @@ def chat():
     query = data.get("query", "")
     search_type = data.get("search_type", "hybrid")  # default to hybrid
     
-    result = chat_service.chat_with_history(
+    result = services.chat_service.chat_with_history(
         query=query,
         search_type=search_type,
         k=data.get("k"),
         alpha=data.get("alpha", 0.5),
         metadata_filter=data.get("metadata_filter"),
-        use_rerank=data.get("use_rerank", True)
+        use_rerank=data.get("use_rerank", True),
+        fusion=data.get("fusion")
     )
     return result
 
@@ -204,7 +328,7 @@ def chat():
 @api_bp.route("/clear_indexes", methods=["POST"])
 def clear_indexes():
     """Clear search indexes and caches"""
-    success = chat_service.rag_handler.clear_search_indexes()
+    success = services.chat_service.rag_handler.clear_search_indexes()
     if success:
         return jsonify({"status": "success", "message": "Indexes and caches cleared"}), 200
     else:
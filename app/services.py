@@ -0,0 +1,197 @@
+import threading
+from typing import Any, Callable, Dict
+
+from config import (
+    QDRANT_HOST, QDRANT_PORT, REDIS_HOST, REDIS_PORT, REDIS_DB, PDF_EXTRACT_WORKERS,
+    EMBEDDING_MODEL, EMBEDDING_CACHE_BACKEND, EMBEDDING_CACHE_DIR, HYBRID_BACKEND,
+    HYBRID_SEARCH_WORKERS, QDRANT_SEARCH_TIMEOUT, RETRIEVAL_CACHE_ENABLED, RETRIEVAL_CACHE_SHARED,
+    ANSWER_CACHE_ENABLED,
+)
+
+
+class ServiceContainer:
+    """
+    Process-wide registry cho các model, client và search index dùng chung.
+    Mỗi component được khởi tạo lazily đúng một lần (thread-safe), để mọi
+    blueprint, ChatService, RAGHandler và RAGGraph dùng chung một bản.
+    """
+
+    def __init__(self):
+        # RLock vì factory của một component có thể resolve component khác
+        self._lock = threading.RLock()
+        self._instances: Dict[str, Any] = {}
+
+    def _get(self, name: str, factory: Callable[[], Any]) -> Any:
+        instance = self._instances.get(name)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(name)
+                if instance is None:
+                    print(f"Initializing shared component: {name}")
+                    instance = factory()
+                    self._instances[name] = instance
+        return instance
+
+    def is_initialized(self, name: str) -> bool:
+        return name in self._instances
+
+    # Models
+    @property
+    def embeddings(self):
+        return self._get("embeddings", self._create_embeddings)
+
+    def _create_embeddings(self):
+        from models import get_embeddings
+        embeddings = get_embeddings()
+        if not EMBEDDING_CACHE_BACKEND:
+            return embeddings
+        from rag.utils.embedding_cache import CachedEmbeddings, DiskEmbeddingStore, RedisEmbeddingStore
+        if EMBEDDING_CACHE_BACKEND == "disk":
+            store = DiskEmbeddingStore(EMBEDDING_CACHE_DIR)
+        else:
+            store = RedisEmbeddingStore(self.redis)
+        return CachedEmbeddings(embeddings, store, model=EMBEDDING_MODEL)
+
+    @property
+    def text_splitter(self):
+        from models import get_text_splitter
+        return self._get("text_splitter", get_text_splitter)
+
+    @property
+    def llm(self):
+        from models import get_llm
+        return self._get("llm", get_llm)
+
+    @property
+    def llm_stream(self):
+        from models import get_llm_stream
+        return self._get("llm_stream", get_llm_stream)
+
+    @property
+    def reranker(self):
+        from rag.retrieval.reranker import CrossEncoderReranker
+        return self._get("reranker", CrossEncoderReranker)
+
+    # Clients
+    @property
+    def qdrant_client(self):
+        from qdrant_client import QdrantClient
+        return self._get("qdrant_client", lambda: QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT))
+
+    @property
+    def search_qdrant_client(self):
+        """Client riêng cho search: HTTP timeout ngắn, không ảnh hưởng upsert lớn của ingestion"""
+        from qdrant_client import QdrantClient
+        return self._get("search_qdrant_client", lambda: QdrantClient(
+            host=QDRANT_HOST, port=QDRANT_PORT, timeout=QDRANT_SEARCH_TIMEOUT))
+
+    @property
+    def storage(self):
+        from storage.minio_client import MinioClient
+        return self._get("storage", MinioClient)
+
+    @property
+    def redis(self):
+        import redis
+        return self._get("redis", lambda: redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB))
+
+    @property
+    def cache_manager(self):
+        from rag.utils.cache import CacheManager
+        return self._get("cache_manager", lambda: CacheManager(client=self.redis))
+
+    @property
+    def index_generation(self):
+        from rag.utils.result_cache import IndexGeneration
+        return self._get("index_generation", lambda: IndexGeneration(self.redis))
+
+    @property
+    def retrieval_cache(self):
+        """None khi tắt RETRIEVAL_CACHE_ENABLED"""
+        if not RETRIEVAL_CACHE_ENABLED:
+            return None
+        from rag.utils.result_cache import RetrievalCache
+        return self._get("retrieval_cache", lambda: RetrievalCache(
+            self.index_generation, client=self.redis if RETRIEVAL_CACHE_SHARED else None))
+
+    @property
+    def answer_cache(self):
+        """None khi tắt ANSWER_CACHE_ENABLED"""
+        if not ANSWER_CACHE_ENABLED:
+            return None
+        from chat.answer_cache import SemanticAnswerCache
+        return self._get("answer_cache", lambda: SemanticAnswerCache(
+            self.qdrant_client, self.embeddings, self.index_generation))
+
+    # Search indexes
+    @property
+    def vector_manager(self):
+        from vector_store import VectorStoreManager
+        return self._get("vector_manager", lambda: VectorStoreManager(self))
+
+    @property
+    def bm25_search(self):
+        from rag.search.bm25 import BM25Search
+        return self._get("bm25_search", lambda: BM25Search(self.cache_manager))
+
+    @property
+    def vector_search(self):
+        from rag.search.vector import VectorSearch
+        return self._get("vector_search", lambda: VectorSearch(self))
+
+    @property
+    def hybrid_search(self):
+        return self._get("hybrid_search", self._create_hybrid_search)
+
+    def _create_hybrid_search(self):
+        from rag.search.hybrid import HybridSearch
+        native = None
+        if HYBRID_BACKEND == "qdrant":
+            from rag.search.qdrant_hybrid import QdrantHybridSearch
+            native = QdrantHybridSearch(self.vector_manager)
+        return HybridSearch(self.bm25_search, self.vector_search, native=native,
+                            executor=self.search_executor)
+
+    @property
+    def search_executor(self):
+        from concurrent.futures import ThreadPoolExecutor
+        return self._get("search_executor", lambda: ThreadPoolExecutor(
+            max_workers=HYBRID_SEARCH_WORKERS, thread_name_prefix="search"))
+
+    @property
+    def pdf_executor(self):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # spawn thay vì fork: process cha có nhiều thread (Flask, merge, ingestion)
+        return self._get("pdf_executor", lambda: ProcessPoolExecutor(
+            max_workers=PDF_EXTRACT_WORKERS, mp_context=multiprocessing.get_context("spawn")))
+
+    # Services
+    @property
+    def job_manager(self):
+        from ingestion.jobs import JobManager
+        return self._get("job_manager", JobManager)
+
+    @property
+    def rag_handler(self):
+        from rag.handler import RAGHandler
+        return self._get("rag_handler", lambda: RAGHandler(self))
+
+    @property
+    def chat_service(self):
+        from chat.service import ChatService
+        return self._get("chat_service", lambda: ChatService(self))
+
+
+_services = None
+_services_lock = threading.Lock()
+
+
+def get_services() -> ServiceContainer:
+    """Return the process-wide service container"""
+    global _services
+    if _services is None:
+        with _services_lock:
+            if _services is None:
+                _services = ServiceContainer()
+    return _services
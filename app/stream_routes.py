@@ -1,12 +1,13 @@
 from flask import Blueprint, Response, request, stream_with_context
 import json
 
-from chat.service import ChatService
-from vector_store import VectorStoreManager
+from config import INGEST_RETRY_AFTER
+from services import get_services
+from ingestion.jobs import QueueFullError, buffer_upload
+from ingestion.tasks import ingest_idioms
 
-vector_manager = VectorStoreManager()
 stream_bp = Blueprint("stream", __name__)
-chat_service = ChatService()
+services = get_services()
 
 def sse_format(data: dict):
     """Format data as SSE event"""
@@ -23,6 +24,7 @@ def chat_stream():
     alpha = data.get("alpha", 0.5)
     metadata_filter = data.get("metadata_filter")
     use_rerank = data.get("use_rerank", True)
+    fusion = data.get("fusion")
 
     def generate():
         try:
@@ -30,16 +32,18 @@ def chat_stream():
             yield sse_format({"event": "start", "msg": "stream_start"})
 
             # ChatService cần có hàm stream
-            for chunk in chat_service.chat_with_history_stream(
+            for chunk in services.chat_service.chat_with_history_stream(
                 query=query,
                 search_type=search_type,
                 k=k,
                 alpha=alpha,
                 metadata_filter=metadata_filter,
-                use_rerank=use_rerank
+                use_rerank=use_rerank,
+                fusion=fusion
             ):
                 # print(f"[DEBUG] stream chunk: {chunk}", flush=True)
-                yield sse_format({"text": chunk})
+                # dict = event (vd. sources), str = text chunk
+                yield sse_format(chunk if isinstance(chunk, dict) else {"text": chunk})
 
             # Gửi event kết thúc
             yield sse_format({"event": "end", "msg": "stream_end"})
@@ -47,25 +51,40 @@ def chat_stream():
             yield sse_format({"event": "error", "msg": str(e)})
     return Response(stream_with_context(generate()), mimetype="text/event-stream")
 
-# @stream_bp.route("/idioms_stream", methods=["POST"])
-# def idioms_stream():
-#     file = request.files.get("file")
-#     if not file:
-#         return Response(
-#             sse_format({"event": "error", "msg": "No file provided"}),
-#             mimetype="text/event-stream"
-#         )
-
-#     def generate():
-#         try:
-#             yield sse_format({"event": "start", "msg": "Upload started"})
-
-#             source_name = request.form.get("source_name", "idioms")
+def _stream_job(job_id: str):
+    """Forward job events dạng SSE cho tới khi job kết thúc"""
+    def generate():
+        for event in services.job_manager.events(job_id):
+            yield sse_format(event)
+    return Response(stream_with_context(generate()), mimetype="text/event-stream")
 
-#             # forward từng event từ process_idiom_stream
-#             for event in vector_manager.process_idiom_stream(file, source_name=source_name):
-#                 yield sse_format(event)
+@stream_bp.route("/jobs/<job_id>/stream", methods=["GET"])
+def job_stream(job_id):
+    """SSE progress stream of an ingestion job"""
+    if services.job_manager.get(job_id) is None:
+        return Response(
+            sse_format({"event": "error", "msg": "Job not found"}),
+            mimetype="text/event-stream", status=404
+        )
+    return _stream_job(job_id)
 
-#         except Exception as e:
-#             yield sse_format({"event": "error", "msg": str(e)})
+@stream_bp.route("/idioms_stream", methods=["POST"])
+def idioms_stream():
+    """Upload idioms PDF as a job and stream its progress"""
+    file = request.files.get("file")
+    if not file:
+        return Response(
+            sse_format({"event": "error", "msg": "No file provided"}),
+            mimetype="text/event-stream"
+        )
 
+    source_name = request.form.get("source_name", "idioms")
+    try:
+        job = services.job_manager.submit(
+            "idioms", file.filename, ingest_idioms, buffer_upload(file), source_name=source_name
+        )
+    except QueueFullError as e:
+        return Response(sse_format({"event": "error", "msg": str(e)}),
+                        mimetype="text/event-stream", status=503,
+                        headers={"Retry-After": str(INGEST_RETRY_AFTER)})
+    return _stream_job(job.id)
@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+
+class HashEmbeddings(Embeddings):
+    """Embedding giả, deterministic theo nội dung (không cần model)"""
+    size = 4
+
+    def embed_query(self, text):
+        return [float(len(text) % 7 + 1), float(sum(map(ord, text)) % 11 + 1), 1.0, float(text.count(" ") + 1)]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+class MemoryStorage:
+    """MinIO giả: lưu file trong dict, có thể cho lỗi khi xóa"""
+
+    def __init__(self):
+        self.files = {}
+        self.fail_delete = False
+        self.lock = threading.Lock()
+
+    def upload_file(self, data, file_name):
+        with self.lock:
+            self.files[file_name] = data.read()
+        return True
+
+    def delete_file(self, file_name):
+        if self.fail_delete:
+            raise ConnectionError("minio unavailable")
+        with self.lock:
+            return self.files.pop(file_name, None) is not None
+
+
+class Generation:
+    def __init__(self):
+        self.bumps = []
+
+    def bump(self, reason=""):
+        self.bumps.append(reason)
+        return len(self.bumps)
+
+    def current(self):
+        return len(self.bumps)
+
+
+@pytest.fixture
+def vector_manager(monkeypatch):
+    """
+    VectorStoreManager trên Qdrant in-memory với pipeline embed / upsert thật,
+    BM25 index thật (Redis giả), MinIO giả. Chỉ dùng backend "local".
+    """
+    fakeredis = pytest.importorskip("fakeredis")
+    vector_store = pytest.importorskip("vector_store")
+    from qdrant_client import QdrantClient
+
+    from collection_profiles import CollectionProfile
+    from ingestion.pipeline import EmbedUpsertPipeline
+    from rag.search.bm25 import BM25Search
+    from rag.search.sparse import SparseEncoder
+    from rag.utils.cache import CacheManager
+
+    monkeypatch.setattr(vector_store, "HYBRID_BACKEND", "local")
+    monkeypatch.setattr(vector_store, "QDRANT_SPARSE_VECTORS", False)
+    client = QdrantClient(":memory:")
+    manager = vector_store.VectorStoreManager.__new__(vector_store.VectorStoreManager)
+    manager.client = client
+    manager.collection_name = "documents"
+    manager.embedding = HashEmbeddings()
+    manager.profile = CollectionProfile.from_config("default")
+    manager.storage = MemoryStorage()
+    manager.sparse_encoder = SparseEncoder()
+    manager.sparse_enabled = False
+    manager.pipeline = EmbedUpsertPipeline(manager.embedding, client, manager.collection_name, batch_size=4)
+    manager.bm25_search = BM25Search(CacheManager(client=fakeredis.FakeRedis(), index_dir=None))
+    manager.bm25_search.index.background_merge = False
+    manager.index_generation = Generation()
+    manager._vector_store = None
+    manager._file_locks = {}
+    manager._file_locks_guard = threading.Lock()
+    manager._ensure_collection_exists()
+    yield manager
+    client.close()
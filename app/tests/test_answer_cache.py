@@ -0,0 +1,102 @@
+import pytest
+from qdrant_client import QdrantClient
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from chat.answer_cache import SemanticAnswerCache, answer_scope, replay_chunks
+from rag.utils.result_cache import IndexGeneration
+
+QUESTION = "Thủ đô của Việt Nam là gì?"
+PARAPHRASE = "Thủ đô Việt Nam là gì?"
+OTHER = "Sông nào dài nhất thế giới?"
+
+
+class KeywordEmbeddings:
+    """Embedding giả: câu hỏi cùng chủ đề cho vector gần nhau, khác chủ đề thì trực giao"""
+    topics = ("thủ đô", "sông")
+
+    def embed_query(self, text):
+        text = text.lower()
+        vector = [1.0 if topic in text else 0.0 for topic in self.topics]
+        # Chiều phụ nhỏ theo độ dài để câu diễn đạt lại không trùng hẳn
+        return vector + [len(text) / 1000.0]
+
+
+@pytest.fixture
+def generation():
+    return IndexGeneration(fakeredis.FakeRedis(), key="test:generation")
+
+
+@pytest.fixture
+def cache(generation):
+    client = QdrantClient(":memory:")
+    yield SemanticAnswerCache(client, KeywordEmbeddings(), generation, collection_name="answers",
+                              threshold=0.95, ttl=3600, min_query_chars=12)
+    client.close()
+
+
+SOURCES = [{"file_name": "dia_ly.pdf", "page": 3}]
+
+
+def test_lookup_replays_similar_question(cache, generation):
+    scope = answer_scope("hybrid", None, k=5)
+    current = generation.current()
+    assert cache.lookup(QUESTION, scope, current) is None
+    assert cache.store(QUESTION, scope, "Hà Nội.", SOURCES, current)
+    hit = cache.lookup(PARAPHRASE, scope, current)
+    assert hit["answer"] == "Hà Nội." and hit["sources"] == SOURCES
+    assert hit["query"] == QUESTION and hit["score"] >= 0.95
+    assert cache.lookup(OTHER, scope, current) is None
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+
+
+def test_scope_separates_filters_and_params(cache, generation):
+    current = generation.current()
+    cache.store(QUESTION, answer_scope("hybrid", None, k=5), "Hà Nội.", SOURCES, current)
+    assert cache.lookup(QUESTION, answer_scope("hybrid", {"file_name": "a.pdf"}, k=5), current) is None
+    assert cache.lookup(QUESTION, answer_scope("hybrid", None, k=10), current) is None
+    # Thứ tự key của filter không đổi scope
+    assert answer_scope("rag", {"a": 1, "b": 2}) == answer_scope("rag", {"b": 2, "a": 1})
+
+
+def test_generation_change_invalidates_and_purges(cache, generation):
+    scope = answer_scope("hybrid", None)
+    old = generation.current()
+    cache.store(QUESTION, scope, "Hà Nội.", SOURCES, old)
+    new = generation.bump("ingest")
+    assert cache.lookup(QUESTION, scope, new) is None
+    # Entry của generation cũ bị xóa khỏi collection ở lần lookup đầu tiên của generation mới
+    assert cache.client.count("answers").count == 0
+    assert cache.lookup(QUESTION, scope, old) is None
+
+
+def test_same_question_overwrites_entry(cache, generation):
+    scope, current = answer_scope("hybrid", None), generation.current()
+    cache.store(QUESTION, scope, "Huế.", SOURCES, current)
+    cache.store(QUESTION, scope, "Hà Nội.", SOURCES, current)
+    assert cache.client.count("answers").count == 1
+    assert cache.lookup(QUESTION, scope, current)["answer"] == "Hà Nội."
+
+
+def test_short_empty_and_unknown_generation_are_not_cached(cache, generation):
+    scope, current = answer_scope("hybrid", None), generation.current()
+    assert not cache.store("tại sao?", scope, "Vì ...", SOURCES, current)
+    assert not cache.store(QUESTION, scope, "   ", SOURCES, current)
+    assert not cache.store(QUESTION, scope, "Hà Nội.", SOURCES, None)
+    assert cache.lookup(QUESTION, scope, None) is None
+    assert cache.lookup("tại sao?", scope, current) is None
+
+
+def test_expired_entries_are_ignored(cache, generation):
+    scope, current = answer_scope("hybrid", None), generation.current()
+    cache.store(QUESTION, scope, "Hà Nội.", SOURCES, current)
+    cache.ttl = -1
+    assert cache.lookup(QUESTION, scope, current) is None
+
+
+def test_replay_chunks_rebuild_answer():
+    answer = "Hà Nội là thủ đô của Việt Nam."
+    chunks = list(replay_chunks(answer, size=8))
+    assert "".join(chunks) == answer and all(len(c) <= 8 for c in chunks)
+    assert list(replay_chunks("", size=8)) == []
@@ -0,0 +1,114 @@
+from types import SimpleNamespace
+
+import pytest
+from langchain.schema import Document
+
+from rag.search.bm25 import BM25Search
+from rag.search.bootstrap import IndexBootstrap
+from rag.search.vector import VectorSearch
+from rag.utils.cache import CacheManager
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+class FakeScrollClient:
+    """Qdrant client giả: scroll theo offset, id kiểu int như Qdrant trả về"""
+
+    def __init__(self, points, on_scroll=None, page_size=2):
+        self.points = points
+        self.on_scroll = on_scroll
+        self.page_size = page_size
+        self.calls = 0
+
+    def scroll(self, collection_name, limit, offset=None, with_payload=True, with_vectors=False):
+        limit = min(limit, self.page_size)
+        if self.on_scroll:
+            self.on_scroll(self.calls)
+        self.calls += 1
+        start = offset or 0
+        page = self.points[start:start + limit]
+        next_offset = start + limit if start + limit < len(self.points) else None
+        return page, next_offset
+
+
+def point(point_id, text, **metadata):
+    return SimpleNamespace(id=point_id, payload={"page_content": text, "metadata": metadata})
+
+
+def make_vector_search(client):
+    vector_search = VectorSearch.__new__(VectorSearch)
+    vector_search.vector_manager = SimpleNamespace(
+        client=client, collection_name="docs",
+        get_collection_info=lambda: {"points_count": len(client.points)},
+    )
+    vector_search.vector_store = SimpleNamespace(content_payload_key="page_content", metadata_payload_key="metadata")
+    return vector_search
+
+
+def make_bm25():
+    search = BM25Search(CacheManager(client=fakeredis.FakeRedis(), index_dir=None))
+    search.index.background_merge = False
+    return search
+
+
+POINTS = [point(i, f"chunk {i} về bm25", file_name="a.pdf" if i < 3 else "b.pdf") for i in range(5)]
+
+
+def test_iter_documents_streams_batches_with_string_ids():
+    vector_search = make_vector_search(FakeScrollClient(POINTS))
+    batches = list(vector_search.iter_documents(batch_size=2))
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    doc = batches[0][1]
+    assert doc.page_content == "chunk 1 về bm25"
+    assert doc.metadata == {"file_name": "a.pdf", "_id": "1", "_collection_name": "docs"}
+
+
+def test_bootstrap_rebuilds_index_from_scroll():
+    bm25_search = make_bm25()
+    bootstrap = IndexBootstrap(bm25_search, make_vector_search(FakeScrollClient(POINTS)))
+    assert bootstrap.start()
+    assert bootstrap.wait(timeout=5)
+    assert bootstrap.get_status()["loaded"] == 5
+    assert bm25_search.document_count == 5
+
+
+def test_bootstrap_skips_documents_ingested_or_deleted_during_rebuild():
+    bm25_search = make_bm25()
+
+    def ingest_between_batches(call):
+        if call == 1:
+            # Ingestion (id dạng str như point_id) chạy giữa hai batch scroll
+            bm25_search.add_documents([Document(page_content="chunk 3 về bm25 (mới)",
+                                                metadata={"_id": "3", "file_name": "b.pdf"})])
+            bm25_search.delete_documents({"file_name": "a.pdf"})
+
+    client = FakeScrollClient(POINTS, on_scroll=ingest_between_batches)
+    bootstrap = IndexBootstrap(bm25_search, make_vector_search(client))
+    bootstrap.start()
+    assert bootstrap.wait(timeout=5)
+    found = sorted(doc.metadata["_id"] for doc, _ in bm25_search.search("bm25", k=10))
+    assert client.calls == 3
+    # "3" không bị trùng; a.pdf bị xóa cả ở batch đã nạp (0, 1) lẫn batch scroll sau lần xóa (2)
+    assert found == ["3", "4"]
+    assert [doc.page_content for doc, _ in bm25_search.search("mới", k=10)] == ["chunk 3 về bm25 (mới)"]
+
+
+def test_bootstrap_uses_cache_when_counts_match():
+    bm25_search = make_bm25()
+    bm25_search.add_documents([Document(page_content=p.payload["page_content"],
+                                        metadata={"_id": str(p.id), **p.payload["metadata"]}) for p in POINTS])
+    client = FakeScrollClient(POINTS)
+    bootstrap = IndexBootstrap(bm25_search, make_vector_search(client))
+    bootstrap.start()
+    assert bootstrap.wait(timeout=5)
+    assert client.calls == 0
+
+
+def test_bootstrap_failure_is_reported():
+    bm25_search = make_bm25()
+    vector_search = make_vector_search(FakeScrollClient(POINTS))
+    vector_search.vector_manager.get_collection_info = lambda: None
+    bootstrap = IndexBootstrap(bm25_search, vector_search)
+    bootstrap.start()
+    assert not bootstrap.wait(timeout=5)
+    assert bootstrap.get_status()["status"] == "failed"
@@ -0,0 +1,128 @@
+import pytest
+from langchain.schema import Document
+
+from rag.retrieval.cascade import PATHS, CascadeReranker
+
+
+def doc(name, **metadata):
+    return Document(page_content=name, metadata={"_id": name, **metadata})
+
+
+class FakeReranker:
+    """Score cross-encoder cố định theo nội dung; phần sau max_depth nhận score thấp nhất như reranker thật"""
+
+    def __init__(self, scores, max_depth=20):
+        self.scores = scores
+        self.max_depth = max_depth
+        self.calls = []
+
+    def rerank_with_scores(self, query, docs, top_k=10):
+        self.calls.append([d.page_content for d in docs])
+        head, tail = docs[:self.max_depth], docs[self.max_depth:]
+        scored = sorted(((d, self.scores.get(d.page_content, -5.0)) for d in head), key=lambda x: x[1], reverse=True)
+        if len(scored) < top_k and tail:
+            scored.extend((d, scored[-1][1]) for d in tail[:top_k - len(scored)])
+        return scored[:top_k]
+
+
+def search(scores, leg_ids=None, fusion="weighted", degraded=False):
+    return {"results": [(doc(name), score) for name, score in scores], "degraded": degraded,
+            "leg_ids": leg_ids or {}, "fusion": fusion, "weights": (0.5, 0.5)}
+
+
+def names(results):
+    return [d.page_content for d, _ in results]
+
+
+def is_descending(results):
+    scores = [score for _, score in results]
+    return scores == sorted(scores, reverse=True)
+
+
+CLEAR = [("a", 1.0), ("b", 0.5), ("c", 0.4), ("d", 0.3), ("e", 0.2), ("f", 0.0)]
+CLOSE = [("a", 1.0), ("b", 0.98), ("c", 0.5), ("d", 0.3), ("e", 0.2), ("f", 0.0)]
+AGREE = {"bm25": ["a", "b", "c"], "vector": ["a", "c", "b"]}
+DISAGREE = {"bm25": ["a", "b", "c"], "vector": ["x", "y", "z"]}
+
+
+def test_empty_path():
+    reranker = FakeReranker({})
+    cascade = CascadeReranker(reranker)
+    assert cascade.rerank("q", search([]), top_k=3) == []
+    assert reranker.calls == []
+    assert cascade.get_stats()["paths"]["empty"]["count"] == 1
+
+
+def test_exact_path_puts_idiom_first_without_reranking():
+    reranker = FakeReranker({})
+    cascade = CascadeReranker(reranker)
+    result = search(CLOSE)
+    result["results"][2] = (doc("c", idiom="Nước chảy đá mòn"), 0.5)
+    results = cascade.rerank("nước chảy đá mòn?", result, top_k=3)
+    assert names(results) == ["c", "a", "b"]
+    assert reranker.calls == []
+    assert cascade.get_stats()["paths"]["exact"]["count"] == 1
+
+
+def test_confident_path_keeps_hybrid_order_and_scores():
+    reranker = FakeReranker({})
+    cascade = CascadeReranker(reranker, margin=0.15, agreement=0.6)
+    results = cascade.rerank("q", search(CLEAR, AGREE), top_k=3)
+    assert names(results) == ["a", "b", "c"]
+    assert [score for _, score in results] == [1.0, 0.5, 0.4]
+    assert reranker.calls == []
+
+
+@pytest.mark.parametrize("degraded", [False, True])
+def test_partial_path_reranks_band_after_top1(degraded):
+    reranker = FakeReranker({"a": 0.1, "b": 1.0, "c": 3.0, "d": 2.0, "e": 9.0})
+    cascade = CascadeReranker(reranker, margin=0.15, agreement=0.6, band=3)
+    # Leg lệch nhau (hoặc một leg timeout) -> partial
+    results = cascade.rerank("q", search(CLEAR, AGREE if degraded else DISAGREE, degraded=degraded), top_k=5)
+    # Top-1 giữ nguyên, band b..d theo cross-encoder, e ngoài band nối theo thứ tự hybrid
+    assert names(results) == ["a", "c", "d", "b", "e"]
+    assert reranker.calls == [["a", "b", "c", "d"]]
+    # Thang cross-encoder, giảm dần: top-1 không thấp hơn vị trí 2, e nhận score thấp nhất đã chấm
+    assert [score for _, score in results] == [3.0, 3.0, 2.0, 1.0, 1.0]
+    assert cascade.get_stats()["paths"]["partial"]["count"] == 1
+
+
+def test_partial_path_with_band_covering_top_k():
+    reranker = FakeReranker({"a": 5.0, "b": 1.0, "c": 3.0, "d": 2.0})
+    cascade = CascadeReranker(reranker, margin=0.15, agreement=0.6, band=10)
+    results = cascade.rerank("q", search(CLEAR, DISAGREE), top_k=3)
+    assert names(results) == ["a", "c", "d"]
+    assert [score for _, score in results] == [5.0, 3.0, 2.0]
+
+
+def test_full_path_uses_cross_encoder_scores():
+    reranker = FakeReranker({"a": 0.0, "b": 4.0, "c": 1.0, "d": 2.0, "e": 3.0, "f": -1.0})
+    cascade = CascadeReranker(reranker, margin=0.15)
+    results = cascade.rerank("q", search(CLOSE, AGREE), top_k=4)
+    assert names(results) == ["b", "e", "d", "c"]
+    assert [score for _, score in results] == [4.0, 3.0, 2.0, 1.0]
+    assert cascade.get_stats()["paths"]["full"]["count"] == 1
+
+
+@pytest.mark.parametrize("scores, leg_ids", [(CLEAR, AGREE), (CLEAR, DISAGREE), (CLOSE, AGREE)])
+def test_scores_are_monotonic_on_every_path(scores, leg_ids):
+    reranker = FakeReranker({"a": -3.0, "b": 2.0, "c": 1.0, "d": 4.0})
+    cascade = CascadeReranker(reranker, band=2)
+    for top_k in (1, 3, 6):
+        assert is_descending(cascade.rerank("q", search(scores, leg_ids), top_k=top_k))
+
+
+def test_margin_is_normalized_per_fusion():
+    # rrf: score 1/(k+rank), margin đo theo rank hiệu dụng nên không phụ thuộc rrf_k
+    rrf = [(doc("a"), 1 / 61), (doc("b"), 1 / 62)]
+    assert CascadeReranker.score_margin(rrf, "rrf", (0.5, 0.5), rrf_k=60) == pytest.approx(0.5)
+    minmax = [(doc("a"), 0.9), (doc("b"), 0.6)]
+    assert CascadeReranker.score_margin(minmax, "minmax", (0.5, 0.5)) == pytest.approx(0.3)
+    assert CascadeReranker.score_margin([(doc("a"), 1.0)]) == 1.0
+    assert CascadeReranker.score_margin([]) == 0.0
+
+
+def test_stats_cover_every_path():
+    stats = CascadeReranker(FakeReranker({})).get_stats()
+    assert set(stats["paths"]) == set(PATHS)
+    assert stats["total"] == 0
@@ -0,0 +1,116 @@
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+from langchain.schema import Document
+from qdrant_client import QdrantClient
+
+fakeredis = pytest.importorskip("fakeredis")
+service_module = pytest.importorskip("chat.service")
+
+from chat.answer_cache import SemanticAnswerCache
+from chat.history import ChatHistory
+from rag.utils.result_cache import IndexGeneration
+
+QUESTION = "Thủ đô của Việt Nam là gì?"
+
+
+class ConstantEmbeddings:
+    def embed_query(self, text):
+        return [1.0, 0.0, 0.0]
+
+
+class Tracker:
+    @contextmanager
+    def start_run(self, run_name=None):
+        yield
+
+    def log_params(self, params, print_out=False):
+        pass
+
+    def log_metrics(self, metrics, step=None):
+        pass
+
+    def log_table(self, data, file_name):
+        pass
+
+
+class Formatter:
+    def format_blocks(self, docs):
+        return [doc.page_content for doc in docs], docs
+
+    def extract_sources(self, docs):
+        return [{"file_name": doc.metadata["file_name"]} for doc in docs]
+
+
+class Handler:
+    context_formatter = Formatter()
+
+    def __init__(self):
+        self.calls = 0
+
+    def retrieve(self, query, **kwargs):
+        self.calls += 1
+        return [(Document(page_content="Hà Nội là thủ đô.", metadata={"file_name": "dia_ly.pdf"}), 1.0)]
+
+
+class LLM:
+    def __init__(self, answer="Hà Nội."):
+        self.answer = answer
+        self.calls = 0
+
+    def stream(self, messages):
+        self.calls += 1
+        yield from self.answer
+
+
+@pytest.fixture
+def service(monkeypatch):
+    import mlflow
+    monkeypatch.setattr(mlflow, "set_tag", lambda *args: None)
+    monkeypatch.setattr(service_module, "build_prompt_with_history", lambda query, blocks, history=None: query)
+    generation = IndexGeneration(fakeredis.FakeRedis(), key="test:generation")
+    service = service_module.ChatService.__new__(service_module.ChatService)
+    service.chat_history = ChatHistory()
+    service.rag_handler = Handler()
+    service.llm_stream = LLM()
+    service.mlflow_tracker = Tracker()
+    service.index_generation = generation
+    service.answer_cache = SemanticAnswerCache(QdrantClient(":memory:"), ConstantEmbeddings(), generation,
+                                               collection_name="answers", min_query_chars=12)
+    return service
+
+
+def ask(service, query=QUESTION):
+    *chunks, sources = list(service.chat_with_history_stream(query, k=3))
+    return "".join(chunks), sources
+
+
+def test_second_question_is_replayed_from_cache(service):
+    answer, sources = ask(service)
+    assert answer == "Hà Nội." and sources["cached"] is False
+    # Hội thoại mới (history rỗng): phát lại câu trả lời, không retrieval / LLM
+    service.chat_history.clear()
+    replayed, cached_sources = ask(service)
+    assert replayed == answer
+    assert cached_sources["cached"] is True and cached_sources["sources"] == sources["sources"]
+    assert service.rag_handler.calls == 1 and service.llm_stream.calls == 1
+    assert len(service.chat_history) == 2
+
+
+def test_questions_with_history_bypass_cache(service):
+    ask(service)
+    # Lượt thứ hai trong cùng hội thoại: không lookup (dù câu hỏi trùng) và không store
+    answer, sources = ask(service)
+    assert sources["cached"] is False
+    assert service.llm_stream.calls == 2
+    assert service.answer_cache.hits == 0 and service.answer_cache.misses == 1
+    assert service.answer_cache.client.count("answers").count == 1
+
+
+def test_new_generation_is_not_served_stale_answer(service):
+    ask(service)
+    service.index_generation.bump("ingest")
+    service.chat_history.clear()
+    _, sources = ask(service)
+    assert sources["cached"] is False and service.llm_stream.calls == 2
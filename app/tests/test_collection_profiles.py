@@ -0,0 +1,73 @@
+import pytest
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import Disabled, PointStruct
+
+from collection_profiles import CollectionProfile
+from config import QDRANT_COLLECTION_PROFILE, QDRANT_COLLECTION_PROFILES
+
+VECTOR_SIZE = 4
+
+
+@pytest.fixture
+def client():
+    client = QdrantClient(":memory:")
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def manager(client):
+    """VectorStoreManager chỉ với những gì apply_profile cần (không embedding / MinIO / BM25)"""
+    vector_store = pytest.importorskip("vector_store")
+    manager = vector_store.VectorStoreManager.__new__(vector_store.VectorStoreManager)
+    manager.client = client
+    manager.collection_name = "profiles"
+    manager.profile = CollectionProfile.from_config("default")
+    client.create_collection(manager.collection_name, **manager.profile.create_params(VECTOR_SIZE))
+    return manager
+
+
+def test_default_profile_keeps_qdrant_defaults():
+    profile = CollectionProfile.from_config(QDRANT_COLLECTION_PROFILE)
+    assert profile.name == "default"
+    assert set(profile.create_params(VECTOR_SIZE)) == {"vectors_config"}
+    assert profile.update_params() == {"quantization_config": Disabled.DISABLED}
+    assert profile.search_params() is None
+
+
+def test_unknown_profile_raises():
+    with pytest.raises(ValueError):
+        CollectionProfile.from_config("missing")
+
+
+@pytest.mark.parametrize("name", sorted(QDRANT_COLLECTION_PROFILES))
+def test_profile_creates_searchable_collection(client, name):
+    profile = CollectionProfile.from_config(name)
+    client.create_collection(name, **profile.create_params(VECTOR_SIZE))
+    client.upsert(name, points=[PointStruct(id=1, vector=[1.0, 0.0, 0.0, 0.0])])
+    hits = client.query_points(name, query=[1.0, 0.0, 0.0, 0.0], limit=1,
+                               search_params=profile.search_params()).points
+    assert [hit.id for hit in hits] == [1]
+
+
+@pytest.mark.parametrize("name", sorted(QDRANT_COLLECTION_PROFILES))
+def test_apply_profile_migrates_existing_collection(manager, name):
+    profile = CollectionProfile.from_config(name)
+    assert manager.apply_profile(profile) is True
+    assert manager.profile == profile
+    assert manager.search_params == profile.search_params()
+
+
+def test_apply_profile_can_migrate_back(manager):
+    manager.apply_profile(CollectionProfile.from_config("memory"))
+    assert manager.search_params.quantization is not None
+    manager.apply_profile(CollectionProfile.from_config("default"))
+    assert manager.search_params is None
+
+
+def test_apply_profile_fails_for_missing_collection(manager):
+    manager.collection_name = "missing"
+    with pytest.raises(Exception):
+        manager.apply_profile(CollectionProfile.from_config("memory"))
+    assert manager.profile.name == "default"
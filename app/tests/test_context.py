@@ -0,0 +1,143 @@
+import pytest
+from langchain.schema import Document
+
+from rag.utils.context import ContextFormatter, overlap_length
+from rag.utils.tokens import TokenCounter
+
+# Overlap giữa hai chunk liền kề (dài hơn CONTEXT_MIN_OVERLAP_CHARS)
+OVERLAP = "shared overlap sentence between chunks"
+
+
+class WordCounter:
+    """Đếm token = số từ, để budget trong test dễ tính"""
+    exact = True
+
+    def count(self, text: str) -> int:
+        return len(text.split())
+
+
+def chunk(text, file_name="a.pdf", page=1, chunk=None, **metadata):
+    metadata = {"file_name": file_name, "page": page, **metadata}
+    if chunk is not None:
+        metadata["chunk"] = chunk
+    return Document(page_content=text, metadata=metadata)
+
+
+def formatter(budget=None):
+    return ContextFormatter(token_budget=budget, counter=WordCounter())
+
+
+def test_overlap_length():
+    assert overlap_length(f"first part {OVERLAP}", f"{OVERLAP} second part") == len(OVERLAP)
+    assert overlap_length("abc xyz", "xyz def") == 0   # ngắn hơn min_chars: coi như trùng ngẫu nhiên
+    assert overlap_length("abc", "def") == 0
+
+
+def test_adjacent_chunks_merge_without_repeating_overlap():
+    docs = [
+        chunk(f"{OVERLAP} then the second chunk", chunk=1),
+        chunk(f"the first chunk ends with {OVERLAP}", chunk=0),
+    ]
+    blocks = formatter().pack(docs)
+    assert len(blocks) == 1
+    assert blocks[0]["text"] == f"the first chunk ends with {OVERLAP} then the second chunk"
+    assert [doc.metadata["chunk"] for doc in blocks[0]["documents"]] == [0, 1]
+
+
+def test_adjacent_chunks_without_overlap_are_joined_by_newline():
+    blocks = formatter().pack([chunk("alpha", chunk=3), chunk("beta", chunk=4)])
+    assert [block["text"] for block in blocks] == ["alpha\nbeta"]
+
+
+def test_non_adjacent_chunks_stay_separate_in_rank_order():
+    docs = [
+        chunk("best chunk", chunk=5),
+        chunk("other page", page=2, chunk=6),
+        chunk("far away chunk", chunk=9),
+        chunk("idiom line", page=3),
+    ]
+    blocks = formatter().pack(docs)
+    assert [block["text"] for block in blocks] == ["best chunk", "other page", "far away chunk", "idiom line"]
+
+
+def test_duplicate_and_contained_chunks_are_dropped():
+    docs = [
+        chunk("Row one | Row two | Row three", chunk=0),
+        chunk("Row   one |\nRow two | Row three", file_name="b.pdf", chunk=0),
+        chunk("Row two", file_name="c.pdf"),
+        chunk("something new", file_name="d.pdf"),
+    ]
+    text, packed = formatter().format_context(docs)
+    assert [doc.metadata["file_name"] for doc in packed] == ["a.pdf", "d.pdf"]
+    assert "[Nguồn 1: a.pdf, trang 1]" in text and "[Nguồn 2: d.pdf, trang 1]" in text
+
+
+def test_token_budget_skips_chunks_that_do_not_fit():
+    counter = WordCounter()
+    big = chunk(" ".join(["word"] * 50), file_name="big.pdf")
+    small = chunk("short answer", file_name="small.pdf")
+    header = counter.count("[Nguồn 00: small.pdf, trang 1]\n\n\n")
+    budget = counter.count(small.page_content) + header
+    blocks, packed = formatter(budget).format_blocks([big, small])
+    assert packed == [small]
+    assert len(blocks) == 1 and blocks[0].endswith("short answer")
+
+
+def test_joined_chunk_costs_only_its_new_text():
+    first = chunk(f"intro words {OVERLAP}", chunk=0)
+    second = chunk(f"{OVERLAP} tail", chunk=1)
+    counter = WordCounter()
+    header = counter.count("[Nguồn 00: a.pdf, trang 1]\n\n\n")
+    # Budget vừa đủ cho chunk đầu + header và một từ mới của chunk sau
+    budget = counter.count(first.page_content) + header + 1
+    _, packed = formatter(budget).format_blocks([first, second])
+    assert packed == [first, second]
+    _, packed = formatter(budget - 1).format_blocks([first, second])
+    assert packed == [first]
+
+
+def test_sources_come_from_packed_documents_only():
+    docs = [chunk("kept", file_name="a.pdf", source="A"),
+            chunk(" ".join(["x"] * 100), file_name="b.pdf", source="B")]
+    f = formatter(budget=20)
+    _, packed = f.format_context(docs)
+    assert f.extract_sources(packed) == ["A (page 1)"]
+
+
+def test_empty_context():
+    assert formatter().format_context([]) == ("Không tìm thấy thông tin liên quan.", [])
+    assert formatter().format_documents([chunk("   ")]) == "Không tìm thấy thông tin liên quan."
+
+
+def test_token_counter_estimates_without_tokenizer(tmp_path, capsys):
+    counter = TokenCounter(path=None, chars_per_token=4.0)
+    assert not counter.exact
+    assert counter.count("") == 0
+    assert counter.count("x" * 40) == 11
+    missing = TokenCounter(path=str(tmp_path / "tokenizer.json"), chars_per_token=4.0)
+    assert not missing.exact and missing.count("x" * 8) == 3
+    # Ước lượng luôn được log rõ, kèm cách tạo tokenizer.json
+    out = capsys.readouterr().out
+    assert out.count("Context token budget is approximate") == 2
+    assert "python -m rag.utils.tokens" in out
+
+
+def test_packing_log_marks_estimated_tokens(capsys):
+    ContextFormatter(counter=TokenCounter(path=None)).format_context([chunk("xin chào")])
+    assert "tokens estimated" in capsys.readouterr().out
+    formatter().format_context([chunk("xin chào")])
+    assert "tokens estimated" not in capsys.readouterr().out
+
+
+def test_token_counter_loads_local_tokenizer(tmp_path):
+    tokenizers = pytest.importorskip("tokenizers")
+    from tokenizers.models import WordLevel
+    from tokenizers.pre_tokenizers import Whitespace
+
+    tokenizer = tokenizers.Tokenizer(WordLevel({"[UNK]": 0, "hello": 1, "world": 2}, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = Whitespace()
+    path = tmp_path / "tokenizer.json"
+    tokenizer.save(str(path))
+    counter = TokenCounter(path=str(path))
+    assert counter.exact
+    assert counter.count("hello world again") == 3
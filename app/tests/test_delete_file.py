@@ -0,0 +1,183 @@
+import io
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import pytest
+from langchain.schema import Document
+
+pytestmark = pytest.mark.filterwarnings("ignore:Payload indexes have no effect")
+
+
+class SyncExecutor:
+    """Chạy ngay trong thread gọi submit (upload MinIO, ingestion job)"""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def chunks(*texts, file_name="a.pdf"):
+    return [Document(page_content=text, metadata={"file_name": file_name, "page": i + 1, "type": "pdf",
+                                                  "chunk": i + 1})
+            for i, text in enumerate(texts)]
+
+
+def count(manager, file_name):
+    return manager.client.count(manager.collection_name, count_filter=manager._file_filter(file_name),
+                                exact=True).count
+
+
+def bm25_files(manager):
+    return sorted(doc.metadata["file_name"] for doc, _ in manager.bm25_search.search("chương bảng", k=100))
+
+
+@pytest.fixture
+def indexed(vector_manager):
+    """Hai file đã được index ở cả Qdrant, BM25 và MinIO"""
+    for file_name in ("a.pdf", "b.pdf"):
+        vector_manager._sync_file(file_name, f"hash-{file_name}",
+                                  chunks("Chương một", "Bảng | cột", file_name=file_name))
+        vector_manager.storage.files[file_name] = b"%PDF"
+    return vector_manager
+
+
+def test_delete_file_removes_from_every_store(indexed):
+    bumps = len(indexed.index_generation.bumps)
+    result = indexed.delete_file("a.pdf")
+
+    assert result == {"file_name": "a.pdf", "points_deleted": 2, "bm25_deleted": 2, "storage_deleted": True}
+    assert count(indexed, "a.pdf") == 0
+    assert bm25_files(indexed) == ["b.pdf", "b.pdf"]
+    assert set(indexed.storage.files) == {"b.pdf"}
+    assert len(indexed.index_generation.bumps) == bumps + 1
+    # File khác không bị ảnh hưởng, ingest lại file đã xóa không bị skip
+    assert count(indexed, "b.pdf") == 2
+    assert not indexed._is_ingested("a.pdf", "hash-a.pdf")
+
+
+def test_delete_missing_file_is_a_noop(indexed):
+    indexed.delete_file("a.pdf")
+    again = indexed.delete_file("a.pdf")
+    assert again == {"file_name": "a.pdf", "points_deleted": 0, "bm25_deleted": 0, "storage_deleted": False}
+    assert count(indexed, "b.pdf") == 2
+
+
+def test_storage_failure_after_index_delete_is_retryable(indexed):
+    bumps = len(indexed.index_generation.bumps)
+    indexed.storage.fail_delete = True
+    with pytest.raises(ConnectionError):
+        indexed.delete_file("a.pdf")
+
+    # Qdrant và BM25 đã xóa, retrieval cache đã bị invalidate; chỉ còn file gốc trên MinIO
+    assert count(indexed, "a.pdf") == 0
+    assert bm25_files(indexed) == ["b.pdf", "b.pdf"]
+    assert "a.pdf" in indexed.storage.files
+    assert len(indexed.index_generation.bumps) == bumps + 1
+
+    indexed.storage.fail_delete = False
+    result = indexed.delete_file("a.pdf")
+    assert result["points_deleted"] == 0 and result["bm25_deleted"] == 0
+    assert result["storage_deleted"] is True
+    assert set(indexed.storage.files) == {"b.pdf"}
+
+
+def test_bm25_failure_still_invalidates_cache(indexed, monkeypatch):
+    def fail(metadata_filter):
+        raise RuntimeError("redis unavailable")
+
+    bumps = len(indexed.index_generation.bumps)
+    monkeypatch.setattr(indexed.bm25_search, "delete_documents", fail)
+    with pytest.raises(RuntimeError):
+        indexed.delete_file("a.pdf")
+
+    assert count(indexed, "a.pdf") == 0
+    assert len(indexed.index_generation.bumps) == bumps + 1
+    # Chưa tới bước MinIO
+    assert "a.pdf" in indexed.storage.files
+
+
+# --- Routes PUT / DELETE /documents/<file_name> ---
+
+@pytest.fixture
+def client(vector_manager, monkeypatch):
+    flask = pytest.importorskip("flask")
+    import routes
+    from ingestion import tasks
+    from ingestion.jobs import JobManager
+
+    # Page của "PDF" giả ngăn cách bởi form feed, bỏ qua pypdf
+    monkeypatch.setattr(vector_manager, "_extract_pages",
+                        lambda content: content.decode("utf-8").split("\f"), raising=False)
+    vector_manager._upload_executor = SyncExecutor()
+    fake_services = SimpleNamespace(vector_manager=vector_manager,
+                                    job_manager=JobManager(executor=SyncExecutor()))
+    monkeypatch.setattr(routes, "services", fake_services)
+    monkeypatch.setattr(tasks, "get_services", lambda: fake_services)
+
+    app = flask.Flask(__name__)
+    app.register_blueprint(routes.api_bp)
+    return app.test_client()
+
+
+def put_document(client, file_name, *pages, **form):
+    data = {"file": (io.BytesIO("\f".join(pages).encode("utf-8")), "upload.pdf"), **form}
+    return client.put(f"/documents/{file_name}", data=data, content_type="multipart/form-data")
+
+
+def test_put_replaces_document_under_url_name(client, vector_manager):
+    response = put_document(client, "reports/a.pdf", "Chương một", "Bảng | cột", sync="true")
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["filename"] == "reports/a.pdf"
+    assert (body["added"], body["removed"]) == (2, 0)
+
+    response = put_document(client, "reports/a.pdf", "Chương một", "Kết luận", sync="true")
+    assert response.status_code == 200
+    assert (response.get_json()["added"], response.get_json()["removed"]) == (1, 1)
+    assert count(vector_manager, "reports/a.pdf") == 2
+    assert bm25_files(vector_manager) == ["reports/a.pdf"]
+    assert vector_manager.storage.files["reports/a.pdf"] == "Chương một\fKết luận".encode("utf-8")
+
+
+def test_put_queues_job(client, vector_manager):
+    response = put_document(client, "a.pdf", "Chương một")
+    assert response.status_code == 202
+    status = client.get(response.get_json()["status_url"]).get_json()
+    assert status["status"] == "succeeded"
+    assert status["result"]["added"] == 1
+    assert count(vector_manager, "a.pdf") == 1
+
+
+def test_put_without_file_is_rejected(client):
+    assert client.put("/documents/a.pdf").status_code == 400
+
+
+def test_delete_document_route(client, vector_manager):
+    put_document(client, "a.pdf", "Chương một", "Bảng | cột", sync="true")
+    response = client.delete("/documents/a.pdf")
+    assert response.status_code == 200
+    assert response.get_json() == {"status": "success", "file_name": "a.pdf", "points_deleted": 2,
+                                   "bm25_deleted": 2, "storage_deleted": True}
+    assert count(vector_manager, "a.pdf") == 0
+
+
+def test_delete_document_route_reports_partial_failure(client, vector_manager):
+    put_document(client, "a.pdf", "Chương một", sync="true")
+    vector_manager.storage.fail_delete = True
+    response = client.delete("/documents/a.pdf")
+    assert response.status_code == 500
+    assert response.get_json() == {"status": "error", "error": "minio unavailable"}
+    assert count(vector_manager, "a.pdf") == 0
+
+    # Client gọi lại sau khi MinIO phục hồi
+    vector_manager.storage.fail_delete = False
+    response = client.delete("/documents/a.pdf")
+    assert response.status_code == 200
+    assert response.get_json()["storage_deleted"] is True
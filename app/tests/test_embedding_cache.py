@@ -0,0 +1,131 @@
+import itertools
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from rag.utils import embedding_cache
+from rag.utils.embedding_cache import (
+    CachedEmbeddings, DiskEmbeddingStore, RedisEmbeddingStore, normalize_text, text_key,
+)
+
+DIM = 8
+BLOB = DIM * 2  # float16
+
+
+class RecordingEmbeddings:
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        # Vector phụ thuộc từng ký tự (kể cả whitespace) để lộ ra text nào được embed
+        return [[float(ord(c) % 13) for c in (text + " " * DIM)[:DIM]] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    """Thời gian tăng dần mỗi lần gọi để thứ tự LRU không phụ thuộc độ phân giải đồng hồ"""
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(embedding_cache, "time", SimpleNamespace(time=lambda: float(next(ticks))))
+
+
+@pytest.fixture(params=["disk", "redis"])
+def store(request, tmp_path):
+    if request.param == "disk":
+        return DiskEmbeddingStore(str(tmp_path), max_bytes=10 * BLOB)
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisEmbeddingStore(fakeredis.FakeRedis(), prefix="test:emb", max_bytes=10 * BLOB)
+
+
+def blob(i):
+    return np.full(DIM, i, dtype=np.float16).tobytes()
+
+
+def test_normalized_key():
+    assert normalize_text("  Xin\tchào \n thế giới ") == "Xin chào thế giới"
+    # NFD và NFC của cùng một chữ cho cùng key
+    assert text_key("m", "Vie\u0302\u0323t") == text_key("m", "Việt")
+    assert text_key("m", "a") != text_key("other", "a")
+
+
+def test_store_round_trip(store):
+    store.put_many({"a": blob(1), "b": blob(2)})
+    assert store.get_many(["a", "missing", "b"]) == [blob(1), None, blob(2)]
+    assert store.size_bytes() == 2 * BLOB
+    store.clear()
+    assert store.get_many(["a"]) == [None]
+
+
+def test_store_evicts_least_recently_used(store):
+    store.put_many({f"k{i}": blob(i) for i in range(8)})
+    # k0, k1 vừa được đọc -> không bị evict trước
+    store.get_many(["k0", "k1"])
+    store.put_many({f"n{i}": blob(i) for i in range(4)})
+    assert store.size_bytes() <= 9 * BLOB
+    assert store.get_many(["k0", "k1"]) == [blob(0), blob(1)]
+    assert store.get_many(["k2"]) == [None]
+    assert store.get_many(["n3"]) == [blob(3)]
+
+
+def test_disk_store_persists(tmp_path):
+    DiskEmbeddingStore(str(tmp_path)).put_many({"a": blob(1)})
+    assert DiskEmbeddingStore(str(tmp_path)).get_many(["a"]) == [blob(1)]
+
+
+def test_redis_counts_bytes_once_per_key():
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis()
+    worker_a = RedisEmbeddingStore(client, prefix="test:emb")
+    worker_b = RedisEmbeddingStore(client, prefix="test:emb")
+    worker_a.put_many({"a": blob(1), "b": blob(2)})
+    # Worker khác ghi lại cùng text: key đã có, không cộng bytes lần nữa
+    worker_b.put_many({"a": blob(1), "c": blob(3)})
+    assert worker_a.size_bytes() == 3 * BLOB
+    assert worker_b.get_many(["a", "b", "c"]) == [blob(1), blob(2), blob(3)]
+
+
+def test_cached_embeddings_embed_the_key_text(tmp_path):
+    model = RecordingEmbeddings()
+    cached = CachedEmbeddings(model, DiskEmbeddingStore(str(tmp_path)), model="test", dtype="float32")
+    first = cached.embed_query("xin  chào\n")
+    # Text chỉ khác whitespace dùng chung key -> phải nhận đúng vector của text đã chuẩn hóa
+    assert cached.embed_query("xin chào") == first
+    assert model.calls == [["xin chào"]]
+    assert first == model.embed_query("xin chào")
+
+
+def test_cached_embeddings_dedup_and_stats(tmp_path):
+    model = RecordingEmbeddings()
+    cached = CachedEmbeddings(model, DiskEmbeddingStore(str(tmp_path)), model="test", dtype="float16")
+    vectors = cached.embed_documents(["một", "hai", "một"])
+    assert model.calls == [["một", "hai"]]
+    assert vectors[0] == vectors[2]
+    again = cached.embed_documents(["hai", "ba"])
+    assert model.calls[-1] == ["ba"]
+    assert np.allclose(again[0], vectors[1])
+    stats = cached.get_stats()
+    assert (stats["hits"], stats["misses"], stats["errors"]) == (1, 3, 0)
+    assert stats["size_bytes"] == 3 * DIM * 2
+
+
+def test_cached_embeddings_survive_store_errors():
+    class Down:
+        max_bytes = 0
+
+        def get_many(self, keys):
+            raise ConnectionError("redis down")
+
+        put_many = get_many
+
+        def size_bytes(self):
+            raise ConnectionError("redis down")
+
+    model = RecordingEmbeddings()
+    cached = CachedEmbeddings(model, Down(), model="test")
+    assert cached.embed_documents(["a", "b"]) == model.embed_documents(["a", "b"])
+    stats = cached.get_stats()
+    assert stats["errors"] == 2 and stats["size_bytes"] is None
@@ -0,0 +1,136 @@
+import pytest
+from langchain.schema import Document
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    Distance, FieldCondition, Filter, HasIdCondition, IsEmptyCondition, MatchAny, MatchValue, PayloadField,
+    PointStruct, Range, VectorParams,
+)
+
+from rag.search.filters import is_any_of, is_range, matches_filter, split_filter, to_qdrant_filter
+from rag.search.inverted_index import InvertedIndex
+
+PAYLOADS = [
+    {"file_name": "a.pdf", "page": 1, "type": "text", "score": 0.5},
+    {"file_name": "a.pdf", "page": 2, "type": "idiom", "score": 1.5},
+    {"file_name": "b.pdf", "page": 3, "type": "text"},
+    {"file_name": "c.pdf", "page": 10, "type": "table", "score": 0.5},
+    {"file_name": "c.pdf", "type": "text", "flag": True},
+    {"file_name": "d.pdf", "page": None, "type": None},
+    {"file_name": "d.pdf", "page": 4, "tags": []},
+]
+
+FILTERS = [
+    {"file_name": "a.pdf"},
+    {"file_name": ["a.pdf", "c.pdf"]},
+    {"page": {"gte": 2, "lte": 3}},
+    {"page": {"gt": 2}},
+    {"page": {"lt": 2}},
+    {"page": [1, 10]},
+    {"file_name": "c.pdf", "type": "text"},
+    {"file_name": ["b.pdf", "c.pdf"], "page": {"gte": 3}},
+    {"score": 0.5},
+    {"page": [1, "3"]},
+    {"flag": True},
+    {"file_name": "missing.pdf"},
+    {"file_name": []},
+    {"file_name": "a.pdf", "page": []},
+    {"score": None},
+    {"page": None},
+    {"tags": None},
+    {"page": [None, 1]},
+    {"type": [None, "idiom"], "file_name": ["a.pdf", "d.pdf"]},
+]
+
+
+def test_condition_kinds():
+    assert is_range({"gte": 1})
+    assert not is_range({})
+    assert not is_range({"gte": 1, "eq": 2})
+    assert is_any_of(["a"]) and is_any_of(("a",)) and not is_any_of("a")
+
+
+def test_matches_filter():
+    metadata = PAYLOADS[1]
+    assert matches_filter(metadata, None)
+    assert matches_filter(metadata, {"file_name": "a.pdf", "page": {"gt": 1}})
+    assert not matches_filter(metadata, {"page": {"lt": 2}})
+    assert matches_filter(metadata, {"type": ["text", "idiom"]})
+    # Range trên field thiếu / không phải số không bao giờ khớp
+    assert not matches_filter(PAYLOADS[4], {"page": {"gte": 0}})
+    assert not matches_filter(PAYLOADS[4], {"flag": {"gte": 0}})
+
+
+def test_matches_filter_empty_list_and_none():
+    # List rỗng không khớp gì; None khớp field thiếu / null / list rỗng (như IsEmptyCondition)
+    assert not matches_filter(PAYLOADS[0], {"file_name": []})
+    assert matches_filter(PAYLOADS[0], {"flag": None})
+    assert matches_filter(PAYLOADS[5], {"page": None, "type": None})
+    assert matches_filter(PAYLOADS[6], {"tags": None})
+    assert not matches_filter(PAYLOADS[0], {"page": None})
+    assert matches_filter(PAYLOADS[5], {"page": [None, 1]})
+
+
+def test_split_filter():
+    indexed, residual = split_filter({"file_name": "a.pdf", "lang": "vi", "page": {"gt": 1}},
+                                     ("file_name", "page"))
+    assert indexed == {"file_name": "a.pdf", "page": {"gt": 1}}
+    assert residual == {"lang": "vi"}
+    assert split_filter(None, ("file_name",)) == ({}, {})
+    # Metadata index không lưu null -> điều kiện None luôn là residual
+    assert split_filter({"page": None, "file_name": ["a.pdf", None]}, ("file_name", "page")) == \
+        ({}, {"page": None, "file_name": ["a.pdf", None]})
+
+
+def test_to_qdrant_filter_translation():
+    assert to_qdrant_filter(None) is None
+    assert to_qdrant_filter({}) is None
+    qdrant_filter = to_qdrant_filter({"file_name": "a.pdf", "page": {"gte": 2}, "type": ["text", "idiom"]})
+    assert qdrant_filter.must == [
+        FieldCondition(key="metadata.file_name", match=MatchValue(value="a.pdf")),
+        FieldCondition(key="metadata.page", range=Range(gte=2)),
+        FieldCondition(key="metadata.type", match=MatchAny(any=["text", "idiom"])),
+    ]
+
+
+def test_to_qdrant_filter_special_values():
+    # Float không dùng được với MatchValue -> range một điểm
+    (condition,) = to_qdrant_filter({"score": 0.5}).must
+    assert condition == FieldCondition(key="metadata.score", range=Range(gte=0.5, lte=0.5))
+    # Danh sách trộn kiểu -> OR của từng giá trị
+    (condition,) = to_qdrant_filter({"page": [1, "1"]}).must
+    assert isinstance(condition, Filter) and len(condition.should) == 2
+    assert to_qdrant_filter({"page": 1}, key_prefix="").must[0].key == "page"
+    # List rỗng -> không khớp point nào (Filter(should=[]) sẽ khớp tất cả trên server)
+    assert to_qdrant_filter({"page": []}).must == [HasIdCondition(has_id=[])]
+    assert to_qdrant_filter({"page": None}).must == [
+        IsEmptyCondition(is_empty=PayloadField(key="metadata.page"))]
+
+
+@pytest.fixture(scope="module")
+def client():
+    client = QdrantClient(":memory:")
+    client.create_collection("filters", vectors_config=VectorParams(size=2, distance=Distance.COSINE))
+    client.upsert("filters", points=[
+        PointStruct(id=i, vector=[1.0, float(i)], payload={"page_content": "", "metadata": payload})
+        for i, payload in enumerate(PAYLOADS)
+    ])
+    yield client
+    client.close()
+
+
+@pytest.mark.parametrize("metadata_filter", FILTERS, ids=str)
+def test_qdrant_filter_matches_local_filter(client, metadata_filter):
+    """BM25 (matches_filter) và Qdrant (to_qdrant_filter) phải chọn cùng một tập document"""
+    points, _ = client.scroll("filters", scroll_filter=to_qdrant_filter(metadata_filter), limit=100)
+    expected = {i for i, payload in enumerate(PAYLOADS) if matches_filter(payload, metadata_filter)}
+    assert {point.id for point in points} == expected
+
+
+@pytest.mark.parametrize("metadata_filter", FILTERS, ids=str)
+def test_bm25_index_filter_matches_local_filter(metadata_filter):
+    """Metadata index của BM25 (postings / cột số + residual) cũng phải chọn cùng tập document"""
+    index = InvertedIndex(metadata_fields=("file_name", "page", "type", "score", "tags"), background_merge=False)
+    docs = [Document(page_content="chunk", metadata={"_id": i, **payload}) for i, payload in enumerate(PAYLOADS)]
+    index.add_documents(docs, [["chunk"]] * len(docs))
+    found = {doc.metadata["_id"] for doc, _ in index.search(["chunk"], k=100, metadata_filter=metadata_filter)}
+    assert found == {i for i, payload in enumerate(PAYLOADS) if matches_filter(payload, metadata_filter)}
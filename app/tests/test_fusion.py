@@ -0,0 +1,113 @@
+import math
+
+import pytest
+from langchain.schema import Document
+
+from rag.search.fusion import FUSION_STRATEGIES, doc_key, fuse
+
+
+def doc(point_id, text=None, **metadata):
+    if point_id is not None:
+        metadata["_id"] = point_id
+    return Document(page_content=text or f"chunk {point_id}", metadata=metadata)
+
+
+def ids(results):
+    return [doc_key(d) for d, _ in results]
+
+
+BM25 = [(doc("a"), 12.0), (doc("b"), 8.0), (doc("c"), 2.0)]
+VECTOR = [(doc("b"), 0.91), (doc("d"), 0.80), (doc("a"), 0.40)]
+
+
+def test_doc_key_prefers_point_id():
+    assert doc_key(doc(7, "x")) == "7"
+    assert doc_key(doc(None, "plain text", file_name="f.pdf")) == "plain text"
+
+
+@pytest.mark.parametrize("strategy", sorted(FUSION_STRATEGIES))
+def test_fuse_dedups_by_point_id(strategy):
+    # BM25 và vector trả về Document khác object (metadata khác) nhưng cùng point id
+    results = fuse([BM25, VECTOR], weights=(0.5, 0.5), strategy=strategy)
+    assert sorted(ids(results)) == ["a", "b", "c", "d"]
+    scores = [score for _, score in results]
+    assert scores == sorted(scores, reverse=True)
+
+
+@pytest.mark.parametrize("strategy", sorted(FUSION_STRATEGIES))
+def test_doc_in_both_legs_beats_single_leg(strategy):
+    results = fuse([BM25, VECTOR], weights=(0.5, 0.5), strategy=strategy)
+    assert ids(results)[0] in {"a", "b"}
+    assert ids(results)[-1] in {"c", "d"}
+
+
+def test_rrf_scores():
+    results = dict((doc_key(d), s) for d, s in fuse([BM25, VECTOR], weights=(1.0, 1.0), strategy="rrf", rrf_k=60))
+    assert results["a"] == pytest.approx(1 / 61 + 1 / 63)
+    assert results["b"] == pytest.approx(1 / 62 + 1 / 61)
+    assert results["d"] == pytest.approx(1 / 62)
+
+
+def test_rrf_ranks_unsorted_legs_by_score():
+    shuffled = [BM25[2], BM25[0], BM25[1]]
+    assert ids(fuse([shuffled], weights=(1.0,), strategy="rrf")) == ["a", "b", "c"]
+
+
+def test_minmax_normalizes_each_leg():
+    results = dict((doc_key(d), s) for d, s in fuse([BM25, VECTOR], weights=(0.5, 0.5), strategy="minmax"))
+    assert results["a"] == pytest.approx(0.5 * 1.0 + 0.5 * 0.0)
+    assert results["b"] == pytest.approx(0.5 * 0.6 + 0.5 * 1.0)
+    # Thiếu trong một leg = 0 cho leg đó
+    assert results["c"] == pytest.approx(0.0)
+    assert results["d"] == pytest.approx(0.5 * (0.80 - 0.40) / (0.91 - 0.40))
+
+
+def test_minmax_constant_leg_scores_one():
+    results = fuse([[(doc("a"), 3.0), (doc("b"), 3.0)]], weights=(1.0,), strategy="minmax")
+    assert [s for _, s in results] == [1.0, 1.0]
+
+
+def test_zscore_missing_doc_gets_leg_floor():
+    results = dict((doc_key(d), s) for d, s in fuse([BM25, VECTOR], weights=(1.0, 0.0), strategy="zscore"))
+    # d không có trong BM25: nhận z-score thấp nhất của leg đó (bằng c), không hơn candidate có mặt
+    assert results["d"] == pytest.approx(results["c"])
+    assert results["a"] > results["b"] > results["c"]
+
+
+def test_weighted_sum_uses_raw_scores():
+    results = dict((doc_key(d), s) for d, s in fuse([BM25, VECTOR], weights=(0.25, 1.0), strategy="weighted"))
+    assert results["b"] == pytest.approx(0.25 * 8.0 + 0.91)
+    assert results["d"] == pytest.approx(0.80)
+
+
+def test_duplicate_id_in_one_leg_keeps_best():
+    leg = [(doc("a"), 1.0), (doc("a"), 5.0), (doc("b"), 3.0)]
+    results = fuse([leg], weights=(1.0,), strategy="weighted")
+    assert [(doc_key(d), s) for d, s in results] == [("a", 5.0), ("b", 3.0)]
+
+
+def test_ties_keep_first_seen_order():
+    leg = [(doc("x"), 1.0), (doc("y"), 1.0), (doc("z"), 1.0)]
+    for strategy in FUSION_STRATEGIES:
+        assert ids(fuse([leg], weights=(1.0,), strategy=strategy)) == ["x", "y", "z"], strategy
+
+
+def test_top_k_returns_best_sorted():
+    leg = [(doc(str(i)), float(i)) for i in range(50)]
+    results = fuse([leg], weights=(1.0,), strategy="weighted", k=5)
+    assert ids(results) == ["49", "48", "47", "46", "45"]
+    assert fuse([leg], weights=(1.0,), strategy="weighted", k=0) == []
+
+
+def test_empty_legs():
+    assert fuse([[], []], weights=(0.5, 0.5), strategy="rrf") == []
+    only_vector = fuse([[], VECTOR], weights=(0.5, 0.5), strategy="minmax")
+    assert ids(only_vector) == ["b", "d", "a"]
+    assert all(math.isfinite(s) for _, s in only_vector)
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        fuse([BM25], weights=(1.0,), strategy="unknown")
+    with pytest.raises(ValueError):
+        fuse([BM25, VECTOR], weights=(1.0,))
@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+
+import pytest
+from langchain.schema import Document
+
+fakeredis = pytest.importorskip("fakeredis")
+handler_module = pytest.importorskip("rag.handler")
+
+from rag.search.bm25 import BM25Search
+from rag.utils.cache import CacheManager
+from rag.utils.result_cache import IndexGeneration, RetrievalCache
+
+
+class BM25Only:
+    """Hybrid search giả: chỉ leg BM25 để kết quả phụ thuộc trạng thái index local"""
+    uses_native = False
+
+    def __init__(self, bm25_search):
+        self.bm25_search = bm25_search
+
+    def search_with_info(self, query, k, alpha, metadata_filter=None, fusion=None):
+        return {"results": self.bm25_search.search(query, k=k, metadata_filter=metadata_filter),
+                "degraded": False}
+
+
+class EmptyQdrant:
+    """Collection rỗng: bootstrap kết thúc ngay với index trống"""
+    vector_manager = SimpleNamespace(get_collection_info=lambda: {"points_count": 0})
+
+    def iter_documents(self):
+        return iter(())
+
+
+def make_worker(redis):
+    bm25_search = BM25Search(CacheManager(client=redis, index_dir=None))
+    bm25_search.index.background_merge = False
+    generation = IndexGeneration(redis, key="test:generation")
+    services = SimpleNamespace(
+        vector_search=EmptyQdrant(), bm25_search=bm25_search, hybrid_search=BM25Only(bm25_search),
+        reranker=None, llm=None, index_generation=generation,
+        retrieval_cache=RetrievalCache(generation, client=redis, prefix="test:retrieval"),
+    )
+    handler = handler_module.RAGHandler(services)
+    handler.cascade = None
+    assert handler.bootstrap.wait(timeout=5)
+    return handler
+
+
+def add(handler, *texts):
+    handler.bm25_search.add_documents([
+        Document(page_content=text, metadata={"_id": text, "file_name": "a.pdf"}) for text in texts])
+    handler.index_generation.bump("test")
+
+
+def shared_keys(redis):
+    return redis.keys("test:retrieval:*")
+
+
+@pytest.fixture
+def redis():
+    return fakeredis.FakeRedis()
+
+
+def test_worker_syncs_before_caching_new_generation(redis):
+    writer, reader = make_worker(redis), make_worker(redis)
+    add(writer, "bm25 first chunk")
+    # reader vừa load nên chưa tới lượt tự kiểm tra version; retrieve() phải sync trước khi ghi cache
+    results = reader.retrieve("bm25", k=5, use_rerank=False)
+    assert [doc.page_content for doc, _ in results] == ["bm25 first chunk"]
+    assert len(shared_keys(redis)) == 1
+    assert writer.retrieve("bm25", k=5, use_rerank=False) == results
+    assert writer.retrieval_cache.redis_hits == 1
+
+
+def test_stale_worker_does_not_write_shared_tier(redis, monkeypatch):
+    writer, reader = make_worker(redis), make_worker(redis)
+    add(writer, "bm25 old chunk")
+    assert len(reader.retrieve("bm25", k=5, use_rerank=False)) == 1
+    add(writer, "bm25 new chunk")
+    # Không đọc được segment mới: index local vẫn là trạng thái cũ
+    monkeypatch.setattr(reader.bm25_search.cache_manager, "load_bm25_segments", lambda cached=None: None)
+    stale = reader.retrieve("bm25", k=5, use_rerank=False)
+    assert [doc.page_content for doc, _ in stale] == ["bm25 old chunk"]
+    generation = reader.index_generation.current()
+    assert redis.keys(f"test:retrieval:{generation}:*") == []
+    # Worker đã sync vẫn tính và cache kết quả đúng cho generation mới
+    results = writer.retrieve("bm25", k=5, use_rerank=False)
+    assert len(results) == 2
+    assert len(redis.keys(f"test:retrieval:{generation}:*")) == 1
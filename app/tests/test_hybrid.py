@@ -0,0 +1,132 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from langchain.schema import Document
+
+from rag.search.hybrid import HybridSearch
+
+KEYS = {"results", "degraded", "legs", "leg_ids", "fusion", "weights"}
+
+
+def doc(point_id):
+    return Document(page_content=f"chunk {point_id}", metadata={"_id": point_id})
+
+
+class StubBM25:
+    def __init__(self, results, delay=0.0, error=None, release=None):
+        self.results = results
+        self.delay = delay
+        self.error = error
+        self.release = release
+
+    def search(self, query, k=10, metadata_filter=None):
+        if self.release is not None:
+            self.release.wait(5)
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.results[:k]
+
+
+class StubVector(StubBM25):
+    def search_within(self, query, k=10, metadata_filter=None, timeout=None):
+        self.timeout = timeout
+        return self.search(query, k, metadata_filter)
+
+
+class StubNative:
+    available = True
+
+    def __init__(self, results=None, error=None):
+        self.results = results or []
+        self.error = error
+
+    def search(self, query, k=10, alpha=0.5, metadata_filter=None, bm25_k=None, vector_k=None):
+        if self.error:
+            raise self.error
+        return self.results
+
+
+BM25 = [(doc("a"), 9.0), (doc("b"), 5.0)]
+VECTOR = [(doc("b"), 0.9), (doc("c"), 0.7)]
+
+
+@pytest.fixture
+def executor():
+    executor = ThreadPoolExecutor(max_workers=4)
+    yield executor
+    executor.shutdown(wait=False)
+
+
+def hybrid(executor, bm25=None, vector=None, **kwargs):
+    kwargs.setdefault("backend", "local")
+    return HybridSearch(bm25 or StubBM25(BM25), vector or StubVector(VECTOR), executor=executor, **kwargs)
+
+
+def test_legs_run_concurrently(executor):
+    search = hybrid(executor, StubBM25(BM25, delay=0.3), StubVector(VECTOR, delay=0.3),
+                    bm25_timeout=2, vector_timeout=2)
+    started = time.perf_counter()
+    info = search.search_with_info("q", k=3, fusion="rrf")
+    assert time.perf_counter() - started < 0.55
+    assert set(info) == KEYS and not info["degraded"]
+    assert {doc.metadata["_id"] for doc, _ in info["results"]} == {"a", "b", "c"}
+    assert info["leg_ids"] == {"bm25": ["a", "b"], "vector": ["b", "c"]}
+    assert info["fusion"] == "rrf" and info["weights"] == (0.5, 0.5)
+    assert {leg["status"] for leg in info["legs"].values()} == {"ok"}
+
+
+def test_vector_leg_gets_its_budget(executor):
+    vector = StubVector(VECTOR)
+    hybrid(executor, vector=vector, vector_timeout=1.5).search_with_info("q")
+    assert vector.timeout == 1.5
+
+
+def test_timed_out_leg_degrades_and_is_counted_until_it_finishes(executor):
+    release = threading.Event()
+    search = hybrid(executor, StubBM25(BM25, release=release), bm25_timeout=0.1, vector_timeout=2)
+    started = time.perf_counter()
+    info = search.search_with_info("q", k=3, alpha=0.3)
+    assert time.perf_counter() - started < 1.0
+    assert info["degraded"]
+    assert info["legs"]["bm25"]["status"] == "timeout"
+    assert info["leg_ids"]["bm25"] == []
+    assert [doc.metadata["_id"] for doc, _ in info["results"]] == ["b", "c"]
+    # Thread của leg vẫn bị chiếm tới khi nó chạy xong
+    assert search.abandoned_legs == 1
+    release.set()
+    deadline = time.monotonic() + 2
+    while search.abandoned_legs and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert search.abandoned_legs == 0
+
+
+def test_failing_leg_degrades(executor):
+    search = hybrid(executor, vector=StubVector(VECTOR, error=ConnectionError("qdrant down")))
+    info = search.search_with_info("q", k=3)
+    assert info["degraded"]
+    assert info["legs"]["vector"] == {"status": "error", "error": "qdrant down"}
+    assert [doc.metadata["_id"] for doc, _ in info["results"]] == ["a", "b"]
+
+
+def test_unknown_fusion_raises(executor):
+    with pytest.raises(ValueError):
+        hybrid(executor).search_with_info("q", fusion="borda")
+
+
+@pytest.mark.parametrize("alpha, weights", [(0.5, (1.0, 1.0)), (0.0, (1.0, 0.0)), (1.0, (0.0, 1.0))])
+def test_native_path_returns_same_keys(executor, alpha, weights):
+    search = hybrid(executor, native=StubNative(VECTOR), backend="qdrant")
+    assert search.uses_native
+    info = search.search_with_info("q", k=3, alpha=alpha)
+    assert set(info) == KEYS
+    assert info["results"] == VECTOR and not info["degraded"]
+    assert info["fusion"] == "native" and info["leg_ids"] == {} and info["weights"] == weights
+
+
+def test_native_failure_keeps_keys(executor):
+    search = hybrid(executor, native=StubNative(error=TimeoutError("slow")), backend="qdrant")
+    info = search.search_with_info("q")
+    assert set(info) == KEYS and info["degraded"] and info["results"] == []
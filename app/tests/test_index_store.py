@@ -0,0 +1,187 @@
+import numpy as np
+import pytest
+from langchain.schema import Document
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from config import BM25_SYNC_INTERVAL
+from rag.search.bm25 import BM25Search
+from rag.search.index_store import (
+    DiskSegmentStore, RedisSegmentStore, apply_deleted, decode_segment, encode_segment,
+)
+from rag.search.inverted_index import Segment
+from rag.utils.cache import CacheManager
+
+FIELDS = ("file_name", "page")
+
+
+def docs(*texts, file_name="a.pdf"):
+    return [Document(page_content=text, metadata={"_id": f"{file_name}:{i}", "file_name": file_name, "page": i})
+            for i, text in enumerate(texts)]
+
+
+def segment(segment_id=0, first_doc_id=0, items=None):
+    items = items or docs("xin chào thế giới", "hello world", "chào buổi sáng")
+    return Segment.build(segment_id, first_doc_id, items, [d.page_content.split() for d in items], FIELDS)
+
+
+def assert_same_segment(left, right):
+    assert left.segment_id == right.segment_id
+    assert left.doc_ids.tolist() == right.doc_ids.tolist()
+    assert left.terms == right.terms
+    assert (left.tf != right.tf).nnz == 0
+    assert [d.page_content for d in left.documents] == [d.page_content for d in right.documents]
+    assert [d.metadata for d in left.documents] == [d.metadata for d in right.documents]
+    assert {f: {v: ids.tolist() for v, ids in p.items()} for f, p in left.keywords.items()} == \
+        {f: {v: ids.tolist() for v, ids in p.items()} for f, p in right.keywords.items()}
+    assert (left.deleted is None) == (right.deleted is None)
+    if left.deleted is not None:
+        assert left.deleted.tolist() == right.deleted.tolist()
+
+
+def test_segment_round_trip():
+    original = segment(3, 10)
+    decoded = decode_segment(encode_segment(original))
+    assert_same_segment(original, decoded)
+    assert decoded.columns["page"].tolist() == [0.0, 1.0, 2.0]
+
+
+def test_decode_rejects_other_formats():
+    data = bytearray(encode_segment(segment()))
+    data[8] = 99
+    with pytest.raises(ValueError):
+        decode_segment(bytes(data))
+    with pytest.raises(ValueError):
+        decode_segment(b"not a segment at all")
+
+
+@pytest.fixture(params=["redis", "disk"])
+def store(request, tmp_path):
+    if request.param == "redis":
+        # chunk nhỏ để mỗi segment bị chia thành nhiều key
+        return RedisSegmentStore(fakeredis.FakeRedis(), chunk_size=256)
+    return DiskSegmentStore(str(tmp_path))
+
+
+def test_store_append_replace_and_tombstones(store):
+    first, second = segment(0, 0), segment(1, 3, docs("một hai", "ba bốn", file_name="b.pdf"))
+    store.append(first)
+    store.append(second)
+    mask = np.array([False, True, False])
+    store.update_deletions([first.with_deletions(mask)])
+    loaded = store.load()
+    assert [s.segment_id for s in loaded] == [0, 1]
+    assert loaded[0].deleted.tolist() == mask.tolist()
+
+    merged = Segment.merge(2, [first.with_deletions(mask), second])
+    store.replace([first, second], merged)
+    (loaded,) = store.load()
+    assert_same_segment(merged, loaded)
+
+    store.clear()
+    assert store.load() == []
+
+
+def test_store_version_tracks_writers(store):
+    store.load()
+    store.append(segment(0, 0))
+    assert not store.is_stale()
+    # Process khác ghi: version tăng mà index local không có thay đổi đó
+    version = store.current_version()
+    store.local_version = version - 1
+    assert store.is_stale()
+    store.load()
+    assert not store.is_stale()
+
+
+def test_load_reuses_cached_segments(store):
+    first = segment(0, 0)
+    store.append(first)
+    store.update_deletions([first.with_deletions(np.array([True, False, False]))])
+    (loaded,) = store.load(cached={0: first})
+    # Không decode lại: cùng postings, chỉ áp tombstones từ store
+    assert loaded.tf is first.tf
+    assert loaded.deleted.tolist() == [True, False, False]
+
+
+def test_apply_deleted_without_bitmap_keeps_segment():
+    original = segment()
+    assert apply_deleted(original, None) is original
+
+
+def test_redis_ids_are_unique_across_workers():
+    client = fakeredis.FakeRedis()
+    worker_a, worker_b = RedisSegmentStore(client), RedisSegmentStore(client)
+    allocated = [worker_a.allocate_ids(5), worker_b.allocate_ids(3), worker_a.allocate_ids(2, 10, 100)]
+    assert allocated == [(0, 0), (1, 5), (10, 100)]
+    assert worker_b.allocate_ids(1) == (11, 102)
+
+
+def test_disk_store_has_a_single_writer(tmp_path):
+    writer, other = DiskSegmentStore(str(tmp_path)), DiskSegmentStore(str(tmp_path))
+    writer.append(segment(0, 0))
+    with pytest.raises(RuntimeError):
+        other.append(segment(1, 3))
+    # Process khác vẫn đọc được và thấy revision mới của writer
+    assert [s.segment_id for s in other.load()] == [0]
+    writer.append(segment(1, 3, docs("mới", file_name="b.pdf")))
+    assert other.is_stale()
+
+
+@pytest.fixture
+def workers():
+    """Hai worker (hai BM25Search) dùng chung một Redis, merge chạy đồng bộ"""
+    client = fakeredis.FakeRedis()
+    searches = []
+    for _ in range(2):
+        search = BM25Search(CacheManager(client=client, index_dir=None))
+        search.index.background_merge = False
+        search.load_cache()
+        searches.append(search)
+    return searches
+
+
+def hits(search, query):
+    return sorted(doc.metadata["_id"] for doc, _ in search.search(query, k=10))
+
+
+def test_worker_picks_up_segments_appended_by_another(workers):
+    writer, reader = workers
+    writer.add_documents(docs("qdrant vector database", "bm25 lexical search"))
+    assert hits(reader, "bm25") == []  # vừa load xong, chưa tới lượt kiểm tra version
+    reader._checked_at -= BM25_SYNC_INTERVAL
+    assert hits(reader, "bm25") == ["a.pdf:1"]
+    assert reader.get_status()["in_sync"]
+
+    writer.add_documents(docs("another bm25 chunk", file_name="b.pdf"))
+    assert reader.sync(max_age=0)
+    assert hits(reader, "bm25") == ["a.pdf:1", "b.pdf:0"]
+
+
+def test_worker_picks_up_deletions_by_another(workers):
+    writer, reader = workers
+    writer.add_documents(docs("bm25 one", "bm25 two", "bm25 three", "other", file_name="a.pdf"))
+    writer.add_documents(docs("bm25 four", file_name="b.pdf"))
+    reader.sync(max_age=0)
+    writer.delete_documents({"file_name": "b.pdf"})
+    assert reader.sync(max_age=0)
+    assert hits(reader, "bm25") == ["a.pdf:0", "a.pdf:1", "a.pdf:2"]
+    assert hits(writer, "bm25") == hits(reader, "bm25")
+
+
+def test_own_writes_keep_worker_in_sync(workers):
+    writer, _ = workers
+    writer.add_documents(docs("hello"))
+    assert not writer.cache_manager.bm25_cache_stale()
+    assert writer.sync(max_age=0)
+
+
+def test_sync_is_throttled(workers, monkeypatch):
+    writer, reader = workers
+    reader.sync(max_age=0)
+    writer.add_documents(docs("late chunk"))
+    # Trong khoảng max_age không đọc lại version: vẫn trả kết quả lần kiểm tra trước
+    assert reader.sync(max_age=3600)
+    assert reader.document_count == 0
+    assert reader.sync(max_age=0)
+    assert reader.document_count == 1
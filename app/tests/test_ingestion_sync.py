@@ -0,0 +1,103 @@
+import threading
+import time
+
+import pytest
+from langchain.schema import Document
+
+pytestmark = pytest.mark.filterwarnings("ignore:Payload indexes have no effect")
+
+
+def chunks(*pages, file_name="a.pdf"):
+    """Mỗi phần tử là (page, text); chunk đánh số theo thứ tự như process_pdf"""
+    return [Document(page_content=text, metadata={"file_name": file_name, "page": page, "type": "pdf",
+                                                  "chunk": i + 1})
+            for i, (page, text) in enumerate(pages)]
+
+
+V1 = [(1, "Chương một: giới thiệu"), (1, "Bảng | cột"), (2, "Bảng | cột"), (2, "Kết luận chương một")]
+# Phiên bản 2: thêm một chunk ở đầu (các chunk sau dịch vị trí), bỏ kết luận
+V2 = [(1, "Lời nói đầu mới"), (1, "Chương một: giới thiệu"), (2, "Bảng | cột"), (3, "Bảng | cột")]
+
+
+def points(manager, file_name="a.pdf"):
+    found, _ = manager.client.scroll(manager.collection_name, scroll_filter=manager._file_filter(file_name),
+                                     limit=100, with_payload=True)
+    return {str(p.id): p.payload for p in found}
+
+
+def bm25_ids(manager):
+    return sorted(doc.metadata["_id"] for doc, _ in manager.bm25_search.search("chương bảng lời kết bản", k=100))
+
+
+def test_ids_are_deterministic_and_repeated_chunks_are_kept(vector_manager):
+    _, ids = vector_manager._assign_ids(chunks(*V1))
+    _, again = vector_manager._assign_ids(chunks(*V1))
+    assert ids == again
+    # "Bảng | cột" xuất hiện hai lần -> hai point khác nhau
+    assert len(set(ids)) == 4
+    _, other_file = vector_manager._assign_ids(chunks(*V1, file_name="b.pdf"))
+    assert not set(ids) & set(other_file)
+
+
+def test_reingesting_same_file_adds_nothing(vector_manager):
+    first = vector_manager._sync_file("a.pdf", "hash-1", chunks(*V1))
+    assert first == {"added": 4, "unchanged": 0, "removed": 0}
+    before = points(vector_manager)
+    bumps = len(vector_manager.index_generation.bumps)
+
+    again = vector_manager._sync_file("a.pdf", "hash-1", chunks(*V1))
+    assert again == {"added": 0, "unchanged": 4, "removed": 0}
+    assert points(vector_manager) == before
+    assert len(bm25_ids(vector_manager)) == 4
+    # Không có gì thay đổi -> retrieval cache vẫn hợp lệ
+    assert len(vector_manager.index_generation.bumps) == bumps
+    assert vector_manager._is_ingested("a.pdf", "hash-1")
+    assert not vector_manager._is_ingested("a.pdf", "hash-2")
+
+
+def test_changed_file_removes_stale_and_refreshes_moved_chunks(vector_manager):
+    vector_manager._sync_file("a.pdf", "hash-1", chunks(*V1))
+    old_ids = set(points(vector_manager))
+    result = vector_manager._sync_file("a.pdf", "hash-2", chunks(*V2))
+    assert result == {"added": 1, "unchanged": 3, "removed": 1}
+
+    current = points(vector_manager)
+    _, expected_ids = vector_manager._assign_ids(chunks(*V2))
+    assert set(current) == set(expected_ids)
+    assert len(old_ids & set(current)) == 3
+    # Mọi point mang file_hash mới và vị trí page / chunk mới
+    positions = sorted((p["metadata"]["chunk"], p["metadata"]["page"], p["page_content"]) for p in current.values())
+    assert positions == [(i + 1, page, text) for i, (page, text) in enumerate(V2)]
+    assert {p["metadata"]["file_hash"] for p in current.values()} == {"hash-2"}
+    assert vector_manager._is_ingested("a.pdf", "hash-2")
+
+    # BM25 khớp Qdrant: không còn chunk cũ, chunk dịch chuyển mang vị trí mới
+    assert bm25_ids(vector_manager) == sorted(expected_ids)
+    moved = {doc.metadata["_id"]: doc.metadata for doc, _ in vector_manager.bm25_search.search("chương", k=10)}
+    assert [(m["page"], m["chunk"]) for m in moved.values()] == [(1, 2)]
+
+
+def test_concurrent_ingestion_of_one_file_is_serialized(vector_manager):
+    vector_manager._sync_file("a.pdf", "hash-1", chunks(*V1))
+    run = vector_manager.pipeline.run
+
+    def slow_run(*args, **kwargs):
+        time.sleep(0.1)
+        return run(*args, **kwargs)
+
+    vector_manager.pipeline.run = slow_run
+    versions = {"hash-2": V2, "hash-3": [(1, "Bản thứ ba hoàn toàn khác"), (2, "Kết luận chương một")]}
+    threads = [threading.Thread(target=vector_manager._sync_file, args=("a.pdf", file_hash, chunks(*pages)))
+               for file_hash, pages in versions.items()]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    # Kết quả cuối là đúng một phiên bản, không trộn points của hai lần ingest
+    current = points(vector_manager)
+    hashes = {p["metadata"]["file_hash"] for p in current.values()}
+    assert len(hashes) == 1
+    _, expected_ids = vector_manager._assign_ids(chunks(*versions[hashes.pop()]))
+    assert set(current) == set(expected_ids)
+    assert bm25_ids(vector_manager) == sorted(expected_ids)
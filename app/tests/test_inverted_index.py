@@ -0,0 +1,213 @@
+import numpy as np
+import pytest
+from langchain.schema import Document
+
+from rag.search.inverted_index import InvertedIndex, Segment
+
+CORPUS = [
+    ("the quick brown fox", {"file_name": "a.pdf", "page": 1}),
+    ("the lazy dog sleeps", {"file_name": "a.pdf", "page": 2}),
+    ("quick quick fox jumps", {"file_name": "b.pdf", "page": 1}),
+    ("a brown dog and a fox", {"file_name": "b.pdf", "page": 3}),
+    ("nothing relevant here", {"file_name": "c.pdf", "page": 5, "lang": "en"}),
+]
+
+
+def make_docs(corpus=CORPUS):
+    return [Document(page_content=text, metadata={"_id": i, **meta}) for i, (text, meta) in enumerate(corpus)]
+
+
+def tokens(docs):
+    return [doc.page_content.split() for doc in docs]
+
+
+def make_index(docs=None, batch=None, **kwargs):
+    kwargs.setdefault("background_merge", False)
+    kwargs.setdefault("metadata_fields", ("file_name", "page"))
+    index = InvertedIndex(**kwargs)
+    docs = make_docs() if docs is None else docs
+    batch = batch or len(docs)
+    for start in range(0, len(docs), batch):
+        part = docs[start:start + batch]
+        index.add_documents(part, tokens(part))
+    return index
+
+
+def ranked(index, query, k=10, metadata_filter=None):
+    return [(doc.metadata["_id"], round(score, 5))
+            for doc, score in index.search(query.split(), k=k, metadata_filter=metadata_filter)]
+
+
+def bm25(index, query, doc_tokens, corpus_tokens, k1=1.5, b=0.75):
+    """Tham chiếu BM25 tính trực tiếp từ corpus (không qua segment / CSR)"""
+    avgdl = sum(map(len, corpus_tokens)) / len(corpus_tokens)
+    score = 0.0
+    for term in query:
+        tf = doc_tokens.count(term)
+        if not tf:
+            continue
+        df = sum(term in t for t in corpus_tokens)
+        score += index.idf(df, len(corpus_tokens)) * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc_tokens) / avgdl))
+    return score
+
+
+def test_scores_match_reference_bm25():
+    index = make_index()
+    corpus = tokens(make_docs())
+    for doc, score in index.search(["quick", "fox"], k=10):
+        expected = bm25(index, ["quick", "fox"], corpus[doc.metadata["_id"]], corpus)
+        assert score == pytest.approx(expected, rel=1e-5)
+    assert [doc.metadata["_id"] for doc, _ in index.search(["quick", "fox"], k=1)] == [2]
+
+
+def test_segmented_index_scores_like_single_segment():
+    assert ranked(make_index(batch=2), "brown fox dog") == ranked(make_index(), "brown fox dog")
+    assert len(make_index(batch=2).snapshot.segments) == 3
+
+
+def test_only_positive_scores_are_returned():
+    assert ranked(make_index(), "missing") == []
+    assert 4 not in [i for i, _ in ranked(make_index(), "fox")]
+
+
+def test_delete_tombstones_documents():
+    index = make_index()
+    removed = index.delete({"file_name": "c.pdf"})
+    assert removed == 1
+    assert len(index) == 4
+    assert ranked(index, "relevant") == []
+    # 1/5 dưới COMPACT_DELETED_RATIO: postings vẫn còn, document chỉ bị đánh dấu deleted
+    (segment,) = index.snapshot.segments
+    assert len(segment) == 5
+    assert segment.deleted.tolist() == [False, False, False, False, True]
+    assert index.snapshot.doc_freq("relevant") == 0
+
+
+def test_delete_across_segments():
+    index = make_index(batch=2)
+    assert index.delete({"file_name": "b.pdf"}) == 2
+    assert len(index) == 3
+    assert {i for i, _ in ranked(index, "fox dog")} == {0, 1}
+    assert index.snapshot.doc_freq("fox") == 1
+
+
+def test_scores_after_delete_match_fresh_index():
+    docs = make_docs()
+    index = make_index(docs, batch=2)
+    index.delete({"file_name": "b.pdf"})
+    survivors = [doc for doc in docs if doc.metadata["file_name"] != "b.pdf"]
+    assert ranked(index, "brown dog fox") == ranked(make_index(survivors), "brown dog fox")
+
+
+def test_delete_is_idempotent_and_requires_filter():
+    index = make_index()
+    assert index.delete({"file_name": "a.pdf"}) == 2
+    assert index.delete({"file_name": "a.pdf"}) == 0
+    with pytest.raises(ValueError):
+        index.delete({})
+
+
+def test_delete_by_unindexed_field():
+    index = make_index()
+    assert index.delete({"lang": "en"}) == 1
+    assert len(index) == 4
+
+
+def test_search_filters():
+    index = make_index(batch=2)
+    assert {i for i, _ in ranked(index, "fox dog", metadata_filter={"file_name": "b.pdf"})} == {2, 3}
+    assert {i for i, _ in ranked(index, "fox dog", metadata_filter={"page": {"gte": 2}})} == {1, 3}
+    assert {i for i, _ in ranked(index, "fox dog", metadata_filter={"file_name": ["a.pdf", "c.pdf"]})} == {0, 1}
+    assert ranked(index, "relevant", metadata_filter={"lang": "en"}) == [(4, ranked(index, "relevant")[0][1])]
+    assert ranked(index, "fox", metadata_filter={"file_name": "missing.pdf"}) == []
+
+
+def test_merge_keeps_doc_ids_and_results():
+    docs = make_docs()
+    index = make_index(docs, batch=1, merge_factor=8)
+    before = ranked(index, "quick brown dog")
+    index.merge_factor = 2
+    assert index.merge_segments()
+    assert len(index.snapshot.segments) < 5
+    assert ranked(index, "quick brown dog") == before
+    doc_ids = np.concatenate([segment.doc_ids for segment in index.snapshot.segments])
+    assert doc_ids.tolist() == list(range(5))
+
+
+def test_compaction_drops_tombstoned_documents():
+    index = make_index(batch=5)
+    index.delete({"file_name": "a.pdf"})
+    # 2/5 đã xóa >= COMPACT_DELETED_RATIO: segment được compact ngay (merge đồng bộ)
+    (segment,) = index.snapshot.segments
+    assert segment.deleted is None
+    assert len(segment) == 3
+    assert segment.doc_ids.tolist() == [2, 3, 4]
+    assert "lazy" not in segment.term_index
+    assert {i for i, _ in ranked(index, "fox dog", metadata_filter={"page": 1})} == {2}
+
+
+def test_segment_with_deletions_is_copy_on_write():
+    docs = make_docs()
+    segment = Segment.build(0, 0, docs, tokens(docs), ("file_name",))
+    mask = np.zeros(len(docs), dtype=bool)
+    mask[0] = True
+    deleted = segment.with_deletions(mask)
+    assert segment.deleted is None and segment.live_count == 5
+    assert deleted.live_count == 4
+    assert deleted.doc_freq("quick") == 1 and segment.doc_freq("quick") == 2
+
+
+def test_persist_callbacks_follow_snapshot_order():
+    events = []
+    index = make_index(
+        make_docs(), batch=1, merge_factor=2,
+        on_add=lambda segment: events.append(("add", segment.segment_id)),
+        on_delete=lambda segments: events.append(("delete", [s.segment_id for s in segments])),
+        on_merge=lambda inputs, merged: events.append(
+            ("merge", [s.segment_id for s in inputs], merged.segment_id)),
+    )
+    index.delete({"file_name": "c.pdf"})
+    live = {segment.segment_id for segment in index.snapshot.segments}
+    persisted = set()
+    for event in events:
+        if event[0] == "add":
+            persisted.add(event[1])
+        elif event[0] == "merge":
+            assert set(event[1]) <= persisted
+            persisted -= set(event[1])
+            persisted.add(event[2])
+        else:
+            assert set(event[1]) <= persisted
+    assert persisted == live
+
+
+def test_allocate_ids_from_shared_store():
+    calls = []
+
+    def allocate(doc_count, min_segment_id, min_doc_id):
+        calls.append((doc_count, min_segment_id, min_doc_id))
+        return 100 + len(calls), 1000 * len(calls)
+
+    index = make_index(batch=3, allocate_ids=allocate, merge_factor=8)
+    assert calls == [(3, 0, 0), (2, 102, 1003)]
+    assert [s.segment_id for s in index.snapshot.segments] == [101, 102]
+    assert index.snapshot.segments[1].doc_ids.tolist() == [2000, 2001]
+
+
+def test_allocate_ids_failure_falls_back_to_local_ids():
+    def allocate(*_):
+        raise ConnectionError("store down")
+
+    index = make_index(batch=3, allocate_ids=allocate, merge_factor=8)
+    assert [s.segment_id for s in index.snapshot.segments] == [0, 1]
+    assert index.snapshot.segments[1].doc_ids.tolist() == [3, 4]
+
+
+def test_reset_continues_ids_after_loaded_segments():
+    docs = make_docs()
+    loaded = Segment.build(7, 40, docs[:2], tokens(docs[:2]))
+    index = InvertedIndex(background_merge=False)
+    index.reset([loaded])
+    segment = index.add_documents(docs[2:3], tokens(docs[2:3]))
+    assert (segment.segment_id, segment.doc_ids.tolist()) == (8, [42])
+    assert len(index) == 3
@@ -0,0 +1,206 @@
+import io
+from types import SimpleNamespace
+
+import pytest
+
+from config import INGEST_RETRY_AFTER
+from ingestion.jobs import FAILED, QUEUED, RUNNING, SUCCEEDED, JobManager, QueueFullError
+
+
+class ManualExecutor:
+    """Executor đồng bộ: giữ các job đã submit, test tự chạy từng job"""
+
+    def __init__(self):
+        self.pending = []
+
+    def submit(self, fn, *args, **kwargs):
+        self.pending.append((fn, args, kwargs))
+
+    def run_next(self):
+        fn, args, kwargs = self.pending.pop(0)
+        fn(*args, **kwargs)
+
+    def run_all(self):
+        while self.pending:
+            self.run_next()
+
+    def shutdown(self, wait=True):
+        self.pending.clear()
+
+
+def ingest_ok(file, progress=None, **kwargs):
+    progress = progress or (lambda event: None)
+    progress({"event": "progress", "msg": "embedding", "done": 1, "total": 2})
+    progress({"event": "progress", "msg": "embedding", "done": 2, "total": 2})
+    return {"filename": file.filename, "chunks": 2, **kwargs}
+
+
+def ingest_fail(file, progress=None, **kwargs):
+    progress({"event": "progress", "msg": "parsing"})
+    raise ValueError("corrupt pdf")
+
+
+def upload(name="doc.pdf"):
+    buffer = io.BytesIO(b"%PDF-1.4 test")
+    buffer.filename = name
+    return buffer
+
+
+@pytest.fixture
+def executor():
+    return ManualExecutor()
+
+
+@pytest.fixture
+def manager(executor):
+    return JobManager(max_pending=2, history=2, executor=executor)
+
+
+def test_job_status_transitions_and_progress(manager, executor):
+    job = manager.submit("pdf", "doc.pdf", ingest_ok, upload())
+    assert job.status == QUEUED
+    assert [event["event"] for event in job.events] == ["queued"]
+
+    statuses = []
+    emit = manager._emit
+
+    def record_status(job, event):
+        statuses.append(job.status)
+        emit(job, event)
+
+    manager._emit = record_status
+    executor.run_next()
+
+    assert job.status == SUCCEEDED
+    assert job.result == {"filename": "doc.pdf", "chunks": 2}
+    assert job.started_at is not None and job.finished_at >= job.started_at
+    assert [event["event"] for event in job.events] == ["queued", "start", "progress", "progress", "done"]
+    assert [event.get("done") for event in job.events if event["event"] == "progress"] == [1, 2]
+    assert all(event["job_id"] == job.id for event in job.events)
+    # start/progress phát khi job đang chạy, done phát sau khi đã đổi status
+    assert statuses == [RUNNING, RUNNING, RUNNING, SUCCEEDED]
+    assert manager.get(job.id).to_dict()["last_event"]["event"] == "done"
+
+
+def test_failed_job_records_error(manager, executor):
+    job = manager.submit("pdf", "bad.pdf", ingest_fail, upload("bad.pdf"))
+    executor.run_all()
+
+    assert job.status == FAILED
+    assert job.error == "corrupt pdf"
+    assert job.result is None
+    assert [event["event"] for event in job.events] == ["queued", "start", "progress", "error"]
+
+
+def test_submit_raises_when_queue_full(manager, executor):
+    manager.submit("pdf", "a.pdf", ingest_ok, upload("a.pdf"))
+    manager.submit("pdf", "b.pdf", ingest_ok, upload("b.pdf"))
+    with pytest.raises(QueueFullError):
+        manager.submit("pdf", "c.pdf", ingest_ok, upload("c.pdf"))
+    assert len(executor.pending) == 2
+
+    # Job đã chạy xong không còn tính vào hàng đợi
+    executor.run_next()
+    job = manager.submit("pdf", "c.pdf", ingest_ok, upload("c.pdf"))
+    assert job.status == QUEUED
+
+
+def test_events_replays_history_until_done(manager, executor):
+    job = manager.submit("idioms", "idioms.pdf", ingest_ok, upload("idioms.pdf"), source_name="idioms")
+    executor.run_all()
+
+    events = list(manager.events(job.id, timeout=0.01))
+    assert [event["event"] for event in events] == ["queued", "start", "progress", "progress", "done"]
+    assert events[-1]["result"]["source_name"] == "idioms"
+    assert list(manager.events("missing")) == []
+
+
+def test_events_pings_while_job_is_queued(manager):
+    job = manager.submit("pdf", "doc.pdf", ingest_ok, upload())
+    stream = manager.events(job.id, timeout=0.01)
+    assert next(stream)["event"] == "queued"
+    assert next(stream) == {"event": "ping"}
+
+
+def test_prune_keeps_only_recent_finished_jobs(manager, executor):
+    jobs = []
+    for name in ("a.pdf", "b.pdf", "c.pdf"):
+        jobs.append(manager.submit("pdf", name, ingest_ok, upload(name)))
+        executor.run_all()
+    queued = manager.submit("pdf", "d.pdf", ingest_ok, upload("d.pdf"))
+
+    assert manager.get(jobs[0].id) is None
+    assert [job["filename"] for job in manager.list_jobs()] == ["d.pdf", "c.pdf", "b.pdf"]
+    assert manager.get(queued.id).status == QUEUED
+
+
+# --- Routes ---
+
+@pytest.fixture
+def client(manager, monkeypatch):
+    flask = pytest.importorskip("flask")
+    import routes
+    import stream_routes
+
+    fake_services = SimpleNamespace(job_manager=manager)
+    monkeypatch.setattr(routes, "services", fake_services)
+    monkeypatch.setattr(stream_routes, "services", fake_services)
+    monkeypatch.setattr(routes, "ingest_pdf", ingest_ok)
+    monkeypatch.setattr(stream_routes, "ingest_idioms", ingest_ok)
+
+    app = flask.Flask(__name__)
+    app.register_blueprint(routes.api_bp)
+    app.register_blueprint(stream_routes.stream_bp)
+    return app.test_client()
+
+
+def post_pdf(client, name="doc.pdf", path="/pdf", **form):
+    data = {"file": (io.BytesIO(b"%PDF-1.4 test"), name), **form}
+    return client.post(path, data=data, content_type="multipart/form-data")
+
+
+def test_pdf_upload_returns_202_and_job_status(client, executor):
+    response = post_pdf(client)
+    assert response.status_code == 202
+    body = response.get_json()
+    assert body["status"] == QUEUED
+    assert body["status_url"] == f"/jobs/{body['job_id']}"
+
+    status = client.get(body["status_url"]).get_json()
+    assert status["status"] == QUEUED
+
+    executor.run_all()
+    status = client.get(body["status_url"]).get_json()
+    assert status["status"] == SUCCEEDED
+    assert status["result"] == {"filename": "doc.pdf", "chunks": 2}
+
+    stream = client.get(body["stream_url"])
+    assert stream.status_code == 200
+    assert stream.get_data(as_text=True).count("data: ") == 5
+
+
+def test_pdf_sync_runs_in_request(client, executor):
+    response = post_pdf(client, sync="true")
+    assert response.status_code == 200
+    assert response.get_json()["chunks"] == 2
+    assert executor.pending == []
+
+
+def test_queue_full_returns_503_with_retry_after(client):
+    assert post_pdf(client, "a.pdf").status_code == 202
+    assert post_pdf(client, "b.pdf").status_code == 202
+
+    response = post_pdf(client, "c.pdf")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(INGEST_RETRY_AFTER)
+    assert "pending" in response.get_json()["error"]
+
+    response = post_pdf(client, "c.pdf", path="/idioms_stream")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(INGEST_RETRY_AFTER)
+
+
+def test_unknown_job_returns_404(client):
+    assert client.get("/jobs/missing").status_code == 404
+    assert client.get("/jobs/missing/stream").status_code == 404
+    assert client.get("/jobs").get_json() == {"jobs": []}
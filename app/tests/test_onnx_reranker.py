@@ -0,0 +1,46 @@
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("tokenizers")
+pytest.importorskip("sentence_transformers")
+
+from config import RERANKER_MODEL, RERANKER_ONNX_DIR, RERANK_MAX_LENGTH
+from rag.retrieval.onnx_reranker import ONNX_QUANTIZED_FILE, PARITY_PAIRS, OnnxCrossEncoder
+
+# Sai lệch tối đa cho phép giữa score int8 và score PyTorch (sigmoid, thang 0..1)
+TOLERANCE = 0.05
+
+pytestmark = pytest.mark.skipif(
+    not os.path.exists(os.path.join(RERANKER_ONNX_DIR, ONNX_QUANTIZED_FILE)),
+    reason="onnx reranker not exported (python -m rag.retrieval.onnx_reranker)",
+)
+
+
+@pytest.fixture(scope="module")
+def scores():
+    from sentence_transformers import CrossEncoder
+
+    try:
+        reference = CrossEncoder(RERANKER_MODEL, max_length=RERANK_MAX_LENGTH)
+    except Exception as e:
+        pytest.skip(f"cannot load {RERANKER_MODEL}: {e}")
+    pairs = list(PARITY_PAIRS)
+    torch_scores = np.asarray(reference.predict(pairs, show_progress_bar=False), dtype=np.float32)
+    onnx_scores = OnnxCrossEncoder(RERANKER_ONNX_DIR).predict(pairs)
+    return pairs, torch_scores, onnx_scores
+
+
+def test_int8_scores_match_torch(scores):
+    _, torch_scores, onnx_scores = scores
+    assert onnx_scores.shape == torch_scores.shape
+    np.testing.assert_allclose(onnx_scores, torch_scores, atol=TOLERANCE)
+
+
+def test_int8_keeps_ranking_per_query(scores):
+    pairs, torch_scores, onnx_scores = scores
+    for query in dict.fromkeys(q for q, _ in pairs):
+        rows = [i for i, (q, _) in enumerate(pairs) if q == query]
+        assert list(np.argsort(-onnx_scores[rows])) == list(np.argsort(-torch_scores[rows])), query
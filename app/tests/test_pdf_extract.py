@@ -0,0 +1,91 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("pypdf")
+
+from config import PDF_PARALLEL_MIN_PAGES
+from ingestion import pdf as pdf_module
+from ingestion.pdf import count_pages, extract_page_range, extract_pages
+
+
+def make_pdf(texts):
+    """PDF tối thiểu: mỗi page một dòng text Helvetica (page rỗng nếu text là "")"""
+    pages = len(texts)
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{4 + 2 * i} 0 R" for i in range(pages)), pages),
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, text in enumerate(texts):
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET" if text else ""
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    return bytes(out)
+
+
+TEXTS = [f"page {i + 1}" if i % 5 else "" for i in range(PDF_PARALLEL_MIN_PAGES + 3)]
+
+
+class RecordingExecutor(ThreadPoolExecutor):
+    def __init__(self):
+        super().__init__(max_workers=4)
+        self.ranges = []
+
+    def submit(self, fn, *args, **kwargs):
+        self.ranges.append(args[1:])
+        return super().submit(fn, *args, **kwargs)
+
+
+@pytest.fixture(scope="module")
+def pdf_bytes():
+    return make_pdf(TEXTS)
+
+
+def test_extract_page_range(pdf_bytes):
+    assert count_pages(pdf_bytes) == len(TEXTS)
+    assert [text.strip() for text in extract_page_range(pdf_bytes, 1, 4)] == TEXTS[1:4]
+
+
+def test_parallel_extraction_keeps_page_order(pdf_bytes):
+    serial = extract_pages(pdf_bytes)
+    with RecordingExecutor() as executor:
+        parallel = extract_pages(pdf_bytes, executor=executor, workers=4)
+
+    assert parallel == serial
+    assert [text.strip() for text in parallel] == TEXTS
+    # Khoảng page liên tiếp, không chồng lấn, phủ hết PDF
+    assert len(executor.ranges) == 4
+    assert [start for start, _ in executor.ranges] == sorted(start for start, _ in executor.ranges)
+    assert all(end == start for (_, end), (start, _) in zip(executor.ranges, executor.ranges[1:]))
+    assert executor.ranges[0][0] == 0 and executor.ranges[-1][1] == len(TEXTS)
+
+
+def test_small_pdf_is_extracted_inline(monkeypatch):
+    small = make_pdf(["one", "two"])
+    with RecordingExecutor() as executor:
+        assert [text.strip() for text in extract_pages(small, executor=executor, workers=4)] == ["one", "two"]
+    assert executor.ranges == []
+
+    monkeypatch.setattr(pdf_module, "PDF_PARALLEL_MIN_PAGES", 1)
+    with RecordingExecutor() as executor:
+        assert [text.strip() for text in extract_pages(small, executor=executor, workers=4)] == ["one", "two"]
+    assert executor.ranges == [(0, 1), (1, 2)]
+
+
+def test_process_pool_extraction(pdf_bytes):
+    # spawn như pdf_executor của ServiceContainer
+    with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn")) as executor:
+        assert extract_pages(pdf_bytes, executor=executor, workers=2) == extract_pages(pdf_bytes)
@@ -0,0 +1,117 @@
+import threading
+
+import pytest
+from langchain.schema import Document
+
+from config import SPARSE_VECTOR_NAME
+from ingestion import pipeline as pipeline_module
+from ingestion.pipeline import EmbedUpsertPipeline
+from rag.search.sparse import SparseEncoder
+
+
+class FakeEmbeddings:
+    """Embedding giả: ghi lại batch nào đang embed, có thể fail một số lần đầu"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = 0
+        self.started = []
+        self.lock = threading.Lock()
+        self.batch_started = threading.Condition(self.lock)
+
+    def embed_documents(self, texts):
+        with self.lock:
+            self.calls += 1
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("embedding server unavailable")
+            self.started.append(texts[0])
+            self.batch_started.notify_all()
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def wait_started(self, count, timeout=2.0):
+        with self.lock:
+            return self.batch_started.wait_for(lambda: len(self.started) >= count, timeout)
+
+
+class FakeClient:
+    def __init__(self, failures=0, on_upsert=None):
+        self.failures = failures
+        self.on_upsert = on_upsert
+        self.upserts = []
+
+    def upsert(self, collection_name, points):
+        if self.failures:
+            self.failures -= 1
+            raise TimeoutError("qdrant timeout")
+        if self.on_upsert:
+            self.on_upsert(len(self.upserts))
+        self.upserts.append(points)
+
+
+def docs(count):
+    return [Document(page_content=f"chunk {i}", metadata={"chunk": i}) for i in range(count)]
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(pipeline_module.time, "sleep", lambda seconds: None)
+
+
+def test_upserts_in_order_with_ids():
+    client = FakeClient()
+    pipeline = EmbedUpsertPipeline(FakeEmbeddings(), client, "docs", batch_size=3, max_in_flight=2)
+    ids = [f"id-{i}" for i in range(8)]
+    result = pipeline.run(docs(8), ids=ids)
+    assert result["ids"] == ids
+    assert result["stats"]["batches"] == 3 and result["stats"]["chunks"] == 8
+    points = [point for batch in client.upserts for point in batch]
+    assert [len(batch) for batch in client.upserts] == [3, 3, 2]
+    assert [point.id for point in points] == ids
+    assert [point.payload["page_content"] for point in points] == [f"chunk {i}" for i in range(8)]
+    assert points[7].payload["metadata"] == {"chunk": 7}
+    assert points[7].vector == [7.0, 1.0]
+
+
+@pytest.mark.parametrize("max_in_flight", [1, 2, 3])
+def test_upsert_overlaps_max_in_flight_embeds(max_in_flight):
+    embeddings = FakeEmbeddings()
+    overlapped = []
+
+    def on_upsert(number):
+        # Upsert batch đầu: max_in_flight batch sau phải đã được gửi đi embed song song
+        if number == 0:
+            overlapped.append(embeddings.wait_started(1 + max_in_flight))
+
+    client = FakeClient(on_upsert=on_upsert)
+    pipeline = EmbedUpsertPipeline(embeddings, client, "docs", batch_size=1, max_in_flight=max_in_flight)
+    pipeline.run(docs(6))
+    assert overlapped == [True]
+    assert [batch[0].payload["page_content"] for batch in client.upserts] == [f"chunk {i}" for i in range(6)]
+
+
+def test_embed_and_upsert_are_retried():
+    embeddings, client = FakeEmbeddings(failures=2), FakeClient(failures=1)
+    pipeline = EmbedUpsertPipeline(embeddings, client, "docs", batch_size=2, max_in_flight=1, retries=3)
+    pipeline.run(docs(4))
+    assert embeddings.calls == 4
+    assert [[p.payload["page_content"] for p in batch] for batch in client.upserts] == \
+        [["chunk 0", "chunk 1"], ["chunk 2", "chunk 3"]]
+
+
+def test_run_fails_after_retries():
+    pipeline = EmbedUpsertPipeline(FakeEmbeddings(), FakeClient(failures=5), "docs", batch_size=2, retries=2)
+    with pytest.raises(TimeoutError):
+        pipeline.run(docs(2))
+
+
+def test_progress_and_sparse_vectors():
+    client = FakeClient()
+    events = []
+    pipeline = EmbedUpsertPipeline(FakeEmbeddings(), client, "docs", batch_size=2,
+                                   sparse_encoder=SparseEncoder())
+    pipeline.run(docs(3), progress=events.append)
+    assert [event["chunks"] for event in events] == [2, 3]
+    vector = client.upserts[0][0].vector
+    assert set(vector) == {"", SPARSE_VECTOR_NAME}
+    assert not SparseEncoder.is_empty(vector[SPARSE_VECTOR_NAME])
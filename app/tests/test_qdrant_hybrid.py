@@ -0,0 +1,137 @@
+from types import SimpleNamespace
+
+import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointStruct
+
+from collection_profiles import CollectionProfile
+from config import SPARSE_VECTOR_NAME
+from rag.search.qdrant_hybrid import QdrantHybridSearch
+from rag.search.sparse import SparseEncoder
+
+vector_store = pytest.importorskip("vector_store")
+
+TOPICS = ("mèo", "chó", "cá", "chim")
+DOCS = [
+    ("con mèo đen nằm trên mái nhà", "a.pdf"),
+    ("con chó sủa suốt đêm", "a.pdf"),
+    ("cá bơi dưới hồ sen", "b.pdf"),
+    ("chim hót trên cành cây", "b.pdf"),
+    ("mèo và chó chơi với nhau", "c.pdf"),
+]
+
+
+class TopicEmbeddings:
+    """Dense vector giả: mỗi chiều là số lần xuất hiện của một chủ đề"""
+
+    def embed_query(self, text):
+        return [float(text.count(topic)) + 0.01 for topic in TOPICS]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def make_manager(client, monkeypatch, sparse_vectors):
+    """VectorStoreManager chỉ với những gì _ensure_collection_exists / backfill cần"""
+    monkeypatch.setattr(vector_store, "QDRANT_SPARSE_VECTORS", sparse_vectors)
+    monkeypatch.setattr(vector_store, "HYBRID_BACKEND", "qdrant" if sparse_vectors else "local")
+    manager = vector_store.VectorStoreManager.__new__(vector_store.VectorStoreManager)
+    manager.client = client
+    manager.collection_name = "hybrid"
+    manager.embedding = TopicEmbeddings()
+    manager.profile = CollectionProfile.from_config("default")
+    manager.sparse_encoder = SparseEncoder()
+    manager.sparse_enabled = False
+    manager.pipeline = SimpleNamespace(sparse_encoder=None)
+    manager.index_generation = SimpleNamespace(bump=lambda reason="": None)
+    manager._ensure_collection_exists()
+    return manager
+
+
+def upsert(manager, with_sparse=True):
+    encoder = SparseEncoder()
+    points = []
+    for i, (text, file_name) in enumerate(DOCS):
+        vector = {"": manager.embedding.embed_query(text)}
+        if with_sparse:
+            vector[SPARSE_VECTOR_NAME] = encoder.encode_document(text)
+        points.append(PointStruct(id=i, vector=vector, payload={
+            "page_content": text, "metadata": {"file_name": file_name}}))
+    manager.client.upsert(manager.collection_name, points=points)
+
+
+@pytest.fixture
+def client():
+    client = QdrantClient(":memory:")
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def native(client, monkeypatch):
+    manager = make_manager(client, monkeypatch, sparse_vectors=True)
+    upsert(manager)
+    return QdrantHybridSearch(manager)
+
+
+def texts(results):
+    return [doc.page_content for doc, _ in results]
+
+
+def test_local_backend_creates_no_sparse_vectors(client, monkeypatch):
+    manager = make_manager(client, monkeypatch, sparse_vectors=False)
+    assert not client.get_collection("hybrid").config.params.sparse_vectors
+    assert not manager.sparse_enabled and not manager.native_hybrid
+    assert manager.pipeline.sparse_encoder is None
+    with pytest.raises(RuntimeError):
+        manager.backfill_sparse_vectors()
+
+
+def test_sparse_flag_creates_sparse_vectors(client, monkeypatch):
+    manager = make_manager(client, monkeypatch, sparse_vectors=True)
+    assert SPARSE_VECTOR_NAME in client.get_collection("hybrid").config.params.sparse_vectors
+    assert manager.native_hybrid
+    assert manager.pipeline.sparse_encoder is manager.sparse_encoder
+
+
+def test_existing_sparse_collection_without_flag_skips_encoding(client, monkeypatch):
+    make_manager(client, monkeypatch, sparse_vectors=True)
+    manager = make_manager(client, monkeypatch, sparse_vectors=False)
+    assert manager.sparse_enabled and manager.pipeline.sparse_encoder is None
+
+
+def test_backfill_writes_missing_sparse_vectors(client, monkeypatch):
+    manager = make_manager(client, monkeypatch, sparse_vectors=True)
+    upsert(manager, with_sparse=False)
+    search = QdrantHybridSearch(manager)
+    assert search.search("sủa", k=3, alpha=0.0) == []
+    assert manager.backfill_sparse_vectors(batch_size=2) == len(DOCS)
+    assert texts(search.search("sủa", k=3, alpha=0.0)) == ["con chó sủa suốt đêm"]
+
+
+def test_sparse_only_is_lexical(native):
+    results = native.search("hồ sen", k=3, alpha=0.0)
+    assert texts(results) == ["cá bơi dưới hồ sen"]
+    doc = results[0][0]
+    assert doc.metadata == {"file_name": "b.pdf", "_id": "2", "_collection_name": "hybrid"}
+
+
+def test_dense_only_and_fallback_for_empty_sparse_query(native):
+    assert texts(native.search("chim", k=1, alpha=1.0)) == ["chim hót trên cành cây"]
+    # Query không có token lexical -> chỉ dense
+    assert len(native.search("???", k=2, alpha=0.0)) == 2
+
+
+def test_fusion_combines_both_legs(native):
+    results = native.search("mèo sủa", k=3, alpha=0.5)
+    found = texts(results)
+    # "sủa" chỉ có trong sparse leg, "mèo" trội ở dense leg
+    assert "con chó sủa suốt đêm" in found
+    assert "con mèo đen nằm trên mái nhà" in found
+    scores = [score for _, score in results]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_metadata_filter_applies_to_both_legs(native):
+    results = native.search("mèo chó", k=5, alpha=0.5, metadata_filter={"file_name": "c.pdf"})
+    assert texts(results) == ["mèo và chó chơi với nhau"]
@@ -0,0 +1,101 @@
+import unicodedata
+
+import pytest
+from langchain.schema import Document
+
+from rag.retrieval import reranker as reranker_module
+from rag.retrieval.reranker import CrossEncoderReranker, ScoreCache
+
+
+def doc(text, point_id=None):
+    return Document(page_content=text, metadata={"_id": point_id or text})
+
+
+class FakeModel:
+    """CrossEncoder giả: score là độ dài chunk, ghi lại các cặp đã predict"""
+
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, pairs, batch_size=32, show_progress_bar=False):
+        self.calls.append({"pairs": list(pairs), "batch_size": batch_size})
+        return [float(len(text)) for _, text in pairs]
+
+
+@pytest.fixture
+def model(monkeypatch):
+    model = FakeModel()
+    loaded = []
+
+    def load(self, model_name, max_length):
+        loaded.append(max_length)
+        return model
+
+    monkeypatch.setattr(CrossEncoderReranker, "_load_model", load)
+    model.loaded = loaded
+    return model
+
+
+def test_only_uncached_pairs_are_predicted(model):
+    reranker = CrossEncoderReranker(batch_size=8, max_length=256, cache_size=100)
+    assert model.loaded == [256]
+
+    first = reranker.rerank_with_scores("Thủ đô?", [doc("aa"), doc("b"), doc("cccc")], top_k=3)
+    assert [(d.page_content, score) for d, score in first] == [("cccc", 4.0), ("aa", 2.0), ("b", 1.0)]
+    assert model.calls[0]["batch_size"] == 8
+
+    # Query chỉ khác dạng Unicode (NFD) và khoảng trắng -> dùng lại score
+    query = "  " + unicodedata.normalize("NFD", "Thủ  đô?") + " "
+    second = reranker.rerank_with_scores(query, [doc("aa"), doc("dd"), doc("cccc")], top_k=3)
+    assert [(d.page_content, score) for d, score in second] == [("cccc", 4.0), ("aa", 2.0), ("dd", 2.0)]
+    assert [text for _, text in model.calls[1]["pairs"]] == ["dd"]
+    assert reranker.get_stats()["cache"]["hits"] == 2
+
+
+def test_cache_is_keyed_by_chunk_id(model):
+    reranker = CrossEncoderReranker(cache_size=100)
+    reranker.score("q", [doc("old text", point_id="p1")])
+    # Nội dung đổi -> point id đổi -> không dùng lại score cũ
+    assert reranker.score("q", [doc("new", point_id="p2")]) == [3.0]
+    assert reranker.score("q", [doc("old text", point_id="p1")]) == [8.0]
+    assert len(model.calls) == 2
+
+
+def test_max_depth_scores_head_and_keeps_tail_order(model):
+    reranker = CrossEncoderReranker(max_depth=2, cache_size=0)
+    docs = [doc("a"), doc("bbb"), doc("cc"), doc("dddd")]
+
+    results = reranker.rerank_with_scores("q", docs, top_k=4)
+    assert [text for _, text in model.calls[0]["pairs"]] == ["a", "bbb"]
+    # Phần ngoài max_depth giữ thứ tự hybrid với score thấp nhất đã chấm
+    assert [(d.page_content, score) for d, score in results] == [("bbb", 3.0), ("a", 1.0), ("cc", 1.0), ("dddd", 1.0)]
+    assert reranker.rerank("q", docs, top_k=2) == [docs[1], docs[0]]
+    assert reranker.get_stats()["cache"] is None
+
+
+def test_score_cache_evicts_least_recently_used():
+    cache = ScoreCache(max_entries=2)
+    cache.put_many([(("q", "a"), 1.0), (("q", "b"), 2.0)])
+    assert cache.get_many([("q", "a")]) == [1.0]
+    cache.put_many([(("q", "c"), 3.0)])
+    assert cache.get_many([("q", "a"), ("q", "b"), ("q", "c")]) == [1.0, None, 3.0]
+    assert cache.get_stats()["entries"] == 2
+
+
+def test_predict_error_keeps_hybrid_order(model, monkeypatch):
+    reranker = CrossEncoderReranker(cache_size=10)
+
+    def fail(pairs, **kwargs):
+        raise RuntimeError("model crashed")
+
+    monkeypatch.setattr(model, "predict", fail)
+    docs = [doc("a"), doc("b"), doc("c")]
+    assert reranker.rerank_with_scores("q", docs, top_k=2) == [(docs[0], 0.0), (docs[1], 0.0)]
+    assert reranker.score_cache.get_stats()["entries"] == 0
+
+
+def test_default_config(model):
+    reranker = CrossEncoderReranker()
+    assert reranker.batch_size == reranker_module.RERANK_BATCH_SIZE
+    assert reranker.max_depth == reranker_module.RERANK_MAX_DEPTH
+    assert model.loaded == [reranker_module.RERANK_MAX_LENGTH]
@@ -0,0 +1,133 @@
+import pytest
+from langchain.schema import Document
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from rag.utils import result_cache
+from rag.utils.result_cache import IndexGeneration, RetrievalCache, retrieval_key
+
+
+@pytest.fixture
+def redis():
+    return fakeredis.FakeRedis()
+
+
+@pytest.fixture
+def generation(redis):
+    return IndexGeneration(redis, key="test:generation")
+
+
+def results(*texts):
+    return [(Document(page_content=text, metadata={"_id": text, "page": 1}), 1.0 / (i + 1))
+            for i, text in enumerate(texts)]
+
+
+def test_retrieval_key_normalizes_query():
+    base = retrieval_key("Thủ đô  Việt Nam?", None, 5, 0.5, True)
+    assert retrieval_key("Thủ đô  Việt Nam?", {}, 5, 0.5, True) == base
+    # Filter dict không phụ thuộc thứ tự key
+    assert (retrieval_key("q", {"a": 1, "b": [1, 2]}, 5, 0.5, True)
+            == retrieval_key("q", {"b": [1, 2], "a": 1}, 5, 0.5, True))
+
+
+@pytest.mark.parametrize("changes", [
+    {"query": "other question"},
+    {"metadata_filter": {"file_name": "a.pdf"}},
+    {"k": 10},
+    {"alpha": 0.7},
+    {"use_rerank": False},
+    {"fusion": "rrf"},
+])
+def test_retrieval_key_covers_every_parameter(changes):
+    params = {"query": "question", "metadata_filter": None, "k": 5, "alpha": 0.5, "use_rerank": True}
+    assert retrieval_key(**{**params, **changes}) != retrieval_key(**params)
+
+
+def test_generation_counter(generation):
+    assert generation.current() == 0
+    assert generation.bump("ingest") == 1
+    assert generation.bump() == 2
+    assert generation.current() == 2
+
+
+def test_generation_unavailable_returns_none():
+    class Down:
+        def get(self, key):
+            raise ConnectionError("redis down")
+
+        incr = get
+
+    generation = IndexGeneration(Down())
+    assert generation.current() is None
+    assert generation.bump() is None
+
+
+def test_cache_hit_within_generation(generation):
+    cache = RetrievalCache(generation)
+    current = generation.current()
+    cache.put("k", results("a", "b"), current)
+    cached = cache.get("k", current)
+    assert [doc.page_content for doc, _ in cached] == ["a", "b"]
+    assert cache.get_stats()["hits"] == 1
+
+
+def test_bump_invalidates_entries(generation):
+    cache = RetrievalCache(generation)
+    before = generation.current()
+    cache.put("k", results("a"), before)
+    after = generation.bump("delete")
+    assert cache.get("k", after) is None
+    assert cache.get_stats()["misses"] == 1
+
+
+def test_result_computed_during_bump_is_not_served(generation):
+    """generation đọc trước search: kết quả tính trong lúc index đổi nằm dưới generation cũ"""
+    cache = RetrievalCache(generation)
+    read_before_search = generation.current()
+    generation.bump("ingest")
+    cache.put("k", results("stale"), read_before_search)
+    assert cache.get("k", generation.current()) is None
+
+
+def test_no_generation_bypasses_cache(generation):
+    cache = RetrievalCache(generation)
+    cache.put("k", results("a"), None)
+    assert cache.get("k", None) is None
+    assert cache.get_stats()["entries"] == 0
+
+
+def test_lru_and_ttl(generation, monkeypatch):
+    cache = RetrievalCache(generation, max_entries=2, ttl=10)
+    cache.put("a", results("a"), 0)
+    cache.put("b", results("b"), 0)
+    cache.get("a", 0)
+    cache.put("c", results("c"), 0)
+    assert cache.get("b", 0) is None
+    assert cache.get("a", 0) is not None
+
+    now = result_cache.time.monotonic()
+    monkeypatch.setattr(result_cache.time, "monotonic", lambda: now + 11)
+    assert cache.get("a", 0) is None
+
+
+def test_shared_tier_across_workers(redis, generation):
+    worker_a = RetrievalCache(generation, client=redis, prefix="test:retrieval")
+    worker_b = RetrievalCache(generation, client=redis, prefix="test:retrieval")
+    current = generation.current()
+    worker_a.put("k", results("a", "b"), current)
+
+    cached = worker_b.get("k", current)
+    assert [(doc.page_content, doc.metadata, score) for doc, score in cached] == \
+        [(doc.page_content, doc.metadata, score) for doc, score in results("a", "b")]
+    assert worker_b.get_stats()["redis_hits"] == 1
+    # Bump ở một worker làm entry hết hiệu lực ở mọi worker
+    assert worker_b.get("k", generation.bump("ingest")) is None
+    assert 0 < redis.ttl(f"test:retrieval:{current}:k") <= int(worker_a.ttl)
+
+
+def test_clear_only_drops_local_tier(redis, generation):
+    cache = RetrievalCache(generation, client=redis, prefix="test:retrieval")
+    cache.put("k", results("a"), 0)
+    cache.clear()
+    assert cache.get_stats()["entries"] == 0
+    assert cache.get("k", 0) is not None
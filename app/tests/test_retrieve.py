@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+
+import pytest
+from langchain.schema import Document
+
+handler_module = pytest.importorskip("rag.handler")
+
+
+def doc(text):
+    return Document(page_content=text, metadata={"_id": text, "file_name": "a.pdf", "page": 1})
+
+
+class Hybrid:
+    """Hybrid search giả (backend native: không bootstrap BM25)"""
+    uses_native = True
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.calls = []
+
+    def search_with_info(self, query, k, alpha, metadata_filter=None, fusion=None):
+        self.calls.append({"k": k, "alpha": alpha, "metadata_filter": metadata_filter, "fusion": fusion})
+        results = [(doc(text), 1.0 - i / 10) for i, text in enumerate(self.texts[:k])]
+        return {"results": results, "degraded": False}
+
+
+class Reranker:
+    """Đảo ngược thứ tự hybrid, score là độ dài nội dung"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def rerank_with_scores(self, query, docs, top_k=10):
+        self.calls += 1
+        return [(d, float(len(d.page_content))) for d in reversed(docs)][:top_k]
+
+
+class LLM:
+    def __init__(self):
+        self.prompts = []
+
+    def invoke(self, prompt):
+        self.prompts.append(prompt)
+        return SimpleNamespace(content="answer")
+
+
+@pytest.fixture
+def handler():
+    services = SimpleNamespace(
+        vector_search=None, bm25_search=None, hybrid_search=Hybrid(["a", "bb", "ccc", "dddd", "eeeee", "f"]),
+        reranker=Reranker(), llm=LLM(), retrieval_cache=None, index_generation=None,
+    )
+    handler = handler_module.RAGHandler(services)
+    handler.cascade = None
+    return handler
+
+
+def test_retrieve_returns_documents_and_scores_without_llm(handler):
+    results = handler.retrieve("query", k=2, alpha=0.3, metadata_filter={"type": "pdf"}, fusion="rrf")
+
+    # Lấy k * 2 candidates rồi rerank còn k
+    assert handler.hybrid_search.calls == [{"k": 4, "alpha": 0.3, "metadata_filter": {"type": "pdf"},
+                                            "fusion": "rrf"}]
+    assert [(d.page_content, score) for d, score in results] == [("dddd", 4.0), ("ccc", 3.0)]
+    assert handler.reranker.calls == 1
+    assert handler.retriever.llm.prompts == []
+
+
+def test_retrieve_without_rerank_keeps_hybrid_order(handler):
+    results = handler.retrieve("query", k=2, use_rerank=False)
+    assert [(d.page_content, score) for d, score in results] == [("a", 1.0), ("bb", 0.9)]
+    assert handler.reranker.calls == 0
+
+
+def test_rag_query_hybrid_calls_llm_once_with_chunk_text(handler):
+    result = handler.rag_query_hybrid("query", k=2)
+
+    assert result["answer"] == "answer"
+    assert len(handler.retriever.llm.prompts) == 1
+    prompt = str(handler.retriever.llm.prompts[0])
+    assert "dddd" in prompt and "ccc" in prompt and "eeeee" not in prompt
+    assert len(result["sources"]) == 2
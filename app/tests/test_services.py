@@ -0,0 +1,94 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import services as services_module
+from services import ServiceContainer, get_services
+
+
+class Counter:
+    """Factory đếm số lần được gọi; chậm một chút để các thread cùng chen vào"""
+
+    def __init__(self, delay=0.0):
+        self.calls = 0
+        self.delay = delay
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        return object()
+
+
+def test_component_is_created_lazily_once():
+    container = ServiceContainer()
+    factory = Counter()
+    assert not container.is_initialized("model")
+
+    first = container._get("model", factory)
+    assert container._get("model", factory) is first
+    assert factory.calls == 1
+    assert container.is_initialized("model")
+
+
+def test_concurrent_first_access_creates_one_instance():
+    container = ServiceContainer()
+    factory = Counter(delay=0.05)
+    start = threading.Barrier(8)
+    results = []
+
+    def resolve():
+        start.wait()
+        results.append(container._get("model", factory))
+
+    threads = [threading.Thread(target=resolve) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert factory.calls == 1
+    assert len(results) == 8 and all(result is results[0] for result in results)
+
+
+def test_factory_can_resolve_other_components():
+    container = ServiceContainer()
+    client = container._get("client", Counter())
+    # RLock: factory của index resolve client mà không deadlock
+    index = container._get("index", lambda: SimpleNamespace(client=container._get("client", Counter())))
+    assert index.client is client
+
+
+def test_properties_share_one_instance(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    from rag.utils.cache import CacheManager
+
+    container = ServiceContainer()
+    container._instances["cache_manager"] = CacheManager(client=fakeredis.FakeRedis(), index_dir=None)
+    monkeypatch.setattr(services_module, "RETRIEVAL_CACHE_ENABLED", False)
+
+    bm25 = container.bm25_search
+    assert container.bm25_search is bm25
+    assert bm25.cache_manager is container.cache_manager
+    assert container.retrieval_cache is None
+
+
+def test_get_services_is_process_wide(monkeypatch):
+    monkeypatch.setattr(services_module, "_services", None)
+    assert get_services() is get_services()
+
+
+def test_handler_resolves_shared_components():
+    handler_module = pytest.importorskip("rag.handler")
+
+    hybrid = SimpleNamespace(uses_native=True)
+    shared = SimpleNamespace(
+        vector_search=object(), bm25_search=object(), hybrid_search=hybrid, reranker=object(),
+        retrieval_cache=None, index_generation=object(), llm=object(),
+    )
+    first = handler_module.RAGHandler(shared)
+    second = handler_module.RAGHandler(shared)
+    for name in ("vector_search", "bm25_search", "hybrid_search", "reranker"):
+        assert getattr(first, name) is getattr(shared, name) is getattr(second, name)
+    assert first.retriever.llm is second.retriever.llm is shared.llm
@@ -0,0 +1,46 @@
+import pytest
+
+from rag.search import sparse
+from rag.search.sparse import SparseEncoder, term_index
+
+
+def weights(vector):
+    return dict(zip(vector.indices, vector.values))
+
+
+def test_term_index_is_stable_32_bit():
+    assert term_index("mèo") == term_index("mèo")
+    assert term_index("mèo") != term_index("meo")
+    assert 0 <= term_index("mèo") < 2 ** 32
+
+
+def test_document_weights_follow_bm25_tf_saturation():
+    encoder = SparseEncoder(k1=1.5, b=0.75, avgdl=4)
+    vector = encoder.encode_document("Mèo đen, mèo trắng!")
+    assert vector.indices == sorted(vector.indices)
+    w = weights(vector)
+    # dl == avgdl -> norm = k1; tf=2: 2 * 2.5 / 3.5, tf=1: 2.5 / 2.5
+    assert w[term_index("mèo")] == pytest.approx(2 * 2.5 / 3.5)
+    assert w[term_index("đen")] == pytest.approx(1.0)
+    assert set(w) == {term_index(t) for t in ("mèo", "đen", "trắng")}
+
+
+def test_longer_documents_get_lower_weights():
+    encoder = SparseEncoder(avgdl=4)
+    short = weights(encoder.encode_document("mèo đen"))[term_index("mèo")]
+    long = weights(encoder.encode_document("mèo " + "chó " * 20))[term_index("mèo")]
+    assert short > long
+
+
+def test_query_has_unit_weights_and_shares_tokenizer():
+    encoder = SparseEncoder()
+    query = encoder.encode_query("Mèo  ĐEN mèo?")
+    assert weights(query) == {term_index("mèo"): 2.0, term_index("đen"): 1.0}
+    assert SparseEncoder.is_empty(encoder.encode_query("?!"))
+    assert encoder.encode_documents(["a", "b c"]) == [encoder.encode_document("a"), encoder.encode_document("b c")]
+
+
+def test_hash_collisions_are_summed(monkeypatch):
+    monkeypatch.setattr(sparse, "term_index", lambda term: 7)
+    vector = SparseEncoder().encode_query("một hai ba")
+    assert vector.indices == [7] and vector.values == [3.0]
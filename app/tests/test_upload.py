@@ -0,0 +1,84 @@
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ingestion.jobs import buffer_upload, read_upload
+
+pytestmark = pytest.mark.filterwarnings("ignore:Payload indexes have no effect")
+
+CONTENT = "Chương một: giới thiệu\fBảng | cột".encode("utf-8")
+
+
+class Upload:
+    """FileStorage giả: chỉ cho đọc stream một lần"""
+
+    def __init__(self, data, filename):
+        self.stream = io.BytesIO(data)
+        self.filename = filename
+        self.reads = 0
+
+    def read(self):
+        self.reads += 1
+        return self.stream.read()
+
+    def seek(self, offset):
+        self.stream.seek(offset)
+
+
+def test_buffer_upload_reads_once_and_keeps_filename():
+    upload = Upload(CONTENT, "a.pdf")
+    buffer = buffer_upload(upload)
+    assert upload.reads == 1
+    assert buffer.filename == "a.pdf"
+    assert read_upload(buffer) == CONTENT
+    assert read_upload(buffer) == CONTENT
+
+
+def test_read_upload_rewinds_file_storage():
+    upload = Upload(CONTENT, "a.pdf")
+    upload.read()
+    assert read_upload(upload) == CONTENT
+
+
+@pytest.fixture
+def manager(vector_manager, monkeypatch):
+    vector_manager._upload_executor = ThreadPoolExecutor(max_workers=1)
+    # Page của "PDF" giả ngăn cách bởi form feed, bỏ qua pypdf
+    vector_manager.extracted = threading.Event()
+
+    def extract(content):
+        vector_manager.extracted.set()
+        return content.decode("utf-8").split("\f")
+
+    monkeypatch.setattr(vector_manager, "_extract_pages", extract, raising=False)
+
+    def download(file_name):
+        raise AssertionError("ingestion must not download the upload back from storage")
+
+    monkeypatch.setattr(vector_manager.storage, "get_file", download, raising=False)
+    yield vector_manager
+    vector_manager._upload_executor.shutdown()
+
+
+def test_process_pdf_parses_from_memory_while_uploading(manager):
+    upload_file = manager.storage.upload_file
+
+    def slow_upload(data, file_name):
+        # Upload chỉ xong sau khi parse đã chạy: nếu hai bước tuần tự, upload fail sau timeout
+        return manager.extracted.wait(timeout=2) and upload_file(data, file_name)
+
+    manager.storage.upload_file = slow_upload
+    result = manager.process_pdf(Upload(CONTENT, "a.pdf"))
+
+    assert result["chunks"] == 2 and result["added"] == 2
+    assert manager.storage.files["a.pdf"] == CONTENT
+    assert manager.client.count(manager.collection_name).count == 2
+
+
+def test_failed_upload_indexes_nothing(manager):
+    manager.storage.upload_file = lambda data, file_name: False
+    with pytest.raises(Exception, match="Failed to upload"):
+        manager.process_pdf(Upload(CONTENT, "a.pdf"))
+    assert manager.client.count(manager.collection_name).count == 0
@@ -2,34 +2,68 @@ from langchain_qdrant import QdrantVectorStore
 from langchain_community.document_loaders import PDFPlumberLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from pypdf import PdfReader
-from typing import List
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams
+from typing import List, Optional
+from qdrant_client.models import (
+    FieldCondition, Filter, FilterSelector, MatchValue, Modifier, PayloadSchemaType, PointIdsList,
+    PointVectors, SetPayload, SetPayloadOperation, SparseVectorParams,
+)
 import mlflow
 from langchain.schema import Document
 
-from models import get_embeddings, get_text_splitter
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from collection_profiles import CollectionProfile
 from config import (
-    QDRANT_HOST, 
-    QDRANT_PORT,
-    QDRANT_COLLECTION_NAME
+    QDRANT_COLLECTION_NAME, QDRANT_PAYLOAD_INDEXES, QDRANT_APPLY_PROFILE_ON_START,
+    HYBRID_BACKEND, SPARSE_VECTOR_NAME, QDRANT_SPARSE_VECTORS,
+    PDF_EXTRACT_WORKERS, INGEST_MAX_WORKERS,
 )
+from ingestion.fingerprint import chunk_fingerprint, file_fingerprint, point_id
+from ingestion.jobs import read_upload
+from ingestion.pdf import extract_pages
+from ingestion.pipeline import EmbedUpsertPipeline
+from rag.search.filters import to_qdrant_filter
+from rag.search.sparse import SparseEncoder
 import os
-from rag.search.bm25 import BM25Search
-from storage.minio_client import MinioClient
+from services import ServiceContainer, get_services
 import io
 import tempfile
+import threading
+
+# Metadata vị trí của chunk trong file: đổi khi nội dung phía trước chunk thay đổi
+POSITION_FIELDS = ("page", "chunk")
+
+def _notify(progress, msg: str, **data):
+    """Gửi progress event cho ingestion job (nếu có)"""
+    if progress:
+        progress({"event": "progress", "msg": msg, **data})
 
 class VectorStoreManager:
-    def __init__(self):
-        self.embedding = get_embeddings()
-        self.text_splitter = get_text_splitter()
-        self.client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
+    def __init__(self, services: Optional[ServiceContainer] = None):
+        services = services or get_services()
+        self.embedding = services.embeddings
+        self.text_splitter = services.text_splitter
+        self.client = services.qdrant_client
         self.collection_name = QDRANT_COLLECTION_NAME
-        self.storage = MinioClient()
+        self.storage = services.storage
+        self.pdf_executor = services.pdf_executor
+        self.profile = CollectionProfile.from_config()
+        self._upload_executor = ThreadPoolExecutor(max_workers=INGEST_MAX_WORKERS,
+                                                   thread_name_prefix="minio-upload")
+        self.sparse_encoder = SparseEncoder()
+        self.sparse_enabled = False
+        self.pipeline = EmbedUpsertPipeline(self.embedding, self.client, self.collection_name)
         self._ensure_collection_exists()
-        self.bm25_search = BM25Search() 
+        # BM25 index dùng chung với RAGHandler để hai bên không bị lệch nhau
+        self.bm25_search = services.bm25_search
+        # Tăng sau mỗi thay đổi nội dung để retrieval cache của mọi worker hết hiệu lực
+        self.index_generation = services.index_generation
         self.documents = []
+        self._vector_store = None
+        # Ingest / delete cùng một file_name chạy tuần tự (sync xóa points của phiên bản khác)
+        self._file_locks = {}
+        self._file_locks_guard = threading.Lock()
     
     def _ensure_collection_exists(self):
         """Tạo collection nếu chưa tồn tại"""
@@ -45,27 +79,103 @@ class VectorStoreManager:
                 
                 self.client.create_collection(
                     collection_name=self.collection_name,
-                    vectors_config=VectorParams(
-                        size=vector_size,
-                        distance=Distance.COSINE
-                    ),
+                    # Sparse vector (idf tính phía server) cho hybrid backend "qdrant"
+                    sparse_vectors_config={SPARSE_VECTOR_NAME: SparseVectorParams(modifier=Modifier.IDF)}
+                    if QDRANT_SPARSE_VECTORS else None,
+                    **self.profile.create_params(vector_size),
                 )
-                print(f"Collection created with vector size: {vector_size}")
+                print(f"Collection created with vector size: {vector_size} (profile: {self.profile.name})")
             else:
                 print(f"Collection {self.collection_name} already exists")
+                if QDRANT_APPLY_PROFILE_ON_START:
+                    self.apply_profile()
+            self._ensure_payload_indexes()
+
+            sparse_vectors = self.client.get_collection(self.collection_name).config.params.sparse_vectors or {}
+            self.sparse_enabled = SPARSE_VECTOR_NAME in sparse_vectors
+            # Ingestion ghi sparse vector cạnh dense vector nếu được bật và collection hỗ trợ
+            self.pipeline.sparse_encoder = (self.sparse_encoder
+                                            if QDRANT_SPARSE_VECTORS and self.sparse_enabled else None)
+            if HYBRID_BACKEND == "qdrant" and not self.sparse_enabled:
+                print(f"! Collection {self.collection_name} has no '{SPARSE_VECTOR_NAME}' sparse vector - "
+                      "recreate it to use the qdrant hybrid backend")
                 
         except Exception as e:
             print(f"Error ensuring collection exists: {e}")
             raise e
+
+    @property
+    def native_hybrid(self) -> bool:
+        """Lexical search chạy trong Qdrant (sparse vector) thay vì BM25 in-process"""
+        return HYBRID_BACKEND == "qdrant" and self.sparse_enabled
+
+    def backfill_sparse_vectors(self, batch_size: int = 256) -> int:
+        """
+        Ghi sparse vector cho các points chưa có (ví dụ được ingest trước khi bật sparse),
+        chỉ đọc payload và update_vectors - không embed lại.
+        """
+        if not self.sparse_enabled:
+            raise RuntimeError(f"Collection has no '{SPARSE_VECTOR_NAME}' sparse vector")
+        updated, offset = 0, None
+        while True:
+            points, offset = self.client.scroll(self.collection_name, limit=batch_size, offset=offset,
+                                                with_payload=["page_content"], with_vectors=False)
+            if points:
+                self.client.update_vectors(self.collection_name, points=[
+                    PointVectors(id=point.id, vector={
+                        SPARSE_VECTOR_NAME: self.sparse_encoder.encode_document(
+                            (point.payload or {}).get("page_content", ""))
+                    })
+                    for point in points
+                ])
+                updated += len(points)
+                print(f"Sparse vector backfill progress: {updated}")
+            if offset is None:
+                self.index_generation.bump("backfill_sparse")
+                return updated
+
+    @property
+    def search_params(self):
+        """Query-time search params (hnsw_ef, quantization rescoring) của profile hiện tại"""
+        return self.profile.search_params()
+
+    def apply_profile(self, profile: Optional[CollectionProfile] = None) -> bool:
+        """
+        Migrate collection đã có sang profile (quantization, HNSW, on_disk).
+        Qdrant áp dụng thay đổi online, optimizer build lại segments trong background.
+        """
+        profile = profile or self.profile
+        try:
+            self.client.update_collection(self.collection_name, **profile.update_params())
+            self.profile = profile
+            print(f"✓ Applied collection profile '{profile.name}' to {self.collection_name}")
+            return True
+        except Exception as e:
+            print(f"! Error applying collection profile: {e}")
+            raise e
+
+    def _ensure_payload_indexes(self):
+        """Tạo payload index cho các metadata field hay được filter (idempotent)"""
+        existing = self.client.get_collection(self.collection_name).payload_schema or {}
+        for field, schema in QDRANT_PAYLOAD_INDEXES.items():
+            key = f"metadata.{field}"
+            if key in existing:
+                continue
+            self.client.create_payload_index(self.collection_name, field_name=key,
+                                             field_schema=PayloadSchemaType(schema))
+            print(f"Created {schema} payload index on {key}")
     
     def load_vector_store(self):
         """Load existing vector store"""
         # print("Loading Qdrant vector store...")
+        if self._vector_store is not None:
+            return self._vector_store
         try:
-            vector_store = QdrantVectorStore.from_existing_collection(
+            # Dùng lại Qdrant client dùng chung thay vì mở kết nối mới qua url
+            vector_store = QdrantVectorStore(
+                client=self.client,
                 collection_name=self.collection_name,
                 embedding=self.embedding,
-                url=f"http://{QDRANT_HOST}:{QDRANT_PORT}",
             )
             
             # Kiểm tra số lượng documents
@@ -76,6 +186,7 @@ class VectorStoreManager:
             if doc_count == 0:
                 print("Warning: Vector store is empty!")
                 
+            self._vector_store = vector_store
             return vector_store
             
         except Exception as e:
@@ -148,92 +259,103 @@ class VectorStoreManager:
     #         raise e
 
 
-    def process_pdf(self, file):
+    def process_pdf(self, file, progress=None):
         try:
             filename = file.filename
-            if not self.storage.upload_file(file, filename):
-                raise Exception("Failed to upload file to storage")
-
-            pdf_content = self.storage.get_file(filename)
-            if not pdf_content:
-                raise Exception("Failed to retrieve file from storage")
-
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-                temp_file.write(pdf_content)
-                temp_path = temp_file.name
-
-            try:
-                reader = PdfReader(temp_path)
-                docs = []
-                for i, page in enumerate(reader.pages):
-                    text = page.extract_text()
-                    if text and text.strip():
-                        docs.append({
-                            "page_content": text,
-                            "metadata": {
-                                "file_name": filename,
-                                "page": i + 1,
-                                "type": "pdf"
-                            }
-                        })
-
-                print(f"Initial docs len={len(docs)}")
-                if len(docs) == 0:
-                    raise ValueError("No text extracted from PDF")
-
-                text_splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=1200,
-                    chunk_overlap=150,
-                    separators=["\n\n", "\n", " ", ""]
-                )
+            # Đọc upload một lần: parse từ memory, upload MinIO chạy song song
+            pdf_content = read_upload(file)
+            file_hash = file_fingerprint(pdf_content)
+            if self._is_ingested(filename, file_hash):
+                print(f"✓ {filename} unchanged, skipping ingestion")
+                _notify(progress, f"{filename} already ingested (unchanged)", stage="skip")
+                return {"docs": 0, "chunks": 0, "added": 0, "unchanged": 0, "removed": 0, "skipped": True}
+            upload = self._start_upload(pdf_content, filename)
+
+            # Extract text song song theo khoảng page (process pool)
+            pages = self._extract_pages(pdf_content)
+            docs = []
+            for i, text in enumerate(pages):
+                if text and text.strip():
+                    docs.append({
+                        "page_content": text,
+                        "metadata": {
+                            "file_name": filename,
+                            "page": i + 1,
+                            "type": "pdf"
+                        }
+                    })
+
+            print(f"Initial docs len={len(docs)}")
+            if len(docs) == 0:
+                raise ValueError("No text extracted from PDF")
+            _notify(progress, f"Extracted text from {len(docs)} pages", stage="extract", pages=len(docs))
+
+            text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=1200,
+                chunk_overlap=150,
+                separators=["\n\n", "\n", " ", ""]
+            )
 
-                chunks = []
-                for doc in docs:
-                    content = doc["page_content"]
-
-                    # Heuristic: bảng
-                    if content.count("|") > 5 or "\t" in content:
-                        for line in content.splitlines():
-                            if line.strip():
-                                chunks.append(
-                                    Document(
-                                        page_content=line.strip(),
-                                        metadata={**doc["metadata"]}
-                                    )
+            chunks = []
+            for doc in docs:
+                content = doc["page_content"]
+
+                # Heuristic: bảng
+                if content.count("|") > 5 or "\t" in content:
+                    for line in content.splitlines():
+                        if line.strip():
+                            chunks.append(
+                                Document(
+                                    page_content=line.strip(),
+                                    metadata={**doc["metadata"]}
                                 )
-                    else:
-                        split_docs = text_splitter.create_documents(
-                            [content], metadatas=[doc["metadata"]]
-                        )
-                        chunks.extend(split_docs)
-
-                print(f"Chunks len={len(chunks)}")
-                if len(chunks) == 0:
-                    raise ValueError("No chunks created from documents")
+                            )
+                else:
+                    split_docs = text_splitter.create_documents(
+                        [content], metadatas=[doc["metadata"]]
+                    )
+                    chunks.extend(split_docs)
 
-                for i, chunk in enumerate(chunks):
-                    chunk.metadata.update({"chunk": i + 1})
+            print(f"Chunks len={len(chunks)}")
+            if len(chunks) == 0:
+                raise ValueError("No chunks created from documents")
 
-                vector_store = self.load_vector_store()
-                vector_store.add_documents(chunks)
-                print(f"Added {len(chunks)} chunks to vector store")
+            for i, chunk in enumerate(chunks):
+                chunk.metadata.update({"chunk": i + 1})
+            _notify(progress, f"Created {len(chunks)} chunks", stage="chunk", chunks=len(chunks))
+            self._wait_upload(upload, filename, progress)
 
-                return len(docs), len(chunks)
+            # Chỉ embed/upsert các chunk mới, xóa chunk không còn trong file
+            sync = self._sync_file(filename, file_hash, chunks, progress=progress)
+            _notify(progress, f"Added {sync['added']} chunks to vector store", stage="index", **sync)
 
-            finally:
-                os.unlink(temp_path)
-                print("Temporary file cleaned up")
+            return {"docs": len(docs), "chunks": len(chunks), **sync, "skipped": False}
 
         except Exception as e:
             print(f"Error processing PDF: {e}")
             raise e
         
+    def _start_upload(self, data: bytes, filename: str) -> Future:
+        """Upload bytes gốc lên MinIO trong background, song song với parse/chunk"""
+        return self._upload_executor.submit(self.storage.upload_file, io.BytesIO(data), filename)
+
+    def _wait_upload(self, upload: Future, filename: str, progress=None):
+        """Chờ upload xong trước khi index, để không có points mà thiếu file gốc"""
+        if not upload.result():
+            raise Exception("Failed to upload file to storage")
+        _notify(progress, f"Uploaded {filename} to storage", stage="upload")
+
+    def _extract_pages(self, pdf_content: bytes) -> List[str]:
+        """Text của từng page theo thứ tự, extract song song qua process pool dùng chung"""
+        return extract_pages(pdf_content, executor=self.pdf_executor, workers=PDF_EXTRACT_WORKERS)
+
     def delete_collection(self):
         """Xóa collection (để reset dữ liệu)"""
         try:
             self.client.delete_collection(self.collection_name)
             print(f"Collection {self.collection_name} deleted")
             self._ensure_collection_exists()
+            self.index_generation.bump("delete_collection")
         except Exception as e:
             print(f"Error deleting collection: {e}")
     
@@ -245,93 +367,257 @@ class VectorStoreManager:
                 "name": self.collection_name,
                 "points_count": collection_info.points_count,
                 "vectors_count": collection_info.vectors_count,
-                "status": collection_info.status
+                "status": collection_info.status,
+                "profile": self.profile.name,
             }
         except Exception as e:
             print(f"Error getting collection info: {e}")
             return None
     
-    def add_documents(self, documents):
-        """Thêm documents vào vector store và update BM25"""
+    def add_documents(self, documents, ids=None, progress=None):
+        """
+        Thêm documents vào vector store (embed + upsert theo batch) và update BM25.
+        Point id deterministic theo (file_name, nội dung, lần xuất hiện): chunk đã có
+        trong Qdrant được bỏ qua. Trả về các documents thực sự được thêm.
+        """
         try:
-            vector_store = self.load_vector_store()
-            vector_store.add_documents(documents)
+            if ids is None:
+                documents, ids = self._assign_ids(documents)
+            existing = self._existing_ids(ids)
+            new = [(doc, doc_id) for doc, doc_id in zip(documents, ids) if doc_id not in existing]
+            if existing:
+                print(f"Skipping {len(documents) - len(new)} chunks already in vector store")
+            documents = [doc for doc, _ in new]
+            if not documents:
+                return []
+
+            result = self.pipeline.run(documents, ids=[doc_id for _, doc_id in new], progress=progress)
+            # Gắn point id giống kết quả search của Qdrant để BM25 và vector khớp nhau
+            for doc, doc_id in zip(documents, result["ids"]):
+                self._tag_point(doc, doc_id)
             print(f"Added {len(documents)} documents to vector store")
 
             #  Update BM25 index bằng instance bm25_search của chính VectorStoreManager
-            self.bm25_search.add_documents(documents)
-            print("BM25 index updated incrementally")
+            if not self.native_hybrid:
+                self.bm25_search.add_documents(documents)
+                print("BM25 index updated incrementally")
+            self.index_generation.bump("add_documents")
             return documents
         except Exception as e:
             print(f"Error adding documents: {e}")
             raise e
 
-    def process_idiom(self, file, source_name="idioms"):
+    def _assign_ids(self, documents):
+        """
+        Tính chunk_hash + point id cho từng document. Text lặp lại trong cùng file
+        được đánh số lần xuất hiện theo thứ tự, nên mỗi chunk vẫn là một point riêng.
+        """
+        occurrences = Counter()
+        ids = []
+        for doc in documents:
+            chunk_hash = chunk_fingerprint(doc.page_content)
+            file_name = doc.metadata.get("file_name", "")
+            ids.append(point_id(file_name, chunk_hash, occurrences[(file_name, chunk_hash)]))
+            occurrences[(file_name, chunk_hash)] += 1
+            doc.metadata["chunk_hash"] = chunk_hash
+        return documents, ids
+
+    def _tag_point(self, doc, doc_id: str):
+        doc.metadata = {**doc.metadata, "_id": doc_id, "_collection_name": self.collection_name}
+
+    def _file_lock(self, file_name: str) -> threading.Lock:
+        """Lock riêng cho từng file_name (trong process), dùng chung giữa các ingestion worker"""
+        with self._file_locks_guard:
+            return self._file_locks.setdefault(file_name, threading.Lock())
+
+    def _existing_ids(self, ids: List[str], batch_size: int = 1000) -> set:
+        existing = set()
+        for start in range(0, len(ids), batch_size):
+            points = self.client.retrieve(self.collection_name, ids=ids[start:start + batch_size],
+                                          with_payload=False, with_vectors=False)
+            existing.update(str(point.id) for point in points)
+        return existing
+
+    def _file_filter(self, file_name: str) -> Filter:
+        return to_qdrant_filter({"file_name": file_name})
+
+    def _file_point_ids(self, file_name: str, batch_size: int = 1000) -> List[str]:
+        """Toàn bộ point ids của một file (scroll theo filter, không đọc payload)"""
+        ids, offset = [], None
+        while True:
+            points, offset = self.client.scroll(self.collection_name, scroll_filter=self._file_filter(file_name),
+                                                limit=batch_size, offset=offset,
+                                                with_payload=False, with_vectors=False)
+            ids.extend(str(point.id) for point in points)
+            if offset is None:
+                return ids
+
+    def _is_ingested(self, file_name: str, file_hash: str) -> bool:
+        """File đã được ingest với đúng nội dung này (mọi point của file có cùng file_hash)"""
+        file_filter = self._file_filter(file_name)
+        if not self.client.count(self.collection_name, count_filter=file_filter, exact=True).count:
+            return False
+        other_versions = Filter(
+            must=file_filter.must,
+            must_not=[FieldCondition(key="metadata.file_hash", match=MatchValue(value=file_hash))],
+        )
+        return self.client.count(self.collection_name, count_filter=other_versions, exact=True).count == 0
+
+    def _sync_file(self, file_name: str, file_hash: str, chunks, progress=None):
+        """
+        Đồng bộ chunks của một file với Qdrant: upsert chunk mới, giữ chunk không đổi
+        (cập nhật file_hash và vị trí page / chunk), xóa chunk không còn trong phiên bản mới.
+        Chạy dưới lock của file_name để hai lần ingest cùng file không xóa points của nhau.
+        """
+        with self._file_lock(file_name):
+            for chunk in chunks:
+                chunk.metadata["file_hash"] = file_hash
+            chunks, ids = self._assign_ids(chunks)
+            added = self.add_documents(chunks, ids=ids, progress=progress)
+            added_ids = {doc.metadata["_id"] for doc in added}
+
+            unchanged = [(doc, doc_id) for doc, doc_id in zip(chunks, ids) if doc_id not in added_ids]
+            moved = self._refresh_unchanged(file_name, file_hash, unchanged) if unchanged else 0
+
+            keep = set(ids)
+            stale = [doc_id for doc_id in self._file_point_ids(file_name) if doc_id not in keep]
+            if stale:
+                self.client.delete(self.collection_name, points_selector=PointIdsList(points=stale))
+                if not self.native_hybrid:
+                    self.bm25_search.delete_documents({"file_name": file_name, "_id": set(stale)})
+                print(f"Removed {len(stale)} stale chunks of {file_name} from vector store")
+            if stale or moved:
+                self.index_generation.bump("sync_file")
+            return {"added": len(added), "unchanged": len(unchanged), "removed": len(stale)}
+
+    def _refresh_unchanged(self, file_name: str, file_hash: str, unchanged, batch_size: int = 256) -> int:
+        """
+        Chunk không đổi nội dung vẫn có thể đổi page / chunk khi phần trước nó thay đổi:
+        ghi lại file_hash + vị trí trong Qdrant, và index lại trong BM25 các chunk đã dịch chuyển.
+        Trả về số chunk đã dịch chuyển.
+        """
+        ids = [doc_id for _, doc_id in unchanged]
+        current = {}
+        for start in range(0, len(ids), batch_size):
+            points = self.client.retrieve(self.collection_name, ids=ids[start:start + batch_size],
+                                          with_payload=["metadata"], with_vectors=False)
+            for point in points:
+                metadata = (point.payload or {}).get("metadata") or {}
+                current[str(point.id)] = {key: metadata.get(key) for key in POSITION_FIELDS}
+
+        operations, moved = [], []
+        for doc, doc_id in unchanged:
+            position = {key: doc.metadata.get(key) for key in POSITION_FIELDS}
+            operations.append(SetPayloadOperation(set_payload=SetPayload(
+                payload={"file_hash": file_hash, **{k: v for k, v in position.items() if v is not None}},
+                points=[doc_id], key="metadata")))
+            if current.get(doc_id) != position:
+                moved.append((doc, doc_id))
+        for start in range(0, len(operations), batch_size):
+            self.client.batch_update_points(self.collection_name,
+                                            update_operations=operations[start:start + batch_size])
+
+        if moved and not self.native_hybrid:
+            # BM25 segment bất biến: tombstone bản cũ rồi thêm lại với metadata mới
+            for doc, doc_id in moved:
+                self._tag_point(doc, doc_id)
+            self.bm25_search.delete_documents({"file_name": file_name, "_id": {doc_id for _, doc_id in moved}})
+            self.bm25_search.add_documents([doc for doc, _ in moved])
+        if moved:
+            print(f"Updated page / chunk of {len(moved)} moved chunks of {file_name}")
+        return len(moved)
+
+    def delete_file(self, file_name: str) -> dict:
+        """
+        Xóa một document theo file_name khỏi Qdrant (filter), BM25 (tombstone,
+        compact sau) và MinIO. Trả về số points / documents đã xóa ở từng nơi.
+        Lỗi giữa chừng được raise lại; gọi lại delete_file là an toàn (idempotent).
+        """
+        try:
+            file_filter = self._file_filter(file_name)
+            with self._file_lock(file_name):
+                points = self.client.count(self.collection_name, count_filter=file_filter, exact=True).count
+                try:
+                    if points:
+                        self.client.delete(self.collection_name, points_selector=FilterSelector(filter=file_filter))
+                    lexical = 0 if self.native_hybrid else self.bm25_search.delete_documents({"file_name": file_name})
+                finally:
+                    # Index có thể đã đổi kể cả khi bước sau lỗi -> luôn invalidate retrieval cache
+                    self.index_generation.bump("delete_file")
+            stored = self.storage.delete_file(file_name)
+            print(f"Deleted {file_name}: {points} points, {lexical} BM25 documents, storage={stored}")
+            return {"file_name": file_name, "points_deleted": points,
+                    "bm25_deleted": lexical, "storage_deleted": stored}
+        except Exception as e:
+            print(f"Error deleting {file_name}: {e}")
+            raise e
+
+    def process_idiom(self, file, source_name="idioms", progress=None):
         """Process idiom file (PDF) with PyPDF2 and add to Qdrant vector store"""
         try:
             filename = file.filename
-            if not self.storage.upload_file(file, filename):
-                raise Exception("Failed to upload file to storage")
-
-            pdf_content = self.storage.get_file(filename)
-            if not pdf_content:
-                raise Exception("Failed to retrieve file from storage")
+            pdf_content = read_upload(file)
+            file_hash = file_fingerprint(pdf_content)
+            if self._is_ingested(filename, file_hash):
+                print(f"✓ {filename} unchanged, skipping ingestion")
+                _notify(progress, f"{filename} already ingested (unchanged)", stage="skip")
+                return {"docs": 0, "chunks": 0, "added": 0, "unchanged": 0, "removed": 0, "skipped": True,
+                        "total_points": self.client.count(self.collection_name).count}
+            upload = self._start_upload(pdf_content, filename)
+
+            #  Extract text bằng pypdf (song song theo khoảng page)
+            pages = self._extract_pages(pdf_content)
+            processed_chunks: List[Document] = []
+            total_pages = len(pages)
+            _notify(progress, f"Start processing {total_pages} pages", stage="extract", pages=total_pages)
+
+            for page_num, text in enumerate(pages, start=1):
+                if not text:
+                    continue
+
+                for line in text.split("\n"):
+                    line = line.strip()
+                    if not line or " - " not in line:
+                        continue
 
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-                temp_file.write(pdf_content)
-                temp_path = temp_file.name
+                    idiom, rest = line.split(" - ", 1)
+                    idiom_doc = Document(
+                        page_content=f"{idiom.strip()} - {rest.strip()}",
+                        metadata={
+                            "file_name": filename,
+                            "page": page_num,
+                            "idiom": idiom.strip(),
+                            "meaning": rest.strip(),
+                            "type": "idiom",
+                            "source": source_name,
+                        }
+                    )
+                    processed_chunks.append(idiom_doc)
+
+            if not processed_chunks:
+                raise ValueError("No idioms extracted from PDF")
+            _notify(progress, f"Extracted {len(processed_chunks)} idioms", stage="chunk",
+                    chunks=len(processed_chunks))
+            self._wait_upload(upload, filename, progress)
+
+            #  Add vào vector store (BM25 sẽ tự cập nhật), bỏ qua idiom đã có
+            sync = self._sync_file(filename, file_hash, processed_chunks, progress=progress)
+            _notify(progress, f"Added {sync['added']} idioms to vector store", stage="index", **sync)
+
+            #  Lấy số lượng points cuối cùng
+            collection_info = self.client.get_collection(self.collection_name)
+            final_count = collection_info.points_count
 
-            try:
-                #  Load PDF bằng PyPDF2
-                reader = PdfReader(temp_path)
-                processed_chunks: List[Document] = []
+            print(f" Added {sync['added']} idioms from {filename}")
+            print(f"Total points in collection: {final_count}")
 
-                for page_num, page in enumerate(reader.pages, start=1):
-                    text = page.extract_text()
-                    if not text:
-                        continue
-
-                    for line in text.split("\n"):
-                        line = line.strip()
-                        if not line or " - " not in line:
-                            continue
-
-                        idiom, rest = line.split(" - ", 1)
-                        idiom_doc = Document(
-                            page_content=f"{idiom.strip()} - {rest.strip()}",
-                            metadata={
-                                "file_name": filename,
-                                "page": page_num,
-                                "idiom": idiom.strip(),
-                                "meaning": rest.strip(),
-                                "type": "idiom",
-                                "source": source_name,
-                            }
-                        )
-                        processed_chunks.append(idiom_doc)
-
-                if not processed_chunks:
-                    raise ValueError("No idioms extracted from PDF")
-
-                #  Add vào vector store (BM25 sẽ tự cập nhật)
-                self.add_documents(processed_chunks)
-
-                #  Lấy số lượng points cuối cùng
-                collection_info = self.client.get_collection(self.collection_name)
-                final_count = collection_info.points_count
-
-                print(f" Added {len(processed_chunks)} idioms from {filename}")
-                print(f"Total points in collection: {final_count}")
-
-                return {
-                    "docs": len(reader.pages),
-                    "chunks": len(processed_chunks),
-                    "total_points": final_count,
-                }
-
-            finally:
-                os.unlink(temp_path)
-                print("Temporary file cleaned up")
+            return {
+                "docs": total_pages,
+                "chunks": len(processed_chunks),
+                "total_points": final_count,
+                **sync,
+                "skipped": False,
+            }
 
         except Exception as e:
             print(f"❌ Error processing idioms: {e}")